@@ -1,25 +1,49 @@
 import os
 import uuid
 import json
+import copy
 import logging
 import struct
+import hashlib
+import base64
+import bisect
+import heapq
+import itertools
+import random
+from collections import OrderedDict
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 from pathlib import Path
 import threading
 import time
 import re
+import hmac
+import mimetypes
+import shutil
+import sqlite3
+import weakref
+from contextlib import contextmanager
+from urllib.parse import quote
 
 import requests
-from flask import Flask, request, jsonify, g, render_template, redirect, url_for
+from flask import Flask, Request, request, jsonify, g, render_template, redirect, url_for, current_app, has_request_context, send_file
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 from PIL import Image, UnidentifiedImageError
+import io
 
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
 from firebase_admin import auth as fb_auth  # Güvenli Bearer token doğrulama
+from google.auth import jwt as google_jwt  # firebase-admin bağımlılığı; yerel RS256 doğrulama
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1 import transforms as firestore_transforms
+from google.cloud.firestore_v1.watch import ChangeType
 
 import numpy as np
 from flask_cors import CORS
@@ -216,9 +240,102 @@ class Config:
     # Commission
     DEFAULT_COMMISSION_RATE = 0.15  # %15
 
+    # Toplu fiyat tablosu (malzeme x dolgu x destek x marj) hücre sınırı
+    QUOTE_GRID_MAX_CELLS = int(os.getenv("QUOTE_GRID_MAX_CELLS", "5000"))
+
+    # Fiyat teklifi cache'i (analiz parmak izi, malzeme sürümü, parametreler) ve girdileri
+    QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", "2048"))
+    QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "300"))
+    PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "512"))
+    PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "600"))
+
+    # Doğrulanmış ID token (exp'e kadar) ve kullanıcı profili cache'i
+    TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2048"))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+    # ID token'ları Google imza sertifikalarıyla yerelde doğrula ("local") ya da firebase-admin'e bırak ("firebase_admin")
+    TOKEN_VERIFIER = os.getenv("TOKEN_VERIFIER", "local")
+    FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID", BUCKET_NAME.split(".", 1)[0])
+    FIREBASE_CERTS_URL = os.getenv(
+        "FIREBASE_CERTS_URL",
+        "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+    )
+    FIREBASE_CERTS_SNAPSHOT = os.getenv("FIREBASE_CERTS_SNAPSHOT", "firebase_certs.json")
+    FIREBASE_CERTS_REFRESH_AHEAD = float(os.getenv("FIREBASE_CERTS_REFRESH_AHEAD", "600"))  # bitişten bu kadar önce yenile
+
+    # Bellek içi malzeme kataloğu: on_snapshot dinleyicisi, kurulamazsa bu aralıkla yoklama (saniye)
+    MATERIALS_POLL_INTERVAL = float(os.getenv("MATERIALS_POLL_INTERVAL", "300"))
+
+    # Depolama backend'i: "firestore" (Firebase) ya da "local" (SQLite belge deposu + dosya sistemi; yük testi/profil)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+    LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "local_data/firestore.sqlite3")  # ":memory:" desteklenir
+    LOCAL_BLOB_DIR = os.getenv("LOCAL_BLOB_DIR", "local_data/blobs")
+
+    # Bekleyen sipariş havuzu indeksi: on_snapshot dinleyicisi, kurulamazsa bu aralıkla yoklama (saniye)
+    POOL_INDEX_ENABLED = os.getenv("POOL_INDEX_ENABLED", "True").lower() == "true"
+    POOL_INDEX_POLL_INTERVAL = float(os.getenv("POOL_INDEX_POLL_INTERVAL", "30"))
+
+    # Yeni sipariş bildirimleri: üretici yetenek indeksi ile istek dışında (arka plan thread'leri) eşleştirilir
+    PRODUCER_INDEX_ENABLED = os.getenv("PRODUCER_INDEX_ENABLED", "True").lower() == "true"
+    PRODUCER_INDEX_POLL_INTERVAL = float(os.getenv("PRODUCER_INDEX_POLL_INTERVAL", "60"))
+    ORDER_FANOUT_WORKERS = int(os.getenv("ORDER_FANOUT_WORKERS", "2"))
+    ORDER_FANOUT_MAX_QUEUE = int(os.getenv("ORDER_FANOUT_MAX_QUEUE", "200"))  # dolunca bildirimler istek içinde gönderilir
+
+    # Liste uçları (mesajlar, havuz, itirazlar) imleç tabanlı sayfalama
+    PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+    PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+    POOL_SCAN_MAX = int(os.getenv("POOL_SCAN_MAX", "1000"))  # havuz sayfası başına taranacak en fazla bekleyen sipariş
+
+    # Admin istatistikleri: sipariş yazımlarıyla aynı transaction'da güncellenen dağıtık sayaçlar
+    STATS_SHARDS = int(os.getenv("STATS_SHARDS", "10"))
+
+    # Admin analizleri: periyodik yenilenen sütunsal (NumPy) sipariş anlık görüntüsü; yenileme ilk istekte başlar
+    ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "True").lower() == "true"
+    ANALYTICS_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "300"))
+    ANALYTICS_TOP_MAX = int(os.getenv("ANALYTICS_TOP_MAX", "1000"))
+
     # Storage signed URL TTL (seconds)
     STORAGE_SIGNED_URL_TTL = int(os.getenv("STORAGE_SIGNED_URL_TTL", "3600"))
 
+    # Upload / STL analiz cache
+    UPLOAD_CHUNK_BYTES = 1024 * 1024  # 1MB
+    STL_CACHE_SIZE = int(os.getenv("STL_CACHE_SIZE", "256"))
+    STL_CACHE_COLLECTION = os.getenv("STL_CACHE_COLLECTION", "stl_analysis_cache")
+
+    # STL analiz process pool'u
+    STL_ANALYSIS_WORKERS = int(os.getenv("STL_ANALYSIS_WORKERS", "2"))
+    STL_ANALYSIS_MAX_QUEUE = int(os.getenv("STL_ANALYSIS_MAX_QUEUE", "8"))
+    STL_ANALYSIS_TIMEOUT = float(os.getenv("STL_ANALYSIS_TIMEOUT", "120"))
+    STL_ANALYSIS_START_METHOD = os.getenv("STL_ANALYSIS_START_METHOD", "spawn")  # gRPC/thread'li süreçte fork güvenli değil
+
+    # Decimate edilmiş önizleme mesh'i
+    PREVIEW_MESH_TRIANGLES = int(os.getenv("PREVIEW_MESH_TRIANGLES", "5000"))
+    PREVIEW_MESH_MAX_TRIANGLES = 20000
+    PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", "64"))
+
+    # Sunucu tarafı STL küçük resmi
+    THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+
+    # Manifold/watertight kontrolü (tüm kenarlar bellekte tutulur)
+    MESH_HEALTH_MAX_TRIANGLES = int(os.getenv("MESH_HEALTH_MAX_TRIANGLES", "5000000"))
+
+    # Destek tahmini: dikeyden bu açıdan fazla eğik aşağı bakan yüzeyler destek ister
+    SUPPORT_OVERHANG_ANGLE_DEG = float(os.getenv("SUPPORT_OVERHANG_ANGLE_DEG", "45"))
+    SUPPORT_DENSITY = float(os.getenv("SUPPORT_DENSITY", "0.15"))  # destek dolgu oranı
+
+    # Katman profili ve baskı süresi tahmini (slicer'sız)
+    LAYER_PROFILE_BINS = int(os.getenv("LAYER_PROFILE_BINS", "200"))
+    PRINT_LINE_WIDTH_MM = float(os.getenv("PRINT_LINE_WIDTH_MM", "0.4"))
+    PRINT_WALL_COUNT = int(os.getenv("PRINT_WALL_COUNT", "2"))
+    PRINT_WALL_SPEED_MM_S = float(os.getenv("PRINT_WALL_SPEED_MM_S", "40"))
+    PRINT_INFILL_SPEED_MM_S = float(os.getenv("PRINT_INFILL_SPEED_MM_S", "80"))
+    PRINT_LAYER_CHANGE_S = float(os.getenv("PRINT_LAYER_CHANGE_S", "1.0"))
+    PRINT_MIN_LAYER_TIME_S = float(os.getenv("PRINT_MIN_LAYER_TIME_S", "8"))
+
+    # Yazıcıya sığma kontrolü için OBB aday rotasyon adımı (derece)
+    ORIENTATION_STEP_DEG = float(os.getenv("ORIENTATION_STEP_DEG", "10"))
+
 # ---------- UTILS ----------
 def get_temp_path(filename: str) -> str:
     temp_dir = Path("/tmp") if os.name != 'nt' else Path("C:/temp")
@@ -228,6 +345,567 @@ def get_temp_path(filename: str) -> str:
 def now_iso() -> str:
     return datetime.utcnow().isoformat() + "Z"
 
+# Sayfalama imleci: [sıralama alanı değeri, belge id] -> opak base64url
+def encode_page_cursor(values) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_page_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2 or not isinstance(values[1], str):
+        raise ValueError("Invalid cursor")
+    return values
+
+# ---------- STORAGE BACKENDS ----------
+# STORAGE_BACKEND=firestore: Firebase (prod). STORAGE_BACKEND=local: SQLite belge deposu + dosya sistemi blob'ları.
+# Yerel backend, Firestore/Storage istemcilerinin uygulamada kullanılan alt kümesini taklit eder (yük testi, profil)
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _apply_value(container, key, value):
+    current = container.get(key)
+    if value is firestore_transforms.DELETE_FIELD:
+        container.pop(key, None)
+    elif value is firestore_transforms.SERVER_TIMESTAMP:
+        container[key] = now_iso()
+    elif isinstance(value, firestore_transforms.ArrayUnion):
+        items = list(current) if isinstance(current, list) else []
+        container[key] = items + [v for v in value.values if v not in items]
+    elif isinstance(value, firestore_transforms.ArrayRemove):
+        container[key] = [v for v in (current if isinstance(current, list) else []) if v not in value.values]
+    elif isinstance(value, firestore_transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        container[key] = base + value.value
+    else:
+        container[key] = copy.deepcopy(value)
+
+
+def _apply_field(data, field_path, value):
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        child = data.get(part)
+        if not isinstance(child, dict):
+            child = data[part] = {}
+        data = child
+    _apply_value(data, parts[-1], value)
+
+
+def _merge_fields(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            # merge=True iç içe map'leri derin birleştirir; alt alanlardaki Increment vb. de uygulanır
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge_fields(target[key], value)
+        else:
+            _apply_value(target, key, value)
+
+
+def _get_field(data, field_path):
+    for part in field_path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+class LocalSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        return copy.deepcopy(_get_field(self._data or {}, field_path))
+
+
+class LocalDocumentRef:
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self, transaction=None):
+        return LocalSnapshot(self, self._store._read(self._collection, self.id))
+
+    def set(self, data, merge=False):
+        with self._store._writing():
+            self._store._set(self._collection, self.id, data, merge)
+
+    def update(self, fields):
+        with self._store._writing():
+            self._store._update(self._collection, self.id, fields)
+
+    def delete(self):
+        with self._store._writing():
+            self._store._delete(self._collection, self.id)
+
+
+class LocalQuery:
+    # Filtre/sıralama/imleç SQLite json_extract ile SQL'e çevrilir; sıralama alanı olmayan belgeler Firestore'daki gibi elenir
+    OPERATORS = {"==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+    def __init__(self, store, collection, filters=(), orders=(), limit=None, cursor=None, fields=None):
+        self._store = store
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {"filters": self._filters, "orders": self._orders, "limit": self._limit, "cursor": self._cursor,
+                 "fields": self._fields}
+        state.update(changes)
+        return LocalQuery(self._store, self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=tuple(field_paths))
+
+    @staticmethod
+    def _field_expr(field_path, params):
+        if field_path == "__name__":
+            return "id"
+        params.append("$." + ".".join('"' + part.replace('"', "") + '"' for part in field_path.split(".")))
+        return "json_extract(data, ?)"
+
+    def _sql(self):
+        params = [self._collection]
+        clauses = ["collection = ?"]
+        for field_path, op, value in self._filters:
+            if op in ("array_contains", "array_contains_any"):
+                values = value if op == "array_contains_any" else [value]
+                path_params = []
+                self._field_expr(field_path, path_params)
+                clauses.append(
+                    f"EXISTS (SELECT 1 FROM json_each(data, ?) WHERE json_each.value IN ({', '.join('?' * len(values))}))"
+                )
+                params.extend(path_params + list(values))
+                continue
+            expr = self._field_expr(field_path, params)
+            if op in ("in", "not-in"):
+                values = list(value)
+                clauses.append(f"{expr} {'IN' if op == 'in' else 'NOT IN'} ({', '.join('?' * len(values))})")
+                params.extend(values)
+            elif op == "==" and value is None:
+                clauses.append(f"{expr} IS NULL")
+            elif op in self.OPERATORS:
+                clauses.append(f"{expr} {self.OPERATORS[op]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported query operator: {op}")
+
+        orders = list(self._orders)
+        tie_direction = orders[-1][1] if orders else "ASCENDING"
+        if not any(field_path == "__name__" for field_path, _ in orders):
+            orders.append(("__name__", tie_direction))
+        for field_path, _ in orders:
+            if field_path != "__name__":
+                clauses.append("json_type(data, ?) IS NOT NULL")
+                self._field_expr(field_path, params)
+
+        if self._cursor is not None:
+            keys, values = self._cursor_values(orders)
+            alternatives = []
+            for i in range(len(keys)):
+                terms = []
+                for field_path, value in zip(keys[:i], values[:i]):
+                    terms.append(f"{self._field_expr(field_path, params)} = ?")
+                    params.append(value)
+                field_path, direction = keys[i], dict(orders)[keys[i]]
+                terms.append(f"{self._field_expr(field_path, params)} {'<' if direction == 'DESCENDING' else '>'} ?")
+                params.append(values[i])
+                alternatives.append("(" + " AND ".join(terms) + ")")
+            clauses.append("(" + " OR ".join(alternatives) + ")")
+
+        order_sql = []
+        for field_path, direction in orders:
+            order_sql.append(f"{self._field_expr(field_path, params)} {'DESC' if direction == 'DESCENDING' else 'ASC'}")
+        sql = f"SELECT id, data FROM documents WHERE {' AND '.join(clauses)} ORDER BY {', '.join(order_sql)}"
+        if self._limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(self._limit))
+        return sql, params
+
+    def _cursor_values(self, orders):
+        cursor = self._cursor
+        if isinstance(cursor, LocalSnapshot):
+            keys = [field_path for field_path, _ in orders]
+            return keys, [cursor.id if key == "__name__" else _get_field(cursor._data or {}, key) for key in keys]
+        keys = [field_path for field_path, _ in self._orders]
+        if isinstance(cursor, dict):
+            return keys, [_get_field(cursor, key) for key in keys]
+        values = list(cursor)
+        return keys[:len(values)], values
+
+    def stream(self, transaction=None):
+        sql, params = self._sql()
+        for doc_id, data in self._store._execute(sql, params):
+            data = json.loads(data)
+            if self._fields is not None:
+                # Firestore projeksiyonu gibi: yalnızca istenen (var olan) alanlar döner
+                projected = {}
+                for field_path in self._fields:
+                    value = _get_field(data, field_path)
+                    if value is not None:
+                        _apply_field(projected, field_path, value)
+                data = projected
+            yield LocalSnapshot(LocalDocumentRef(self._store, self._collection, doc_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._store._listen(self, callback)
+
+    def _incremental(self):
+        # Yalnızca filtreli sorgularda sonuç, belgelerin tek tek sorguya uyup uymamasından kurulabilir
+        return not self._orders and self._limit is None and self._cursor is None
+
+    def _matching(self, doc_ids, chunk=500):
+        doc_ids = list(doc_ids)
+        for i in range(0, len(doc_ids), chunk):
+            yield from self._copy(filters=self._filters + (("__name__", "in", doc_ids[i:i + chunk]),)).stream()
+
+
+class LocalCollection(LocalQuery):
+    def __init__(self, store, name):
+        super().__init__(store, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        return LocalDocumentRef(self._store, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        # Firestore ile aynı sıra: (update_time, DocumentReference)
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return datetime.now(timezone.utc), ref
+
+
+class LocalDocumentChange:
+    def __init__(self, change_type, document):
+        self.type = change_type
+        self.document = document
+
+
+class LocalWatch:
+    def __init__(self, store, listener):
+        self._store = store
+        self._listener = listener
+
+    def unsubscribe(self):
+        with self._store._lock:
+            if self._listener in self._store._listeners:
+                self._store._listeners.remove(self._listener)
+
+
+class LocalTransaction:
+    # Yerel depoda transaction, fonksiyon boyunca depo kilidini tutar; yazımlar tek SQLite transaction'ında uygulanır
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def get(self, ref_or_query):
+        # Firestore ile aynı sözleşme: belge referansı için de tek snapshot'lık bir üreteç döner
+        if isinstance(ref_or_query, LocalDocumentRef):
+            return self._store.get_all([ref_or_query], transaction=self)
+        return ref_or_query.stream(transaction=self)
+
+    def set(self, ref, data, merge=False):
+        self._writes.append((self._store._set, ref, (data, merge)))
+
+    def update(self, ref, fields):
+        self._writes.append((self._store._update, ref, (fields,)))
+
+    def delete(self, ref):
+        self._writes.append((self._store._delete, ref, ()))
+
+    def run(self, fn, *args, **kwargs):
+        with self._store._lock:
+            self._writes = []
+            result = fn(self, *args, **kwargs)
+            with self._store._writing():
+                for write, ref, write_args in self._writes:
+                    write(ref._collection, ref.id, *write_args)
+            return result
+
+
+class LocalDocumentStore:
+    def __init__(self, path=":memory:"):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (collection, id)) WITHOUT ROWID"
+        )
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._touched = set()  # (koleksiyon, id): commit sonrası dinleyicilere yalnızca bunlar teslim edilir
+
+    def collection(self, name):
+        return LocalCollection(self, name)
+
+    def document(self, path):
+        collection, doc_id = path.rsplit("/", 1)
+        return LocalDocumentRef(self, collection, doc_id)
+
+    def transaction(self):
+        return LocalTransaction(self)
+
+    def get_all(self, references, transaction=None):
+        references = list(references)
+        found = {}
+        by_collection = {}
+        for ref in references:
+            by_collection.setdefault(ref._collection, []).append(ref.id)
+        for collection, ids in by_collection.items():
+            sql = f"SELECT id, data FROM documents WHERE collection = ? AND id IN ({', '.join('?' * len(ids))})"
+            for doc_id, data in self._execute(sql, [collection] + ids):
+                found[(collection, doc_id)] = json.loads(data)
+        for ref in references:
+            yield LocalSnapshot(ref, found.get((ref._collection, ref.id)))
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _read(self, collection, doc_id):
+        rows = self._execute("SELECT data FROM documents WHERE collection = ? AND id = ?", (collection, doc_id))
+        return json.loads(rows[0][0]) if rows else None
+
+    def _write(self, collection, doc_id, data):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)",
+            (collection, doc_id, json.dumps(data, default=_json_default))
+        )
+        self._touched.add((collection, doc_id))
+
+    # _set/_update/_delete yalnızca _writing() içinde çağrılır
+    def _set(self, collection, doc_id, data, merge=False):
+        current = self._read(collection, doc_id) if merge else None
+        document = current or {}
+        if merge:
+            _merge_fields(document, data)
+        else:
+            for key, value in data.items():
+                _apply_value(document, key, value)
+        self._write(collection, doc_id, document)
+
+    def _update(self, collection, doc_id, fields):
+        document = self._read(collection, doc_id)
+        if document is None:
+            raise NotFound(f"No document to update: {collection}/{doc_id}")
+        for field_path, value in fields.items():
+            _apply_field(document, field_path, value)
+        self._write(collection, doc_id, document)
+
+    def _delete(self, collection, doc_id):
+        self._conn.execute("DELETE FROM documents WHERE collection = ? AND id = ?", (collection, doc_id))
+        self._touched.add((collection, doc_id))
+
+    @contextmanager
+    def _writing(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._touched.clear()
+                raise
+            self._conn.execute("COMMIT")
+            touched, self._touched = self._touched, set()
+            written = {}
+            for collection, doc_id in touched:
+                written.setdefault(collection, set()).add(doc_id)
+            listeners = [(listener, written[listener["query"]._collection]) for listener in self._listeners
+                         if listener["query"]._collection in written]
+        for listener, doc_ids in listeners:
+            self._deliver(listener, doc_ids)
+
+    def _listen(self, query, callback):
+        listener = {"query": query, "callback": callback, "docs": None, "lock": threading.Lock()}
+        with self._lock:
+            self._listeners.append(listener)
+        self._deliver(listener)
+        return LocalWatch(self, listener)
+
+    def _deliver(self, listener, doc_ids=None):
+        # İlk teslimatta (ve sıralı/limitli sorgularda) sorgu tümüyle çalışır; sonrasında yalnızca yazılan belgeler
+        # sorguya karşı denenir. Önceki sonuçla karşılaştırılıp Firestore benzeri değişiklik listesi üretilir.
+        # Belgeler teslimat anındaki halleriyle okunur; sırası karışan teslimatlar da son duruma yakınsar.
+        query = listener["query"]
+        with listener["lock"]:
+            previous = listener["docs"]
+            delivered = previous is not None
+            previous = previous or {}
+            if delivered and doc_ids is not None and query._incremental():
+                current = dict(previous)
+                for doc_id in doc_ids:
+                    current.pop(doc_id, None)
+                current.update((doc.id, doc) for doc in query._matching(doc_ids))
+                checked = sorted(doc_ids)
+                docs = [current[doc_id] for doc_id in sorted(current)]
+            else:
+                docs = query.get()
+                current = {doc.id: doc for doc in docs}
+                checked = list(current) + [doc_id for doc_id in previous if doc_id not in current]
+            changes = []
+            for doc_id in checked:
+                doc, old = current.get(doc_id), previous.get(doc_id)
+                if doc is None:
+                    if old is not None:
+                        changes.append(LocalDocumentChange(ChangeType.REMOVED, old))
+                elif old is None:
+                    changes.append(LocalDocumentChange(ChangeType.ADDED, doc))
+                elif old._data != doc._data:
+                    changes.append(LocalDocumentChange(ChangeType.MODIFIED, doc))
+            listener["docs"] = current
+            if delivered and not changes:
+                return
+            try:
+                listener["callback"](docs, changes, datetime.now(timezone.utc))
+            except Exception as e:
+                logger.warning(f"Local snapshot listener failed: {e}")
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.cache_control = None
+        self.content_type = None
+
+    def _path(self):
+        root = os.path.realpath(self.bucket.root)
+        path = os.path.realpath(os.path.join(root, self.name))
+        if not path.startswith(root + os.sep):
+            raise ValueError(f"Invalid blob name: {self.name}")
+        return path
+
+    def upload_from_string(self, data, content_type=None):
+        path = self._path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+        self.content_type = content_type
+
+    def upload_from_filename(self, filename, content_type=None):
+        path = self._path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(filename, path)
+        self.content_type = content_type
+
+    def exists(self):
+        return os.path.isfile(self._path())
+
+    def download_as_bytes(self):
+        try:
+            with open(self._path(), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise NotFound(f"No such object: {self.name}")
+
+    def delete(self):
+        try:
+            os.remove(self._path())
+        except FileNotFoundError:
+            raise NotFound(f"No such object: {self.name}")
+
+    def generate_signed_url(self, expiration=None, method="GET", **kwargs):
+        if isinstance(expiration, timedelta):
+            expires = int(time.time() + expiration.total_seconds())
+        elif isinstance(expiration, datetime):
+            expires = int(expiration.timestamp())
+        else:
+            expires = int(expiration or time.time() + 3600)
+        return self.bucket.signed_url(self.name, expires)
+
+
+class LocalBucket:
+    # Signed URL'ler SECRET_KEY ile HMAC'lenir ve /api/local-storage üzerinden servis edilir
+    URL_PREFIX = "/api/local-storage/"
+
+    def __init__(self, root, secret_key):
+        self.root = root
+        self.name = os.path.basename(os.path.abspath(root))
+        self._secret = secret_key.encode("utf-8")
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, blob_name):
+        return LocalBlob(self, blob_name)
+
+    def _signature(self, name, expires):
+        return hmac.new(self._secret, f"{name}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def signed_url(self, name, expires):
+        return f"{self.URL_PREFIX}{quote(name)}?expires={expires}&signature={self._signature(name, expires)}"
+
+    def verify(self, name, expires, signature):
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        return expires >= time.time() and hmac.compare_digest(self._signature(name, expires), signature or "")
+
+
+def transactional(fn):
+    # Firestore transaction'ı ise firestore.transactional (retry'lı); yerel depoda kilit altında tek seferde
+    @wraps(fn)
+    def wrapper(transaction, *args, **kwargs):
+        if isinstance(transaction, LocalTransaction):
+            return transaction.run(fn, *args, **kwargs)
+        return firestore.transactional(fn)(transaction, *args, **kwargs)
+    return wrapper
+
+
+def create_storage_backend(config_object):
+    backend = config_object.STORAGE_BACKEND
+    if backend == "local":
+        store = LocalDocumentStore(config_object.LOCAL_DB_PATH)
+        bucket = LocalBucket(config_object.LOCAL_BLOB_DIR, config_object.SECRET_KEY)
+        logger.info(f"Local storage backend: {config_object.LOCAL_DB_PATH}, blobs in {config_object.LOCAL_BLOB_DIR}")
+        return store, bucket
+    if backend != "firestore":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return firestore.client(), storage.bucket()
+
 # ---------- ORDER STATE MACHINE ----------
 class OrderStateMachine:
     TRANSITIONS = {
@@ -250,13 +928,20 @@ class OrderStateMachine:
 
     @staticmethod
     def transition(db, order_id: str, new_state: str, actor_id: str, reason: str = None):
-        @firestore.transactional
+        order, _ = OrderStateMachine.transition_with_update(db, order_id, new_state, actor_id, reason)
+        return order
+
+    @staticmethod
+    def transition_with_update(db, order_id: str, new_state: str, actor_id: str, reason: str = None):
+        # (geçiş öncesi sipariş, yazılan alanlar) döner; çağıran yerel kopyasını güncelleyebilsin
+        @transactional
         def update_state(transaction):
             order_ref = db.collection("orders").document(order_id)
-            snap = transaction.get(order_ref)
+            snap = order_ref.get(transaction=transaction)
             order = snap.to_dict()
             if not order:
                 raise ValueError("Order not found")
+            stats_state = OrderStats.read_state(transaction, db)
             current_state = order.get('status')
             if not OrderStateMachine.can_transition(current_state, new_state):
                 raise ValueError(f"Cannot transition from {current_state} to {new_state}")
@@ -268,6 +953,7 @@ class OrderStateMachine:
             }
             if reason:
                 update_data[f"{new_state}_reason"] = reason
+            update_data.update(OrderStats.record_change(transaction, db, stats_state, order, {**order, **update_data}))
             transaction.update(order_ref, update_data)
             transaction.set(
                 db.collection("order_state_history").document(),
@@ -280,25 +966,261 @@ class OrderStateMachine:
                     "created_at": now_iso()
                 }
             )
-            return order
+            return order, update_data
         transaction = db.transaction()
         return update_state(transaction)
 
+# ---------- ORDER STATISTICS ----------
+class StatsRebuildInProgress(Exception):
+    pass
+
+
+class OrderStats:
+    # Admin istatistikleri için artımlı sayaçlar. Sipariş yazan transaction'lar siparişin katkı farkını (önce/sonra)
+    # rastgele bir shard'a Increment ile yazar (tek belgeye saniyede ~1 yazım sınırı); günlük kovalar oluşturma/ödeme
+    # gününe göre tutulur, zamanlanmış görev bunları kümülatif rollup'lara çevirir. "Son N gün" = toplam -
+    # rollup(başlangıçtan önceki gün): O(1) okuma. Sayaçlar nesil (generation) etiketlidir; stats_meta/state hangi
+    # neslin geçerli olduğunu ve kurulumun yapıldığını tutar. Yeniden kurulum yeni nesle yazılır, sonra geçiş yapılır.
+    META = "stats_meta"
+    STATE = "state"
+    SHARDS = "stats_shards"
+    DAILY = "stats_daily"
+    ROLLUPS = "stats_rollups"
+    CUMULATIVE_FIELDS = ("orders", "revenue", "commission")
+    BASE_FIELDS = ("status", "material_name", "created_at", "paid_at", "payment_status", "final_price", "commission_amount")
+    REBUILD_STALE_SECONDS = 600  # yarıda kalan yeniden kurulum bu süreden sonra devralınabilir
+
+    @staticmethod
+    def _shard_id():
+        return str(random.randrange(Config.STATS_SHARDS))
+
+    @staticmethod
+    def _day(timestamp=None):
+        return (timestamp or now_iso())[:10]
+
+    @staticmethod
+    def _state_ref(db):
+        return db.collection(OrderStats.META).document(OrderStats.STATE)
+
+    @staticmethod
+    def read_state(transaction, db):
+        # Sipariş transaction'ının yazımlardan önceki okumalarından biri olmalı; geçiş/yeniden kurulumla çakışan
+        # transaction yeniden denenir, böylece hiçbir fark iki nesil arasında kaybolmaz
+        snap = OrderStats._state_ref(db).get(transaction=transaction)
+        return (snap.to_dict() or {}) if snap.exists else {}
+
+    @staticmethod
+    def current_generation(db):
+        snap = OrderStats._state_ref(db).get()
+        return ((snap.to_dict() or {}) if snap.exists else {}).get("generation")
+
+    @staticmethod
+    def _contribution(order):
+        # Bir siparişin sayaçlara katkısı; artımlı yazımlar ve yeniden kurulum aynı tanımı kullanır
+        if not order:
+            return {}, {}
+        shard = {
+            "orders": 1,
+            "status": {order.get("status", "unknown"): 1},
+            "material": {order.get("material_name") or "Unknown": 1}
+        }
+        daily = {OrderStats._day(order.get("created_at")): {"orders": 1}}
+        if order.get("paid_at") or order.get("payment_status") == "paid":
+            revenue = float(order.get("final_price", 0.0) or 0.0)
+            commission = float(order.get("commission_amount", 0.0) or 0.0)
+            shard.update({"revenue": revenue, "commission": commission})
+            bucket = daily.setdefault(OrderStats._day(order.get("paid_at") or order.get("created_at")), {})
+            bucket["revenue"] = bucket.get("revenue", 0.0) + revenue
+            bucket["commission"] = bucket.get("commission", 0.0) + commission
+        return shard, daily
+
+    @staticmethod
+    def _diff(after, before):
+        delta = {}
+        for key in set(after) | set(before):
+            a, b = after.get(key), before.get(key)
+            if isinstance(a, dict) or isinstance(b, dict):
+                value = OrderStats._diff(a or {}, b or {})
+            else:
+                value = (a or 0) - (b or 0)
+            if value:
+                delta[key] = value
+        return delta
+
+    @staticmethod
+    def _increments(delta):
+        return {key: OrderStats._increments(value) if isinstance(value, dict) else firestore.Increment(value)
+                for key, value in delta.items()}
+
+    @staticmethod
+    def _accumulate(target, source):
+        for key, value in source.items():
+            if isinstance(value, dict):
+                OrderStats._accumulate(target.setdefault(key, {}), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                target[key] = target.get(key, 0) + value
+
+    @staticmethod
+    def record_change(transaction, db, state, before, after):
+        # before None -> yeni sipariş. Dönen alanlar çağıranın sipariş yazımına eklenmeli (yeniden kurulum işareti)
+        generations = [gen for gen in (state.get("generation"), state.get("pending_generation")) if gen]
+        if not generations:
+            return {}  # sayaçlar henüz kurulmadı; ilk kurulum tam taramayla yapılacak
+        shard_before, daily_before = OrderStats._contribution(before)
+        shard_after, daily_after = OrderStats._contribution(after)
+        shard_delta = OrderStats._diff(shard_after, shard_before)
+        daily_delta = OrderStats._diff(daily_after, daily_before)
+        shard = OrderStats._shard_id()
+        for generation in generations:
+            if shard_delta:
+                transaction.set(db.collection(OrderStats.SHARDS).document(f"{generation}_{shard}"), {
+                    "generation": generation, **OrderStats._increments(shard_delta)
+                }, merge=True)
+            for day, fields in daily_delta.items():
+                transaction.set(db.collection(OrderStats.DAILY).document(f"{generation}_{day}_{shard}"), {
+                    "generation": generation, "date": day, **OrderStats._increments(fields)
+                }, merge=True)
+        pending = state.get("pending_generation")
+        if pending and ((before or {}).get("stats_rebuild") or {}).get("generation") != pending:
+            # Yeniden kurulum sürerken ilk dokunuş: taramanın sayacağı durum, bu yazımdan önceki hal
+            base = {field: before.get(field) for field in OrderStats.BASE_FIELDS} if before else None
+            return {"stats_rebuild": {"generation": pending, "base": base}}
+        return {}
+
+    @staticmethod
+    def totals(db, generation):
+        totals = {"orders": 0, "revenue": 0.0, "commission": 0.0, "status": {}, "material": {}}
+        for doc in db.collection(OrderStats.SHARDS).where("generation", "==", generation).stream():
+            OrderStats._accumulate(totals, doc.to_dict() or {})
+        for group in ("status", "material"):
+            totals[group] = {key: count for key, count in totals[group].items() if count}
+        return totals
+
+    @staticmethod
+    def cumulative(db, generation, day):
+        # day dahil kümülatif toplam: en yakın rollup + sonrasındaki günlük kovalar
+        base = {field: 0 for field in OrderStats.CUMULATIVE_FIELDS}
+        rollups = list(db.collection(OrderStats.ROLLUPS).where("generation", "==", generation)
+                       .where("date", "<=", day)
+                       .order_by("date", direction=firestore.Query.DESCENDING).limit(1).stream())
+        query = db.collection(OrderStats.DAILY).where("generation", "==", generation).where("date", "<=", day)
+        if rollups:
+            rollup = rollups[0].to_dict()
+            for field in OrderStats.CUMULATIVE_FIELDS:
+                base[field] = rollup.get(field, 0)
+            if rollup.get("date") == day:
+                return base
+            query = query.where("date", ">", rollup["date"])
+        for doc in query.stream():
+            bucket = doc.to_dict() or {}
+            for field in OrderStats.CUMULATIVE_FIELDS:
+                base[field] += bucket.get(field, 0) or 0
+        return base
+
+    @staticmethod
+    def rollup(db, day, generation=None):
+        # Tamamlanmış bir gün için: önceki günün kümülatifi + o günün kovaları (tekrar çalıştırılabilir)
+        generation = generation or OrderStats.current_generation(db)
+        if not generation:
+            return None
+        previous_day = (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        totals = OrderStats.cumulative(db, generation, previous_day)
+        for doc in (db.collection(OrderStats.DAILY).where("generation", "==", generation)
+                    .where("date", "==", day).stream()):
+            bucket = doc.to_dict() or {}
+            for field in OrderStats.CUMULATIVE_FIELDS:
+                totals[field] += bucket.get(field, 0) or 0
+        db.collection(OrderStats.ROLLUPS).document(f"{generation}_{day}").set({
+            "generation": generation, "date": day, **totals, "rolled_up_at": now_iso()
+        })
+        return totals
+
+    @staticmethod
+    def rebuild(db):
+        # Tam tarama ile yeni nesil kurar (ilk kurulum / sapma düzeltme). Talep edildiği andan itibaren sipariş
+        # yazımları farklarını yeni nesle de yazar ve siparişe önceki halini işaretler; tarama işaretli siparişleri
+        # bu önceki halle sayar. Böylece tarama ile geçiş arasındaki yazımlar ne kaybolur ne iki kez sayılır.
+        generation = uuid.uuid4().hex[:12]
+        state_ref = OrderStats._state_ref(db)
+
+        @transactional
+        def claim(transaction):
+            state = OrderStats.read_state(transaction, db)
+            started = state.get("pending_started_at") or 0
+            if state.get("pending_generation") and time.time() - started < OrderStats.REBUILD_STALE_SECONDS:
+                raise StatsRebuildInProgress("Stats rebuild already in progress")
+            transaction.set(state_ref, {"pending_generation": generation, "pending_started_at": time.time()}, merge=True)
+
+        claim(db.transaction())
+
+        shard, daily = {}, {}
+        for doc in db.collection("orders").stream():
+            order = doc.to_dict() or {}
+            marker = order.get("stats_rebuild") or {}
+            if marker.get("generation") == generation:
+                order = marker.get("base")
+            order_shard, order_daily = OrderStats._contribution(order)
+            OrderStats._accumulate(shard, order_shard)
+            OrderStats._accumulate(daily, order_daily)
+        db.collection(OrderStats.SHARDS).document(f"{generation}_base").set({"generation": generation, **shard})
+        for day, fields in daily.items():
+            db.collection(OrderStats.DAILY).document(f"{generation}_{day}_base").set(
+                {"generation": generation, "date": day, **fields})
+
+        @transactional
+        def switch(transaction):
+            state = OrderStats.read_state(transaction, db)
+            if state.get("pending_generation") != generation:
+                raise StatsRebuildInProgress("Stats rebuild was taken over by another run")
+            transaction.set(state_ref, {
+                "generation": generation,
+                "pending_generation": None,
+                "pending_started_at": None,
+                "initialized_at": now_iso()
+            }, merge=True)
+
+        switch(db.transaction())
+
+        # Eski nesillerin belgeleri silinir; tamamlanmış günlerin rollup'ları yeni nesil kovalarından kurulur
+        for collection in (OrderStats.SHARDS, OrderStats.DAILY, OrderStats.ROLLUPS):
+            for doc in db.collection(collection).stream():
+                if (doc.to_dict() or {}).get("generation") != generation:
+                    doc.reference.delete()
+        today = OrderStats._day()
+        days = sorted({(doc.to_dict() or {}).get("date") for doc in
+                       db.collection(OrderStats.DAILY).where("generation", "==", generation).stream()} - {None})
+        for day in days:
+            if day < today:
+                OrderStats.rollup(db, day, generation)
+        return {"generation": generation, **OrderStats.totals(db, generation)}
+
 # ---------- PRICING ENGINE ----------
 class PricingEngine:
+    @staticmethod
+    def support_required(analysis: dict, requested=None) -> bool:
+        # İstemcinin açık seçimi geçerli; seçim yoksa analizin destek hesabı (o da yoksa destek yok)
+        if requested is None:
+            requested = (analysis or {}).get('support_required', False)
+        return bool(requested)
+
     @staticmethod
     def calculate_price(analysis: dict, params: dict) -> dict:
         analysis = analysis or {}
         weight_g = float(max(analysis.get('estimated_weight_g', 0.0), 0.1))  # min 0.1g
         triangle_count = int(max(analysis.get('triangle_count', 0), 1))
         print_time_minutes = float(max(analysis.get('estimated_print_time_minutes', 0.0), 0.0))
+        if params.get('layer_height_mm') is not None:
+            # Katman profili varsa süre sipariş parametreleriyle yeniden tahmin edilir
+            profiled = STLAnalyzer.estimate_print_time(analysis, params['layer_height_mm'], params.get('infill_density', 0.2))
+            if profiled is not None:
+                print_time_minutes = profiled
 
         material_price_per_g = float(max(params.get('material_price_per_g', 0.02), 0.0))
         infill = float(params.get('infill_density', 0.2))
         infill = max(0.1, min(infill, 1.0))
         hourly_rate = float(max(params.get('hourly_rate', 5.0), 0.0))
         fixed_cost = float(max(params.get('fixed_cost', 1.0), 0.0))
-        support_required = bool(params.get('support_required', False))
+        support_required = PricingEngine.support_required(analysis, params.get('support_required'))
 
         margin_percent = float(max(params.get('margin_percent', 0.20), 0.0))
         commission_rate = float(max(params.get('commission_rate', Config.DEFAULT_COMMISSION_RATE), 0.0))
@@ -315,7 +1237,11 @@ class PricingEngine:
 
         material_cost = max(weight_g * material_price_per_g * infill_multiplier, 0.0)
         time_cost = max(print_time_hours * hourly_rate, 0.0)
-        support_cost = max((weight_g * 0.3 * material_price_per_g) if support_required else 0.0, 0.0)
+        if 'estimated_support_weight_g' in analysis:
+            support_weight_g = float(max(analysis['estimated_support_weight_g'], 0.0))
+        else:
+            support_weight_g = weight_g * 0.3  # destek hesabı olmayan eski analizler
+        support_cost = max((support_weight_g * material_price_per_g) if support_required else 0.0, 0.0)
         producer_base_cost = material_cost + time_cost + support_cost + fixed_cost
 
         producer_margin = max(producer_base_cost * margin_percent, 0.0)
@@ -349,12 +1275,2343 @@ class PricingEngine:
             "producer_earnings": round(producer_earnings, 2),
             "platform_commission": round(platform_commission, 2),
             "payment_fee": round(payment_fee, 2),
-            "customer_price": round(customer_total, 2)
+            "customer_price": round(customer_total, 2),
+            "print_time_minutes": round(print_time_minutes, 1)
+        }
+
+    @staticmethod
+    def calculate_price_grid(analysis: dict, params: dict) -> dict:
+        # calculate_price'ın vektörel hali: params değerleri skaler ya da yayınlanabilir (broadcast) diziler.
+        # Aynı float64 işlemleri aynı sırayla yapılır; yuvarlama round_grid ile skaler yoldaki round() ile.
+        analysis = analysis or {}
+        weight_g = float(max(analysis.get('estimated_weight_g', 0.0), 0.1))
+        base_minutes = float(max(analysis.get('estimated_print_time_minutes', 0.0), 0.0))
+
+        def param(name, default):
+            return np.asarray(params.get(name, default), dtype=np.float64)
+
+        raw_infill = param('infill_density', 0.2)
+        print_time_minutes = np.full(raw_infill.shape, base_minutes)
+        if params.get('layer_height_mm') is not None:
+            # Süre yalnızca dolguya bağlı: her farklı dolgu değeri için bir kez
+            values, inverse = np.unique(raw_infill, return_inverse=True)
+            profiled = [STLAnalyzer.estimate_print_time(analysis, params['layer_height_mm'], float(v)) for v in values]
+            if profiled and profiled[0] is not None:
+                print_time_minutes = np.asarray(profiled, dtype=np.float64)[inverse.reshape(raw_infill.shape)]
+
+        material_price_per_g = np.maximum(param('material_price_per_g', 0.02), 0.0)
+        infill = np.maximum(0.1, np.minimum(raw_infill, 1.0))
+        hourly_rate = np.maximum(param('hourly_rate', 5.0), 0.0)
+        fixed_cost = np.maximum(param('fixed_cost', 1.0), 0.0)
+        # Skaler yoldaki gibi: verilmişse istemcinin seçim(ler)i, yoksa analizin bayrağı
+        support_required = params.get('support_required')
+        if support_required is None:
+            support_required = PricingEngine.support_required(analysis)
+        support_required = np.asarray(support_required, dtype=bool)
+
+        margin_percent = np.maximum(param('margin_percent', 0.20), 0.0)
+        commission_rate = np.maximum(param('commission_rate', Config.DEFAULT_COMMISSION_RATE), 0.0)
+        provider_fee_rate = np.maximum(param('provider_fee_rate', 0.025), 0.0)
+        min_order = np.maximum(param('min_order_amount', 10.0), 0.0)
+
+        print_time_hours = print_time_minutes / 60.0
+        infill_multiplier = np.where(infill > 0.5, 1.5, np.where(infill > 0.2, 1.2, 1.0))
+
+        material_cost = np.maximum(weight_g * material_price_per_g * infill_multiplier, 0.0)
+        time_cost = np.maximum(print_time_hours * hourly_rate, 0.0)
+        if 'estimated_support_weight_g' in analysis:
+            support_weight_g = float(max(analysis['estimated_support_weight_g'], 0.0))
+        else:
+            support_weight_g = weight_g * 0.3
+        support_cost = np.maximum(np.where(support_required, support_weight_g * material_price_per_g, 0.0), 0.0)
+        producer_base_cost = material_cost + time_cost + support_cost + fixed_cost
+
+        producer_margin = np.maximum(producer_base_cost * margin_percent, 0.0)
+        producer_subtotal = producer_base_cost + producer_margin
+        platform_commission = np.maximum(producer_subtotal * commission_rate, 0.0)
+
+        denom = np.where(provider_fee_rate < 1.0, 1.0 - provider_fee_rate, 1.0)
+        amount_before_fee = producer_subtotal + platform_commission
+        customer_total = np.maximum(amount_before_fee / denom, min_order)
+
+        payment_fee = customer_total * provider_fee_rate
+        amount_after_fee = customer_total - payment_fee
+        producer_earnings = np.maximum(amount_after_fee - platform_commission, 0.0)
+
+        grid = {
+            "material_cost": material_cost,
+            "time_cost": time_cost,
+            "support_cost": support_cost,
+            "fixed_cost": fixed_cost,
+            "producer_margin": producer_margin,
+            "producer_subtotal": producer_subtotal,
+            "platform_commission": platform_commission,
+            "payment_fee": payment_fee,
+            "customer_price": customer_total,
+            "producer_earnings": producer_earnings
+        }
+        grid["print_time_minutes"] = print_time_minutes
+        shape = np.broadcast_shapes(support_required.shape, *(np.shape(v) for v in grid.values()))
+        return {k: np.broadcast_to(v, shape) for k, v in grid.items()}
+
+    @staticmethod
+    def round_grid(values, digits=2):
+        # np.round ikili kayan nokta üzerinde farklı yuvarlayabilir; skaler yolla birebir aynı olsun diye round()
+        values = np.asarray(values)
+        if values.ndim == 0:
+            return round(float(values), digits)
+        return [PricingEngine.round_grid(v, digits) for v in values]
+
+# ---------- STL ANALYZER ----------
+# Binary STL üçgen kaydı: normal (3f) + 3 köşe (9f) + attribute (H) = 50 byte
+STL_RECORD_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+STL_CHUNK_TRIANGLES = 65536  # ~3.2MB ham kayıt / blok
+STL_ASCII_BLOCK_BYTES = 4 * 1024 * 1024  # ASCII okuma bloğu
+_ASCII_VERTEX_RE = re.compile(rb'vertex\s+([^\r\n]+)')
+
+
+def _looks_like_ascii_stl(head, total_size=None):
+    # Bazı binary exporter'lar header'a da "solid" yazıyor; ASCII için "facet" görülmeli ve NUL byte olmamalı
+    if not head.lstrip().startswith(b"solid"):
+        return False
+    if total_size is not None and len(head) >= 84:
+        count = struct.unpack_from("<I", head, 80)[0]
+        if 84 + count * STL_RECORD_DTYPE.itemsize == total_size:
+            return False
+    return len(head) < 84 or (b"facet" in head and b"\0" not in head)
+
+
+def _stl_binary_integrity(header_count, triangle_count, trailing_bytes):
+    # Header'daki üçgen sayısı dosya boyutuyla çelişebiliyor (ör. 0 yazan exporter'lar);
+    # hesap her zaman dosyadaki tam kayıtlar üzerinden yapılır, fark burada işaretlenir
+    return {
+        'format': 'binary',
+        'header_triangle_count': int(header_count),
+        'header_mismatch': int(header_count) != int(triangle_count),
+        'trailing_bytes': int(trailing_bytes)
+    }
+
+def candidate_rotations(frames, step_deg=10.0):
+    # Her çerçeve (satırları eksen olan 3x3) ve kendi eksenleri etrafında step_deg adımlarla döndürülmüş halleri
+    candidates = []
+    for frame in frames:
+        frame = np.asarray(frame, dtype=np.float64)
+        for axis in range(3):
+            b, c = [i for i in range(3) if i != axis]
+            for angle in np.radians(np.arange(0.0, 90.0, step_deg)):
+                rotated = frame.copy()
+                rotated[b] = np.cos(angle) * frame[b] + np.sin(angle) * frame[c]
+                rotated[c] = -np.sin(angle) * frame[b] + np.cos(angle) * frame[c]
+                candidates.append(rotated)
+    return np.unique(np.round(np.array(candidates), 12), axis=0)
+
+
+def oriented_box_volumes(points, rotations):
+    # Tüm adaylar tek matris çarpımında: (m, 3) @ (3, 3k) -> eksen başına min/max
+    projected = points @ rotations.reshape(-1, 3).T
+    extents = (projected.max(axis=0) - projected.min(axis=0)).reshape(-1, 3)
+    return np.prod(extents, axis=1)
+
+
+class STLGeometryAccumulator:
+    # (n, 3, 3) köşe bloklarını alır; bbox, işaretli hacim ve yüzey alanını dizi işlemleriyle toplar.
+    # Overhang: yüz normali dikeyden overhang_angle_deg'den fazla aşağı bakıyorsa yüzün XY izdüşümü
+    # destek alanı, izdüşüm * (merkez z - tabla z) destek hacmi sayılır. Tablaya oturan yüzler hariç.
+    # Yönlendirme: en fazla 2 * SAMPLE_TRIANGLES üçgenlik düzgün örnek üzerinde birim ve alan ağırlıklı PCA
+    # çerçevesinden türetilen aday rotasyonlar denenir; en iyi ORIENTATION_CANDIDATES tanesi ikinci geçişte
+    # tüm köşelerle kesinleşir.
+    BED_TOLERANCE_MM = 0.05
+    SAMPLE_TRIANGLES = 16384
+    ORIENTATION_CANDIDATES = 4
+
+    def __init__(self, preview_limit=100, overhang_angle_deg=None, orientation_step_deg=None):
+        self.preview_limit = preview_limit
+        self.preview = []
+        self.count = 0
+        self.min_c = np.full(3, np.inf, dtype=np.float64)
+        self.max_c = np.full(3, -np.inf, dtype=np.float64)
+        self.volume = 0.0
+        self.surface_area = 0.0
+        if overhang_angle_deg is None:
+            overhang_angle_deg = Config.SUPPORT_OVERHANG_ANGLE_DEG
+        self.overhang_angle_deg = float(overhang_angle_deg)
+        self._overhang_sin = float(np.sin(np.radians(self.overhang_angle_deg)))
+        self.overhang_area = 0.0
+        self.overhang_moment = 0.0
+        self._floor_z = np.inf
+        self._floor_area = 0.0
+        if orientation_step_deg is None:
+            orientation_step_deg = Config.ORIENTATION_STEP_DEG
+        self.orientation_step_deg = float(orientation_step_deg)
+        # Üçgen örneği: her üçgen 1/stride olasılıkla; tampon dolunca rastgele yarıya inceltilip stride
+        # ikiye katlanır (sabit tohum: aynı dosya aynı sonucu verir, düzenli mesh'lerde örtüşme olmaz)
+        self._sample = []
+        self._sample_size = 0
+        self._sample_stride = 1
+        self._rng = np.random.default_rng(0)
+
+    def feed(self, tris, normals=None):
+        tris = np.asarray(tris, dtype=np.float64)
+        if len(tris) == 0:
+            return
+        if len(self.preview) < self.preview_limit:
+            self.preview.extend(tris[:self.preview_limit - len(self.preview)].tolist())
+
+        v1, v2, v3 = tris[:, 0], tris[:, 1], tris[:, 2]
+        flat = tris.reshape(-1, 3)
+        self.min_c = np.minimum(self.min_c, flat.min(axis=0))
+        self.max_c = np.maximum(self.max_c, flat.max(axis=0))
+        self.volume += float(np.einsum('ij,ij->', v1, np.cross(v2, v3))) / 6.0
+        cross = np.cross(v2 - v1, v3 - v1)
+        norms = np.linalg.norm(cross, axis=1)
+        self.surface_area += 0.5 * float(norms.sum())
+        self.count += len(tris)
+
+        # Aşağı bakan yüzün XY izdüşüm alanı = -cross_z / 2
+        projected = np.where(cross[:, 2] < -self._overhang_sin * norms, -0.5 * cross[:, 2], 0.0)
+        z = tris[:, :, 2]
+        self.overhang_area += float(projected.sum())
+        self.overhang_moment += float(projected @ z.mean(axis=1))
+        # Tabla seviyesi düştüyse önceki "tabla" yüzleri artık havadadır
+        if self.min_c[2] < self._floor_z - self.BED_TOLERANCE_MM:
+            self._floor_z = self.min_c[2]
+            self._floor_area = 0.0
+        self._floor_area += float(projected[z.max(axis=1) <= self._floor_z + self.BED_TOLERANCE_MM].sum())
+        self._add_sample(tris)
+
+    def _add_sample(self, tris):
+        picked = tris if self._sample_stride == 1 else tris[self._rng.random(len(tris)) < 1.0 / self._sample_stride]
+        self._sample.append(picked)
+        self._sample_size += len(picked)
+        while self._sample_size > 2 * self.SAMPLE_TRIANGLES:
+            sample = np.concatenate(self._sample)
+            sample = sample[self._rng.random(len(sample)) < 0.5]
+            self._sample = [sample]
+            self._sample_size = len(sample)
+            self._sample_stride *= 2
+
+    def orientation_candidates(self):
+        if not self._sample_size:
+            return []
+        sample = np.concatenate(self._sample)
+        sample = sample - sample[0, 0]
+        # Üçgen üzerinde düzgün dağılım için E[x xᵀ] = (Σ vᵢvᵢᵀ + 9 c cᵀ) / 12, alan ağırlıklı
+        weights = 0.5 * np.linalg.norm(np.cross(sample[:, 1] - sample[:, 0], sample[:, 2] - sample[:, 0]), axis=1)
+        points = sample.reshape(-1, 3)
+        centroids = sample.mean(axis=1)
+        total = max(float(weights.sum()), 1e-12)
+        mean = (weights @ centroids) / total
+        second = ((points * np.repeat(weights, 3)[:, None]).T @ points
+                  + 9.0 * (centroids * weights[:, None]).T @ centroids) / (12.0 * total)
+        _, vectors = np.linalg.eigh(second - np.outer(mean, mean))
+        # PCA eksenleri (satırlar, büyükten küçüğe) ikinci aday çerçeve
+        rotations = candidate_rotations([np.eye(3), vectors[:, ::-1].T], self.orientation_step_deg)
+        volumes = oriented_box_volumes(points, rotations)
+        best = np.argsort(volumes, kind="stable")[:self.ORIENTATION_CANDIDATES]
+        return rotations[best].tolist()
+
+    def result(self):
+        dims = self.max_c - self.min_c
+        finite = bool(np.all(np.isfinite(dims)))
+        support_area = max(self.overhang_area - self._floor_area, 0.0) if finite else 0.0
+        support_volume = max(self.overhang_moment - self.min_c[2] * self.overhang_area, 0.0) if finite else 0.0
+        return {
+            'triangle_count': int(self.count),
+            'dimensions_mm': dims.tolist() if finite else [0, 0, 0],
+            'volume_mm3': float(abs(self.volume)),
+            'surface_area_mm2': float(self.surface_area),
+            'bounding_box_volume_mm3': float(np.prod(dims)) if finite else 0.0,
+            'bounding_box_min_mm': self.min_c.tolist() if finite else [0, 0, 0],
+            'overhang_angle_deg': self.overhang_angle_deg,
+            'overhang_area_mm2': float(support_area),
+            'support_volume_mm3': float(support_volume),
+            'support_required': bool(support_area > 0.0),
+            'orientation_candidates': self.orientation_candidates(),
+            'preview': self.preview
+        }
+
+class STLStreamAnalyzer:
+    # Sırayla gelen byte bloklarını (upload ya da dosya okuma) artımlı analiz eder; binary veya ASCII.
+    # Üçgen sayısı sınırı yok: tampon en fazla bir blok (binary: chunk_triangles kayıt,
+    # ASCII: ascii_block_bytes) kadar büyür, süre dosya boyutuyla doğrusal.
+    # progress(bytes_processed, total_bytes) her işlenen bloktan sonra çağrılır (total bilinmiyorsa None).
+    # consumers: aynı (n, 3, 3) blokları alacak ek feed() sahibi nesneler (ör. STLPreviewBuilder)
+    def __init__(self, preview_limit=100, chunk_triangles=STL_CHUNK_TRIANGLES,
+                 ascii_block_bytes=STL_ASCII_BLOCK_BYTES, mode=None, total_bytes=None, progress=None,
+                 consumers=None):
+        self.acc = STLGeometryAccumulator(preview_limit)
+        self.consumers = [self.acc] + list(consumers or [])
+        self.chunk_bytes = chunk_triangles * STL_RECORD_DTYPE.itemsize
+        self.ascii_block_bytes = ascii_block_bytes
+        self.mode = mode
+        self.total_bytes = total_bytes
+        self.progress = progress
+        self.header_count = None
+        self.bytes_seen = 0
+        self.bytes_processed = 0
+        self._buf = bytearray()
+        self._pending = np.empty((0, 3), dtype=np.float64)
+
+    def feed(self, data):
+        self.bytes_seen += len(data)
+        self._buf += data
+        if self.mode is None:
+            if len(self._buf) < 512:
+                return
+            self._detect()
+        self._drain(final=False)
+
+    def finish(self):
+        if self.mode is None:
+            self._detect()
+        self._drain(final=True)
+        result = self.acc.result()
+        if self.mode == "ascii":
+            if self.acc.count == 0:
+                raise ValueError("Invalid ASCII STL file")
+            result['file_integrity'] = {'format': 'ascii', 'dangling_vertices': int(len(self._pending))}
+        else:
+            result['file_integrity'] = _stl_binary_integrity(self.header_count, self.acc.count, len(self._buf))
+        return result
+
+    def _emit(self, tris):
+        for consumer in self.consumers:
+            consumer.feed(tris)
+
+    def _report(self, consumed):
+        self.bytes_processed += consumed
+        if self.progress:
+            self.progress(self.bytes_processed, self.total_bytes)
+
+    def _detect(self):
+        self.mode = "ascii" if _looks_like_ascii_stl(bytes(self._buf[:512])) else "binary"
+
+    def _drain(self, final):
+        if self.mode == "ascii":
+            self._drain_ascii(final)
+        else:
+            self._drain_binary(final)
+
+    def _drain_binary(self, final):
+        itemsize = STL_RECORD_DTYPE.itemsize
+        if self.header_count is None:
+            if len(self._buf) < 84:
+                if final:
+                    raise ValueError("Invalid STL file")
+                return
+            self.header_count = struct.unpack_from("<I", self._buf, 80)[0]
+            del self._buf[:84]
+            self.bytes_processed += 84
+        if not final and len(self._buf) < self.chunk_bytes:
+            return
+        # Header sayısına değil, gelen tam kayıtlara göre işlenir; artık byte'lar finish()'te raporlanır
+        n = len(self._buf) // itemsize
+        if n > 0:
+            # astype kopyası sayesinde bytearray küçültülmeden önce buffer referansı bırakılmış olur
+            self._emit(np.frombuffer(self._buf, dtype=STL_RECORD_DTYPE, count=n)['vertices'].astype(np.float64))
+            del self._buf[:n * itemsize]
+            self._report(n * itemsize)
+
+    def _drain_ascii(self, final):
+        if not final and len(self._buf) < self.ascii_block_bytes:
+            return
+        if final:
+            data = bytes(self._buf)
+            self._buf = bytearray()
+        else:
+            cut = self._buf.rfind(b"\n") + 1
+            if cut == 0:
+                raise ValueError("Invalid ASCII STL file")
+            data = bytes(self._buf[:cut])
+            del self._buf[:cut]
+        self._report(len(data))
+        coords = _ASCII_VERTEX_RE.findall(data)
+        if not coords:
+            return
+        values = np.fromstring(b" ".join(coords).decode("ascii", errors="replace"), sep=" ")
+        if values.size != 3 * len(coords):
+            raise ValueError("Invalid ASCII STL vertex data")
+        # Blok sınırında üçgeni tamamlanmamış köşeler bir sonraki bloğa taşınır
+        verts = np.concatenate([self._pending, values.reshape(-1, 3)])
+        usable = len(verts) - len(verts) % 3
+        self._pending = verts[usable:]
+        self._emit(verts[:usable].reshape(-1, 3, 3))
+
+
+# Önizleme mesh ikili formatı (little-endian):
+#   magic "STLP" | version u16 | reserved u16 | vertex_count u32 | face_count u32
+#   origin 3*f32 | scale 3*f32 | vertices vertex_count*3*f16 ([0,1] normalize) | faces face_count*3*i32
+# Gerçek koordinat = origin + vertex * scale
+PREVIEW_MESH_MAGIC = b"STLP"
+PREVIEW_MESH_VERSION = 1
+_PREVIEW_HEADER = struct.Struct("<4sHHII3f3f")
+
+
+def encode_preview_mesh(vertices, faces):
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int32).reshape(-1, 3)
+    origin = vertices.min(axis=0) if len(vertices) else np.zeros(3)
+    scale = (vertices.max(axis=0) - origin) if len(vertices) else np.ones(3)
+    scale = np.where(scale > 0, scale, 1.0)
+    normalized = ((vertices - origin) / scale).astype('<f2')
+    header = _PREVIEW_HEADER.pack(PREVIEW_MESH_MAGIC, PREVIEW_MESH_VERSION, 0, len(vertices), len(faces),
+                                  *origin.tolist(), *scale.tolist())
+    return header + normalized.tobytes() + faces.astype('<i4').tobytes()
+
+
+def decode_preview_mesh(data):
+    magic, version, _, n_verts, n_faces, ox, oy, oz, sx, sy, sz = _PREVIEW_HEADER.unpack_from(data, 0)
+    if magic != PREVIEW_MESH_MAGIC or version != PREVIEW_MESH_VERSION:
+        raise ValueError("Invalid preview mesh")
+    offset = _PREVIEW_HEADER.size
+    normalized = np.frombuffer(data, dtype='<f2', count=n_verts * 3, offset=offset).reshape(-1, 3)
+    faces = np.frombuffer(data, dtype='<i4', count=n_faces * 3, offset=offset + n_verts * 6).reshape(-1, 3)
+    vertices = np.array([ox, oy, oz]) + normalized.astype(np.float64) * np.array([sx, sy, sz])
+    return vertices, faces
+
+
+class STLPreviewBuilder:
+    # Vertex clustering decimation: bbox küp hücrelere bölünür, her hücredeki köşeler ortalamaya indirgenir.
+    # Bloklar halinde beslenir (hücre başına toplamlar np.bincount ile), tüm modeli kapsar.
+    def __init__(self, bbox_min, bbox_max, target_triangles=5000):
+        self.target = max(int(target_triangles), 4)
+        self.origin = np.asarray(bbox_min, dtype=np.float64)
+        span = np.maximum(np.asarray(bbox_max, dtype=np.float64) - self.origin, 0.0)
+        # Kapalı yüzeyde üçgen sayısı ~ 2-12 * res^2; düşük tahminle başlanır, fazlası build()'de inceltilir
+        res = max(int(np.sqrt(self.target / 2.0)), 2)
+        self.cell = max(float(span.max()) / res, 1e-9)
+        self.shape = np.maximum(np.ceil(span / self.cell).astype(np.int64), 1)
+        n_cells = int(np.prod(self.shape))
+        self.sums = np.zeros((n_cells, 3), dtype=np.float64)
+        self.counts = np.zeros(n_cells, dtype=np.int64)
+        self._faces = []
+        self._face_rows = 0
+
+    def _cell_ids(self, points):
+        idx = np.floor((points - self.origin) / self.cell).astype(np.int64)
+        idx = np.clip(idx, 0, self.shape - 1)
+        return np.ravel_multi_index(idx.T, self.shape)
+
+    def feed(self, tris, normals=None):
+        points = np.asarray(tris, dtype=np.float64).reshape(-1, 3)
+        if len(points) == 0:
+            return
+        ids = self._cell_ids(points)
+        n_cells = len(self.counts)
+        self.counts += np.bincount(ids, minlength=n_cells)
+        for axis in range(3):
+            self.sums[:, axis] += np.bincount(ids, weights=points[:, axis], minlength=n_cells)
+        faces = ids.reshape(-1, 3)
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+        self._faces.append(_unique_faces(faces))
+        self._face_rows += len(self._faces[-1])
+        if len(self._faces) > 1 and self._face_rows > 8 * self.target:
+            merged = _unique_faces(np.concatenate(self._faces))
+            self._faces, self._face_rows = [merged], len(merged)
+
+    def build(self):
+        faces = _unique_faces(np.concatenate(self._faces)) if self._faces else np.empty((0, 3), dtype=np.int64)
+        used, faces = np.unique(faces, return_inverse=True)
+        faces = faces.reshape(-1, 3)
+        vertices = self.sums[used] / np.maximum(self.counts[used], 1)[:, None]
+        if len(faces) > self.target and len(vertices):
+            # Hedef aşıldıysa küçük mesh daha kaba grid'le yeniden kümelenir (ucuz)
+            coarser = STLPreviewBuilder(vertices.min(axis=0), vertices.max(axis=0),
+                                        self.target * 0.5 * self.target / len(faces))
+            if len(coarser.counts) < len(self.counts):
+                coarser.target = self.target
+                coarser.feed(vertices[faces])
+                return coarser.build()
+        return vertices.astype(np.float32), faces.astype(np.int32)
+
+
+def _unique_faces(faces):
+    # Yön (normal) korunur; aynı köşe kümesine sahip yüzlerden ilki tutulur
+    if len(faces) == 0:
+        return faces.reshape(0, 3)
+    _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    return faces[np.sort(first)]
+
+
+class MeshTopologyCollector:
+    # Kenar topolojisi kontrolü: köşeler float32 bit deseniyle kaynaklanır (weld), kenar anahtarları
+    # np.unique ile sayılır -> O(n log n). Açık (1 yüz), manifold olmayan (>2 yüz) ve sarım yönü
+    # çelişen kenarları; binary STL'de kayıtlı normali sarıma ters düşen yüzleri sayar.
+    def __init__(self, max_triangles=5_000_000):
+        self.max_triangles = max_triangles
+        self.count = 0
+        self.skipped = False
+        self._verts = []
+        self.flipped_normals = 0
+        self.has_normals = True
+        self.signed_volume = 0.0
+
+    def feed(self, tris, normals=None):
+        tris = np.asarray(tris, dtype=np.float64)
+        if len(tris) == 0:
+            return
+        self.count += len(tris)
+        v1, v2, v3 = tris[:, 0], tris[:, 1], tris[:, 2]
+        self.signed_volume += float(np.einsum('ij,ij->', v1, np.cross(v2, v3))) / 6.0
+        if normals is None:
+            self.has_normals = False
+        else:
+            stored = np.asarray(normals, dtype=np.float64)
+            winding = np.cross(v2 - v1, v3 - v1)
+            # Sıfır normal yazan exporter'lar yok sayılır
+            has_stored = np.any(stored != 0, axis=1)
+            self.flipped_normals += int(np.count_nonzero(has_stored & (np.einsum('ij,ij->i', stored, winding) < 0)))
+        if self.count > self.max_triangles:
+            self.skipped = True
+            self._verts = []
+        if not self.skipped:
+            # -0.0 ile 0.0 aynı bit desenine insin diye + 0.0
+            self._verts.append(tris.astype(np.float32) + np.float32(0.0))
+
+    def result(self):
+        health = {
+            "triangle_count": int(self.count),
+            "flipped_normals": int(self.flipped_normals) if self.has_normals else None,
+            "inverted": False,
+            "checked": not self.skipped
+        }
+        if self.skipped or not self._verts:
+            return health
+        verts = np.ascontiguousarray(np.concatenate(self._verts).reshape(-1, 3))
+        self._verts = []
+        keys = verts.view(np.dtype((np.void, verts.dtype.itemsize * 3))).ravel()
+        _, vertex_ids = np.unique(keys, return_inverse=True)
+        faces = vertex_ids.reshape(-1, 3).astype(np.int64)
+
+        degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 0] == faces[:, 2])
+        faces = faces[~degenerate]
+        a = faces.reshape(-1)
+        b = faces[:, [1, 2, 0]].reshape(-1)
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        edge_keys = lo * (int(vertex_ids.max()) + 1) + hi
+        # Yönlü kenar a->b, a<b ise +1, değilse -1; tutarlı sarımda ortak kenarın toplamı 0 olur
+        direction = np.where(a < b, 1, -1)
+        uniq, inverse, counts = np.unique(edge_keys, return_inverse=True, return_counts=True)
+        direction_sum = np.bincount(inverse.ravel(), weights=direction, minlength=len(uniq))
+
+        boundary = int(np.count_nonzero(counts == 1))
+        non_manifold = int(np.count_nonzero(counts > 2))
+        inconsistent = int(np.count_nonzero((counts == 2) & (direction_sum != 0)))
+        watertight = boundary == 0 and non_manifold == 0
+        health.update({
+            "vertex_count": int(vertex_ids.max()) + 1,
+            "edge_count": int(len(uniq)),
+            "degenerate_faces": int(np.count_nonzero(degenerate)),
+            "boundary_edges": boundary,
+            "non_manifold_edges": non_manifold,
+            "inconsistent_winding_edges": inconsistent,
+            "inverted": bool(watertight and inconsistent == 0 and self.signed_volume < 0),
+            "watertight": watertight,
+            # Hacim (ve ondan türeyen ağırlık/fiyat) yalnızca kapalı ve tutarlı yönlü mesh'te güvenilir
+            "volume_reliable": watertight and inconsistent == 0
+        })
+        return health
+
+
+class OrientedBoundsCollector:
+    # Verilen aday rotasyonlar (ve her zaman birim matris) için tüm köşeler üzerinden kesin
+    # yönlendirilmiş kutu boyutları; sonuç en küçük hacimli aday, boyutlar küçükten büyüğe sıralı
+    def __init__(self, rotations=None):
+        candidates = [np.eye(3)] + [np.asarray(r, dtype=np.float64) for r in (rotations or [])]
+        self.rotations = np.array(candidates)
+        self._axes = self.rotations.reshape(-1, 3).T.copy()
+        self.lo = np.full(self._axes.shape[1], np.inf)
+        self.hi = np.full(self._axes.shape[1], -np.inf)
+
+    def feed(self, tris, normals=None):
+        if len(tris) == 0:
+            return
+        projected = np.asarray(tris, dtype=np.float64).reshape(-1, 3) @ self._axes
+        np.minimum(self.lo, projected.min(axis=0), out=self.lo)
+        np.maximum(self.hi, projected.max(axis=0), out=self.hi)
+
+    def result(self):
+        extents = (self.hi - self.lo).reshape(-1, 3)
+        if not np.all(np.isfinite(extents)):
+            return {}
+        volumes = np.prod(extents, axis=1)
+        best = int(np.argmin(volumes))
+        return {
+            'oriented_extents_mm': np.round(np.sort(extents[best]), 3).tolist(),
+            'oriented_box_volume_mm3': float(volumes[best]),
+            # Firestore iç içe dizi kabul etmez: 3x3 dönüş matrisi satır sırasıyla 9 float
+            'oriented_rotation': self.rotations[best].ravel().tolist()
+        }
+
+
+class LayerProfileCollector:
+    # Modeli yükseklik boyunca eşit z-dilimlerine (slab) böler; her dilim için
+    #   perimeter_mm2: ∫ çevre(z) dz  -> dilimdeki katman başına duvar yolu = perimeter / slab
+    #   volume_mm3:    ∫ kesit(z) dz  -> dilimdeki katman başına dolgu alanı = volume / slab
+    # Her yüzün katkısı kendi [zmin, zmax] aralığına düzgün yayılır. Aralık integralleri, olay
+    # noktalarının (zmin: +, zmax: -) ağırlıklı momentleri bincount ile toplanıp kümülatif alınarak
+    # bulunur; tek geçiş, dilim sayısından bağımsız O(n).
+    def __init__(self, z_min, z_max, bins=200):
+        self.z_min = float(z_min)
+        self.bins = max(int(bins), 1)
+        self.slab = max(float(z_max) - self.z_min, 1e-6) / self.bins
+        # Her ölçü için 3 moment (Σw, Σw·p, Σw·p²); sonuncu yalnızca kesit (rampa) için gerekir
+        self._perimeter = np.zeros((2, self.bins + 1))
+        self._section = np.zeros((3, self.bins + 1))
+        self._section_step = np.zeros((2, self.bins + 1))
+
+    def _add(self, moments, positions, weights):
+        idx = np.clip((positions / self.slab).astype(np.int64), 0, self.bins)
+        for order in range(len(moments)):
+            moments[order] += np.bincount(idx, weights=weights * positions ** order, minlength=self.bins + 1)
+
+    def feed(self, tris, normals=None):
+        tris = np.asarray(tris, dtype=np.float64)
+        if len(tris) == 0:
+            return
+        v1, v2, v3 = tris[:, 0], tris[:, 1], tris[:, 2]
+        cross = np.cross(v2 - v1, v3 - v1)
+        area = 0.5 * np.linalg.norm(cross, axis=1)
+        z = tris[:, :, 2] - self.z_min
+        lo, hi = z.min(axis=1), z.max(axis=1)
+        height = hi - lo
+        flat = height < 1e-9
+        tall = ~flat
+
+        # Çevre: yan yüzey alanının yatay bileşeni (dikey duvar tam, yatay yüz sıfır katkı)
+        side = np.sqrt(np.maximum(area ** 2 - (0.5 * cross[:, 2]) ** 2, 0.0))
+        density = side[tall] / height[tall]
+        self._add(self._perimeter, lo[tall], density)
+        self._add(self._perimeter, hi[tall], -density)
+
+        # Kesit alanı: A(z) = -Σ s_i · F_i(z); s = işaretli XY izdüşüm alanı, F_i yüzün z'nin altında kalan oranı
+        signed = 0.5 * cross[:, 2]
+        ramp = -signed[tall] / height[tall]
+        self._add(self._section, lo[tall], ramp)
+        self._add(self._section, hi[tall], -ramp)
+        self._add(self._section_step, lo[flat], -signed[flat])
+
+    def result(self):
+        edges = np.arange(self.bins + 1) * self.slab
+        # Kenar e'de yalnızca p < e olan olaylar: idx < k -> dışlayıcı kümülatif toplam
+        def cumulative(moments):
+            return np.concatenate([np.zeros((len(moments), 1)), np.cumsum(moments, axis=1)[:, :-1]], axis=1)
+        p0, p1 = cumulative(self._perimeter)
+        # G(e) = Σ w·(e - p)+  ->  ∫ yoğunluk, dilim integrali = G(e[k+1]) - G(e[k])
+        perimeter = np.diff(edges * p0 - p1)
+        s0, s1, s2 = cumulative(self._section)
+        t0, t1 = cumulative(self._section_step)
+        # Rampa için ∫F = Σ w·(e - p)²/2, basamak için Σ w·(e - p)
+        section = np.diff(0.5 * (edges ** 2 * s0 - 2 * edges * s1 + s2) + (edges * t0 - t1))
+        return {
+            'z_min_mm': self.z_min,
+            'slab_mm': float(self.slab),
+            'perimeter_mm2': np.round(np.maximum(perimeter, 0.0), 3).tolist(),
+            'volume_mm3': np.round(np.maximum(section, 0.0), 3).tolist()
+        }
+
+
+class MeshRasterizer:
+    # GPU'suz, saf NumPy z-buffer rasterizer: izometrik ortografik görünüm, düz (flat) Lambert gölgeleme.
+    # Üçgenler, bbox piksel adayları sınırlı batch'ler halinde açılarak barycentric testle çizilir.
+    MAX_CANDIDATES = 1_000_000
+
+    def __init__(self, size=256, background=(245, 245, 245), color=(70, 130, 200), margin=0.06):
+        self.size = int(size)
+        self.background = np.array(background, dtype=np.float64)
+        self.color = np.array(color, dtype=np.float64)
+        self.margin = margin
+        yaw, pitch = np.radians(45.0), np.radians(35.264)
+        rz = np.array([[np.cos(yaw), -np.sin(yaw), 0], [np.sin(yaw), np.cos(yaw), 0], [0, 0, 1]])
+        rx = np.array([[1, 0, 0], [0, np.cos(pitch), -np.sin(pitch)], [0, np.sin(pitch), np.cos(pitch)]])
+        # Model Z ekseni yukarı: önce Z etrafında döndür, sonra kameraya doğru eğ, ekran y'si = model z
+        self.view = rx @ rz
+        # Görünüm uzayında ışık: kameranın (-y) sol-üst tarafından
+        self.light = np.array([-0.4, -1.0, 0.6]) / np.linalg.norm([-0.4, -1.0, 0.6])
+
+    def render(self, vertices, faces):
+        size = self.size
+        zbuf = np.full(size * size, -np.inf)
+        shade = np.zeros(size * size)
+        tris = np.asarray(vertices, dtype=np.float64)[np.asarray(faces, dtype=np.int64)]
+        if len(tris):
+            # (x, z_model) ekrana, y_model derinliğe gider
+            p = tris @ self.view.T
+            screen = p[..., [0, 2]]
+            depth = -p[..., 1]
+            lo = screen.reshape(-1, 2).min(axis=0)
+            span = max(float((screen.reshape(-1, 2).max(axis=0) - lo).max()), 1e-9)
+            scale = size * (1.0 - 2 * self.margin) / span
+            offset = (size - (screen.reshape(-1, 2).max(axis=0) - lo) * scale) / 2.0
+            xy = (screen - lo) * scale + offset
+            xy[..., 1] = size - xy[..., 1]
+
+            normals = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+            norms = np.linalg.norm(normals, axis=1)
+            normals = normals / np.where(norms > 0, norms, 1.0)[:, None]
+            # STL normalleri güvenilmez; çift taraflı aydınlatma
+            intensity = 0.25 + 0.75 * np.abs(normals @ self.light)
+            self._raster(xy, depth, intensity, zbuf, shade)
+
+        covered = np.isfinite(zbuf)
+        image = np.tile(self.background, (size * size, 1))
+        image[covered] = self.color * shade[covered, None]
+        return image.reshape(size, size, 3).clip(0, 255).astype(np.uint8)
+
+    def _raster(self, xy, depth, intensity, zbuf, shade):
+        size = self.size
+        x0 = np.clip(np.floor(xy[..., 0].min(axis=1)), 0, size - 1).astype(np.int64)
+        x1 = np.clip(np.ceil(xy[..., 0].max(axis=1)), 0, size - 1).astype(np.int64)
+        y0 = np.clip(np.floor(xy[..., 1].min(axis=1)), 0, size - 1).astype(np.int64)
+        y1 = np.clip(np.ceil(xy[..., 1].max(axis=1)), 0, size - 1).astype(np.int64)
+        w = x1 - x0 + 1
+        counts = w * (y1 - y0 + 1)
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(counts):
+            base = ends[start - 1] if start else 0
+            stop = max(int(np.searchsorted(ends, base + self.MAX_CANDIDATES, side='right')), start + 1)
+            idx = np.arange(start, stop)
+            tri = np.repeat(idx, counts[idx])
+            local = np.arange(len(tri)) - np.repeat(np.cumsum(counts[idx]) - counts[idx], counts[idx])
+            px = x0[tri] + local % w[tri]
+            py = y0[tri] + local // w[tri]
+
+            a, b, c = xy[tri, 0], xy[tri, 1], xy[tri, 2]
+            cx, cy = px + 0.5, py + 0.5
+            area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+            valid = np.abs(area) > 1e-12
+            area = np.where(valid, area, 1.0)
+            w0 = ((b[:, 0] - cx) * (c[:, 1] - cy) - (b[:, 1] - cy) * (c[:, 0] - cx)) / area
+            w1 = ((c[:, 0] - cx) * (a[:, 1] - cy) - (c[:, 1] - cy) * (a[:, 0] - cx)) / area
+            w2 = 1.0 - w0 - w1
+            inside = valid & (w0 >= -1e-9) & (w1 >= -1e-9) & (w2 >= -1e-9)
+
+            tri, px, py = tri[inside], px[inside], py[inside]
+            z = (w0[inside] * depth[tri, 0] + w1[inside] * depth[tri, 1] + w2[inside] * depth[tri, 2])
+            pix = py * size + px
+            # Her piksel için en yakın (en büyük z) aday; sonra mevcut z-buffer ile kıyas
+            order = np.lexsort((-z, pix))
+            pix, first = np.unique(pix[order], return_index=True)
+            z, tri = z[order][first], tri[order][first]
+            closer = z > zbuf[pix]
+            zbuf[pix[closer]] = z[closer]
+            shade[pix[closer]] = intensity[tri[closer]]
+            start = stop
+
+    def render_png(self, vertices, faces):
+        buf = io.BytesIO()
+        Image.fromarray(self.render(vertices, faces), 'RGB').save(buf, 'PNG', optimize=True)
+        return buf.getvalue()
+
+
+class STLIngestFile:
+    # Werkzeug multipart parser'ının upload'u yazdığı dosya: diske blok blok yazar ve aynı geçişte SHA-256 hesaplar
+    # (ikinci bir bellek/disk tamponu yok). Geometri analizi burada yapılmaz: cache kaçağında process pool'da çalışır.
+    def __init__(self, path, total_bytes=None, progress=None):
+        self.path = path
+        self._file = open(path, "w+b")
+        self._sha = hashlib.sha256()
+        self.total_bytes = total_bytes
+        self.progress = progress
+        self.size = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self._sha.update(data)
+        self.size += len(data)
+        if self.progress:
+            self.progress(self.size, self.total_bytes)
+        return len(data)
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+    def close(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as ex:
+                logger.warning(f"Failed to delete ingest file {self.path}: {ex}")
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class STLUploadRequest(Request):
+    # .stl parçalarını Werkzeug'un SpooledTemporaryFile'ı yerine doğrudan STLIngestFile'a yazdırır
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and Path(filename).suffix.lower() in current_app.config['ALLOWED_STL']:
+            total = content_length or total_content_length
+            return STLIngestFile(get_temp_path(f"temp_{uuid.uuid4().hex}_{secure_filename(filename)}"),
+                                 total_bytes=total, progress=self._progress_emitter())
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+    def _progress_emitter(self):
+        # Yükleme ilerlemesi, kullanıcının Socket.IO odasına en fazla %5 adımlarla gönderilir
+        socketio = getattr(current_app, "socketio", None)
+        user_id = (getattr(g, "user", None) or {}).get("id")
+        if socketio is None or not user_id:
+            return None
+        last = {"percent": -5}
+
+        def emit_progress(done, total):
+            percent = int(done * 100 / total) if total else None
+            if percent is not None and percent - last["percent"] < 5:
+                return
+            last["percent"] = percent if percent is not None else last["percent"]
+            socketio.emit('stl_upload_progress', {
+                "bytes_processed": done,
+                "total_bytes": total,
+                "percent": min(percent, 100) if percent is not None else None
+            }, room=f"user_{user_id}")
+        return emit_progress
+
+
+class STLAnalyzer:
+    @staticmethod
+    def _is_ascii_stl(file_path: str) -> bool:
+        with open(file_path, 'rb') as f:
+            start = f.read(512)
+        return _looks_like_ascii_stl(start, os.path.getsize(file_path))
+
+    @staticmethod
+    def _read_binary_header(f):
+        header = f.read(80)
+        count_bytes = f.read(4)
+        if len(count_bytes) < 4:
+            raise ValueError("Invalid STL file")
+        return header, struct.unpack("<I", count_bytes)[0]
+
+    @staticmethod
+    def iter_binary_chunks(f, count, chunk_triangles=STL_CHUNK_TRIANGLES):
+        # Sabit boyutlu tampona readinto + frombuffer: blok başına tek kopya, bellek sınırlı
+        itemsize = STL_RECORD_DTYPE.itemsize
+        buf = bytearray(chunk_triangles * itemsize)
+        remaining = count
+        while remaining > 0:
+            want = min(remaining, chunk_triangles) * itemsize
+            got = f.readinto(memoryview(buf)[:want])
+            n = (got or 0) // itemsize
+            if n == 0:
+                break
+            yield np.frombuffer(buf, dtype=STL_RECORD_DTYPE, count=n)
+            remaining -= n
+            if got < want:
+                break
+
+    @staticmethod
+    def analyze_stl_binary_vectorized(file_path, preview_limit=100, chunk_triangles=STL_CHUNK_TRIANGLES,
+                                      progress=None):
+        itemsize = STL_RECORD_DTYPE.itemsize
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            _, header_count = STLAnalyzer._read_binary_header(f)
+            # Header'a güvenmeden dosyadaki tüm tam kayıtlar okunur
+            record_count = (size - 84) // itemsize
+            acc = STLGeometryAccumulator(preview_limit)
+            for records in STLAnalyzer.iter_binary_chunks(f, record_count, chunk_triangles):
+                acc.feed(records['vertices'])
+                if progress:
+                    progress(84 + acc.count * itemsize, size)
+        result = acc.result()
+        result['file_integrity'] = _stl_binary_integrity(header_count, acc.count, size - 84 - acc.count * itemsize)
+        return result
+
+    @staticmethod
+    def analyze_stl_ascii_streaming(file_path, preview_limit=100, block_bytes=STL_ASCII_BLOCK_BYTES,
+                                    progress=None):
+        analyzer = STLStreamAnalyzer(preview_limit, ascii_block_bytes=block_bytes, mode="ascii",
+                                     total_bytes=os.path.getsize(file_path), progress=progress)
+        with open(file_path, "rb") as f:
+            while True:
+                block = f.read(block_bytes)
+                if not block:
+                    break
+                analyzer.feed(block)
+        return analyzer.finish()
+
+    # Eski üçgen-başına yol (2M üçgende kesiliyor); yalnızca benchmark referansı olarak duruyor
+    @staticmethod
+    def analyze_stl_binary_streaming(file_path, preview_limit=100, triangle_limit=2_000_000):
+        with open(file_path, "rb") as f:
+            header = f.read(80)
+            count_bytes = f.read(4)
+            if len(count_bytes) < 4:
+                raise ValueError("Invalid STL file")
+            count = struct.unpack("<I", count_bytes)[0]
+
+            preview = []
+            count_read = 0
+            min_c = np.array([np.inf, np.inf, np.inf], dtype=np.float64)
+            max_c = -min_c
+            volume = 0.0
+            surface_area = 0.0
+
+            to_read = min(count, triangle_limit)
+            for i in range(to_read):
+                rec = f.read(50)
+                if len(rec) < 50:
+                    break
+                data = struct.unpack("<12fH", rec)
+                v1 = np.array(data[3:6], dtype=np.float64)
+                v2 = np.array(data[6:9], dtype=np.float64)
+                v3 = np.array(data[9:12], dtype=np.float64)
+
+                if len(preview) < preview_limit:
+                    preview.append([v1.tolist(), v2.tolist(), v3.tolist()])
+
+                min_c = np.minimum(min_c, np.minimum(v1, np.minimum(v2, v3)))
+                max_c = np.maximum(max_c, np.maximum(v1, np.maximum(v2, v3)))
+                volume += np.dot(v1, np.cross(v2, v3)) / 6.0
+                surface_area += 0.5 * np.linalg.norm(np.cross(v2 - v1, v3 - v1))
+                count_read += 1
+
+            dims = (max_c - min_c)
+            return {
+                'triangle_count': int(count_read),
+                'dimensions_mm': dims.tolist() if np.all(np.isfinite(dims)) else [0, 0, 0],
+                'volume_mm3': float(abs(volume)),
+                'surface_area_mm2': float(surface_area),
+                'bounding_box_volume_mm3': float(np.prod(dims)) if np.all(np.isfinite(dims)) else 0.0,
+                'preview': preview
+            }
+
+    @staticmethod
+    def scan_triangles(file_path, consumers, chunk_triangles=STL_CHUNK_TRIANGLES):
+        # Dosyayı tekrar blok blok okuyup üçgenleri ek tüketicilere (preview, vb.) dağıtır
+        if STLAnalyzer._is_ascii_stl(file_path):
+            analyzer = STLStreamAnalyzer(preview_limit=0, mode="ascii", consumers=consumers)
+            with open(file_path, "rb") as f:
+                while True:
+                    block = f.read(STL_ASCII_BLOCK_BYTES)
+                    if not block:
+                        break
+                    analyzer.feed(block)
+            analyzer.finish()
+            return
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            STLAnalyzer._read_binary_header(f)
+            record_count = (size - 84) // STL_RECORD_DTYPE.itemsize
+            for records in STLAnalyzer.iter_binary_chunks(f, record_count, chunk_triangles):
+                tris = records['vertices'].astype(np.float64)
+                normals = records['normal'].astype(np.float64)
+                for consumer in consumers:
+                    consumer.feed(tris, normals)
+
+    @staticmethod
+    def analyze_model_geometry(file_path, progress=None):
+        if STLAnalyzer._is_ascii_stl(file_path):
+            return STLAnalyzer.analyze_stl_ascii_streaming(file_path, progress=progress)
+        return STLAnalyzer.analyze_stl_binary_vectorized(file_path, progress=progress)
+
+    @staticmethod
+    def estimate_print_time(analysis, layer_height_mm=0.2, infill_density=0.2):
+        # layer_profile üzerinden katman katman süre (dakika); profil yoksa None
+        profile = (analysis or {}).get('layer_profile')
+        if not profile or not profile.get('volume_mm3'):
+            return None
+        layer_height = min(max(float(layer_height_mm), 0.05), 1.0)
+        infill = min(max(float(infill_density), 0.0), 1.0)
+        line_width = Config.PRINT_LINE_WIDTH_MM
+        slab = float(profile['slab_mm'])
+        perimeter = np.asarray(profile['perimeter_mm2'], dtype=np.float64) / slab
+        section = np.asarray(profile['volume_mm3'], dtype=np.float64) / slab
+
+        wall_s = Config.PRINT_WALL_COUNT * perimeter / Config.PRINT_WALL_SPEED_MM_S
+        # Dolgu: duvarların içinde kalan alan, çizgi aralığı line_width / infill
+        infill_area = np.maximum(section - Config.PRINT_WALL_COUNT * line_width * perimeter, 0.0)
+        infill_s = infill_area * infill / line_width / Config.PRINT_INFILL_SPEED_MM_S
+        layer_s = np.where(section > 0, wall_s + infill_s + Config.PRINT_LAYER_CHANGE_S, 0.0)
+        layer_s = np.where(section > 0, np.maximum(layer_s, Config.PRINT_MIN_LAYER_TIME_S), 0.0)
+        total_s = float((layer_s * (slab / layer_height)).sum())
+
+        support_mm3 = float(analysis.get('support_volume_mm3', 0.0)) * Config.SUPPORT_DENSITY
+        total_s += support_mm3 / (line_width * layer_height) / Config.PRINT_INFILL_SPEED_MM_S
+        return total_s / 60.0
+
+    @staticmethod
+    def estimate_print_properties(analysis, material_density=1.24):
+        if not analysis:
+            return {}
+        volume_cm3 = analysis.get('volume_mm3', 0) / 1000.0
+        weight = volume_cm3 * material_density
+        support_weight = analysis.get('support_volume_mm3', 0) / 1000.0 * material_density * Config.SUPPORT_DENSITY
+        triangle_count = analysis.get('triangle_count', 0)
+        complexity = min(triangle_count / 1000.0, 3.0)
+        est_time = STLAnalyzer.estimate_print_time(analysis)
+        if est_time is None:
+            base_time = volume_cm3 * 2.0
+            est_time = base_time + (base_time * 0.5 * complexity)
+        difficulty = "Kolay" if complexity < 1 else "Orta" if complexity < 2 else "Zor"
+        return {
+            'estimated_weight_g': float(weight),
+            'estimated_support_weight_g': float(support_weight),
+            'estimated_print_time_minutes': float(est_time),
+            'print_difficulty': difficulty,
+            'complexity_score': float(complexity)
         }
 
+# ---------- STL ANALYSIS SERVICE ----------
+class AnalysisQueueFull(Exception):
+    pass
+
+
+def _analyze_stl_job(file_path):
+    # Worker process'te çalışır (pickle edilebilmesi için modül seviyesinde)
+    geometry = STLAnalyzer.analyze_model_geometry(file_path)
+    return geometry, STLAnalyzer.estimate_print_properties(geometry)
+
+
+def _mesh_postprocess_job(file_path, bbox_min, bbox_max, options):
+    # Geometri (bbox) bilindikten sonra ikinci blok geçişi: bbox'a bağlı türetilmiş çıktılar
+    preview = STLPreviewBuilder(bbox_min, bbox_max, options.get("preview_triangles", 5000))
+    topology = MeshTopologyCollector(options.get("mesh_health_max_triangles", 5_000_000))
+    layers = LayerProfileCollector(bbox_min[2], bbox_max[2], options.get("layer_profile_bins", 200))
+    bounds = OrientedBoundsCollector(options.get("orientation_candidates"))
+    STLAnalyzer.scan_triangles(file_path, [preview, topology, layers, bounds])
+    vertices, faces = preview.build()
+    result = {
+        "preview_mesh": encode_preview_mesh(vertices, faces),
+        "preview_mesh_triangles": int(len(faces)),
+        "mesh_health": topology.result(),
+        "layer_profile": layers.result(),
+        "oriented_bounds": bounds.result()
+    }
+    # Küçük resim, tüm modeli kapsayan decimate mesh üzerinden çizilir (milyonlarca üçgen yerine birkaç bin)
+    if len(faces) and options.get("thumbnail_size"):
+        result["thumbnail_png"] = MeshRasterizer(options["thumbnail_size"]).render_png(vertices, faces)
+    return result
+
+
+class STLAnalysisService:
+    # Sınırlı ProcessPoolExecutor: ağır NumPy analizi request thread'inin GIL'ini tutmasın
+    def __init__(self, max_workers=2, max_queue=8, timeout=120.0, start_method="spawn"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout = timeout
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+        # Slot iş bitince (timeout olsa bile) bırakılır; böylece bekleyen+çalışan iş sayısı sınırlı kalır
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.retried = 0
+        self.total_seconds = 0.0
+        # Başka bir işin timeout'u yüzünden sonlandırılan pool'lar; oradaki işler suçsuz, bir kez yeniden denenir
+        self._recycled = weakref.WeakSet()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                ctx = multiprocessing.get_context(self.start_method) if self.start_method else None
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+            return self._executor
+
+    def _on_done(self, started, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.total_seconds += time.monotonic() - started
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+        self._slots.release()
+
+    def analyze(self, file_path):
+        return self.run(_analyze_stl_job, file_path)
+
+    def postprocess(self, file_path, geometry, options):
+        bbox_min = np.asarray(geometry.get('bounding_box_min_mm', [0, 0, 0]), dtype=np.float64)
+        bbox_max = bbox_min + np.asarray(geometry.get('dimensions_mm', [0, 0, 0]), dtype=np.float64)
+        options = {**options, "orientation_candidates": geometry.get('orientation_candidates')}
+        return self.run(_mesh_postprocess_job, file_path, bbox_min.tolist(), bbox_max.tolist(), options)
+
+    def run(self, fn, *args, retry=True):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise AnalysisQueueFull("STL analysis queue is full")
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception as e:
+            self._slots.release()
+            if not isinstance(e, BrokenProcessPool):
+                raise
+            # İş henüz gönderilmeden pool bozulmuştu: yeni pool'da bir kez denenir
+            self._discard_executor(executor)
+            if not retry:
+                raise
+            with self._lock:
+                self.retried += 1
+            return self.run(fn, *args, retry=False)
+        started = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+        future.add_done_callback(lambda fut: self._on_done(started, fut))
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            # Başlamış bir process işi cancel() ile durmaz: pool'un process'leri sonlandırılır; bekleyen
+            # future'lar BrokenProcessPool ile biter, slot'lar _on_done ile hemen geri verilir
+            with self._lock:
+                self.timed_out += 1
+            self._discard_executor(executor, terminate=True)
+            raise
+        except BrokenProcessPool:
+            # Worker öldüyse (OOM vb.) bir sonraki iş için pool yeniden kurulur. Pool başka bir işin timeout'u
+            # yüzünden sonlandırıldıysa bu iş yeni pool'da bir kez daha denenir; worker'ı kendisi düşürmüş
+            # olabilecek işler yeniden denenmez (çağıran 503 döner)
+            with self._lock:
+                recycled = executor in self._recycled
+            self._discard_executor(executor)
+            if recycled and retry:
+                with self._lock:
+                    self.retried += 1
+                return self.run(fn, *args, retry=False)
+            raise
+
+    def _discard_executor(self, executor, terminate=False):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if terminate:
+            with self._lock:
+                self._recycled.add(executor)
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            running = min(self.in_flight, self.max_workers)
+            finished = self.completed + self.failed
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "timeout_seconds": self.timeout,
+                "running": running,
+                "queue_depth": self.in_flight - running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "rejected": self.rejected,
+                "retried": self.retried,
+                "avg_seconds": round(self.total_seconds / finished, 3) if finished else 0.0
+            }
+
+# ---------- CACHES ----------
+class LRUCache:
+    # Thread-safe, boyut sınırlı LRU; hit/miss sayaçlı
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class TTLCache(LRUCache):
+    # LRU + giriş başına son kullanma süresi (time.monotonic)
+    def __init__(self, maxsize=256, ttl=300.0):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            with self._lock:
+                self._data.pop(key, None)
+                self.hits -= 1
+                self.misses += 1
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        super().set(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
+
+
+class QuoteCache:
+    # Fiyat teklifi memoizasyonu. Anahtar: (analiz parmak izi, malzeme id, malzeme sürümü, normalize parametreler).
+    # Malzeme sürümü price_per_gram'dan türetilir: fiyat değişince eski anahtarlar erişilemez olur ve
+    # invalidate_material ile hemen temizlenir.
+    def __init__(self, maxsize=2048, ttl=300.0):
+        self.entries = TTLCache(maxsize, ttl)
+
+    @staticmethod
+    def analysis_fingerprint(product):
+        if product.get("file_sha256"):
+            return f"{product['file_sha256']}:{product.get('analysis', {}).get('analysis_timestamp', '')}"
+        payload = json.dumps(product.get("analysis", {}), sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def material_version(material):
+        return f"{float(material.get('price_per_gram', 0.0))!r}:{material.get('updated_at', '')}"
+
+    @staticmethod
+    def normalize_params(params):
+        normalized = []
+        for key in sorted(params):
+            value = params[key]
+            if key == "support_required" or isinstance(value, bool):
+                normalized.append((key, bool(value)))
+            elif value is None:
+                normalized.append((key, None))
+            else:
+                normalized.append((key, round(float(value), 6)))
+        return tuple(normalized)
+
+    def key(self, fingerprint, material_id, material, params):
+        return (fingerprint, material_id, self.material_version(material), self.normalize_params(params))
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, pricing):
+        self.entries.set(key, pricing)
+
+    def invalidate_material(self, material_id):
+        return self.entries.discard_where(lambda key: key[1] == material_id)
+
+    def stats(self):
+        return {**self.entries.stats(), "ttl": self.entries.ttl}
+
+
+class MaterialsRegistry:
+    # Küçük ve nadiren değişen materials koleksiyonunun süreç içi kopyası. Açılışta yüklenir, Firestore
+    # on_snapshot ile güncel tutulur; dinleyici kurulamazsa poll_interval'de bir yeniden okunur.
+    # Değişiklikte on_change(material_id, old, new) çağrılır; etag liste içeriğinden türetilir.
+    def __init__(self, db, collection="materials", poll_interval=300.0):
+        self.db = db
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.mode = "stopped"
+        self._materials = {}
+        self._etag = None
+        self._lock = threading.Lock()
+        self._watch = None
+        self._stop = threading.Event()
+        self._poller = None
+        self._callbacks = []
+        self.reloads = 0
+        self.misses = 0
+
+    def on_change(self, callback):
+        self._callbacks.append(callback)
+
+    def start(self):
+        self.reload()
+        try:
+            self._watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+            self.mode = "listener"
+        except Exception as e:
+            logger.warning(f"Materials listener unavailable, polling every {self.poll_interval}s: {e}")
+            self._start_polling()
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+            self._watch = None
+        self.mode = "stopped"
+
+    def _start_polling(self):
+        self.mode = "polling"
+        self._poller = threading.Thread(target=self._poll_loop, name="materials-poller", daemon=True)
+        self._poller.start()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.warning(f"Materials reload failed: {e}")
+
+    def _on_snapshot(self, docs, changes, read_time):
+        self._replace({doc.id: doc.to_dict() for doc in docs})
+
+    def reload(self):
+        self._replace({doc.id: doc.to_dict() for doc in self.db.collection(self.collection).stream()})
+
+    def _replace(self, materials):
+        with self._lock:
+            previous = self._materials
+            self._materials = materials
+            payload = json.dumps(sorted(materials.items()), sort_keys=True, default=str)
+            self._etag = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+            self.reloads += 1
+        for material_id in set(previous) | set(materials):
+            old, new = previous.get(material_id), materials.get(material_id)
+            if old != new:
+                for callback in self._callbacks:
+                    try:
+                        callback(material_id, old, new)
+                    except Exception as e:
+                        logger.warning(f"Material change callback failed: {e}")
+
+    def get(self, material_id):
+        with self._lock:
+            material = self._materials.get(material_id)
+        if material is not None:
+            return dict(material)
+        # Dinleyici henüz yakalamamış yeni bir belge olabilir
+        self.misses += 1
+        doc = self.db.collection(self.collection).document(material_id).get()
+        if not doc.exists:
+            return None
+        material = doc.to_dict()
+        with self._lock:
+            self._materials = {**self._materials, material_id: material}
+        return dict(material)
+
+    def list(self):
+        with self._lock:
+            return [{**material, "id": material_id} for material_id, material in sorted(self._materials.items())]
+
+    @property
+    def etag(self):
+        with self._lock:
+            return self._etag
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._materials),
+                "mode": self.mode,
+                "reloads": self.reloads,
+                "misses": self.misses
+            }
+
+
+class DocumentIdentityMap:
+    # İstek ömürlü belge haritası (flask.g): aynı istekte aynı belge bir kez okunur, yerel yazımlar üzerine işlenir
+    def __init__(self):
+        self._docs = {}
+        self.reads_saved = 0
+
+    def lookup(self, collection, doc_ids):
+        found, missing = {}, []
+        for doc_id in doc_ids:
+            key = (collection, doc_id)
+            if key in self._docs:
+                found[doc_id] = copy.deepcopy(self._docs[key])
+            else:
+                missing.append(doc_id)
+        self.reads_saved += len(found)
+        return found, missing
+
+    def remember(self, collection, doc_id, data):
+        self._docs[(collection, doc_id)] = copy.deepcopy(data)
+
+    def apply_update(self, collection, doc_id, fields):
+        data = self._docs.get((collection, doc_id))
+        if data is None:
+            return
+        for path, value in fields.items():
+            target = data
+            parts = path.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = copy.deepcopy(value)
+
+    def forget(self, collection, doc_id):
+        self._docs.pop((collection, doc_id), None)
+
+
+class DocumentLoader:
+    # DataLoader tarzı toplu okuma: anahtarlar toplanır, tekrarlar atılır ve tek db.get_all round trip'iyle çözülür
+    BATCH_SIZE = 300
+
+    def __init__(self, db, collection):
+        self.db = db
+        self.collection = collection
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.documents = 0
+        self.reads_saved = 0
+
+    def load(self, doc_id, identity_map=None):
+        return self.load_many([doc_id], identity_map).get(doc_id)
+
+    def load_many(self, doc_ids, identity_map=None):
+        keys = list(dict.fromkeys(doc_id for doc_id in doc_ids if doc_id))
+        if identity_map is not None:
+            cached, keys = identity_map.lookup(self.collection, keys)
+            with self._lock:
+                self.reads_saved += len(cached)
+        else:
+            cached = {}
+        results = dict.fromkeys(keys)
+        col = self.db.collection(self.collection)
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            refs = [col.document(doc_id) for doc_id in keys[start:start + self.BATCH_SIZE]]
+            # get_all sırayı korumaz; sonuçlar belge id'si ile eşlenir
+            for doc in self.db.get_all(refs):
+                if doc.exists:
+                    results[doc.id] = {**(doc.to_dict() or {}), "id": doc.id}
+            with self._lock:
+                self.round_trips += 1
+                self.documents += len(refs)
+        if identity_map is not None:
+            # Bulunamayanlar da (None) hatırlanır
+            for doc_id, data in results.items():
+                identity_map.remember(self.collection, doc_id, data)
+        results.update(cached)
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {"round_trips": self.round_trips, "documents": self.documents, "reads_saved": self.reads_saved}
+
+
+class STLAnalysisCache:
+    # SHA-256 içerik anahtarlı analiz + IPFS cache: bellek içi LRU -> Firestore
+    def __init__(self, db, collection="stl_analysis_cache", maxsize=256):
+        self.db = db
+        self.collection = collection
+        self.memory = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.store_hits = 0
+        self.misses = 0
+
+    def get(self, content_hash):
+        entry = self.memory.get(content_hash)
+        if entry is not None:
+            return entry
+        try:
+            doc = self.db.collection(self.collection).document(content_hash).get()
+        except Exception as e:
+            logger.warning(f"STL cache read failed: {e}")
+            doc = None
+        if doc is None or not doc.exists:
+            with self._lock:
+                self.misses += 1
+            return None
+        entry = doc.to_dict() or {}
+        # Firestore iç içe dizi tutamadığı için preview JSON string olarak saklanıyor
+        entry["preview"] = json.loads(entry.pop("preview_json", None) or "[]")
+        self.memory.set(content_hash, entry)
+        with self._lock:
+            self.store_hits += 1
+        return entry
+
+    def put(self, content_hash, entry):
+        self.memory.set(content_hash, entry)
+        doc = {k: v for k, v in entry.items() if k != "preview"}
+        doc["preview_json"] = json.dumps(entry.get("preview") or [])
+        doc["cached_at"] = now_iso()
+        try:
+            self.db.collection(self.collection).document(content_hash).set(doc)
+        except Exception as e:
+            logger.warning(f"STL cache write failed: {e}")
+
+    def stats(self):
+        mem = self.memory.stats()
+        with self._lock:
+            hits = mem["hits"] + self.store_hits
+            total = hits + self.misses
+            return {
+                "memory": mem,
+                "store_hits": self.store_hits,
+                "hits": hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0
+            }
+
+# ---------- ORDER POOL INDEX ----------
+# Parça döndürülerek yerleştirilebilir: sıralı boyutlar sıralı tabla boyutlarıyla karşılaştırılır
+def part_extents(analysis):
+    return sorted(analysis.get("oriented_extents_mm") or analysis.get("dimensions_mm", [0, 0, 0]))
+
+
+def printer_capacities(printers):
+    # support_capable: False -> bu yazıcı destek basamıyor
+    return [
+        (tuple(sorted(printer.get("max_xyz", [200, 200, 200]))), bool(printer.get("support_capable", True)))
+        for printer in printers
+    ]
+
+
+def fits_capacities(extents, needs_support, capacities):
+    if not capacities:
+        return True  # printer belirtilmemişse varsayılan kabul
+    for max_xyz, support_capable in capacities:
+        if needs_support and not support_capable:
+            continue
+        if all(d <= m for d, m in zip(extents, max_xyz)):
+            return True
+    return False
+
+
+class PoolRecord:
+    # Havuzdaki sipariş başına tutulan tek bilgi; tam sipariş yalnızca dönen sayfa için okunur
+    __slots__ = ("order_id", "created_at", "material", "extents", "support_required")
+
+    def __init__(self, order_id, created_at, material, extents, support_required):
+        self.order_id = order_id
+        self.created_at = created_at
+        self.material = material
+        self.extents = extents
+        self.support_required = support_required
+
+    @property
+    def key(self):
+        return (self.created_at, self.order_id)
+
+
+class PendingPoolIndex:
+    # status == "pending" siparişlerin süreç içi indeksi: Firestore on_snapshot ile artımlı güncellenir,
+    # dinleyici kurulamazsa poll_interval'de bir yeniden kurulur. Malzeme -> (created_at, id) sıralı liste;
+    # kayıtlar sıralı boyutları taşır. Bellek: bekleyen sipariş başına ~0.45 KB (kayıt + id/tarih string'leri +
+    # boyut tuple'ı + dict/liste girdileri); 100k bekleyen sipariş ~45 MB.
+    def __init__(self, db, poll_interval=30.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.mode = "stopped"
+        self.ready = False
+        self._records = {}
+        self._by_material = {}
+        self._lock = threading.Lock()
+        self._watch = None
+        self._stop = threading.Event()
+        self._poller = None
+        self.resyncs = 0
+        self.updates = 0
+        self.product_reads = 0
+
+    def _query(self):
+        return self.db.collection("orders").where("status", "==", "pending")
+
+    def start(self):
+        try:
+            self._watch = self._query().on_snapshot(self._on_snapshot)
+            self.mode = "listener"
+        except Exception as e:
+            logger.warning(f"Pool index listener unavailable, polling every {self.poll_interval}s: {e}")
+            self.reload()
+            self.mode = "polling"
+            self._poller = threading.Thread(target=self._poll_loop, name="pool-index-poller", daemon=True)
+            self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+            self._watch = None
+        self.mode = "stopped"
+        self.ready = False
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.warning(f"Pool index reload failed: {e}")
+
+    def reload(self):
+        self._resync(list(self._query().stream()))
+
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            if not changes:
+                self._resync(docs)
+                return
+            removed = [change.document.id for change in changes if change.type.name == "REMOVED"]
+            records = self._build_records([change.document for change in changes if change.type.name != "REMOVED"])
+            with self._lock:
+                for order_id in removed:
+                    self._remove(order_id)
+                for record in records:
+                    self._remove(record.order_id)
+                    self._insert(record)
+                self.updates += len(changes)
+                self.ready = True
+        except Exception as e:
+            logger.warning(f"Pool index update failed, resyncing: {e}")
+            self._resync(docs)
+
+    def _resync(self, docs):
+        records = self._build_records(docs)
+        by_material = {}
+        for record in records:
+            by_material.setdefault(record.material, []).append(record.key)
+        for keys in by_material.values():
+            keys.sort()
+        with self._lock:
+            self._records = {record.order_id: record for record in records}
+            self._by_material = by_material
+            self.resyncs += 1
+            self.ready = True
+
+    def _build_records(self, docs):
+        orders = [(doc.id, doc.to_dict() or {}) for doc in docs]
+        # create_order extents_mm'i siparişe yazar; eski siparişler için ürünler toplu okunur
+        missing = list(dict.fromkeys(order.get("product_id") for _, order in orders
+                                     if order.get("extents_mm") is None and order.get("product_id")))
+        analyses = {}
+        if missing:
+            col = self.db.collection("products")
+            for doc in self.db.get_all([col.document(product_id) for product_id in missing]):
+                if doc.exists:
+                    analyses[doc.id] = (doc.to_dict() or {}).get("analysis", {})
+            self.product_reads += len(missing)
+        records = []
+        for order_id, order in orders:
+            extents = order.get("extents_mm")
+            if extents is None:
+                extents = part_extents(analyses.get(order.get("product_id"), {}))
+            records.append(PoolRecord(
+                order_id,
+                order.get("created_at") or "",
+                order.get("material_name"),
+                tuple(float(x) for x in sorted(extents)),
+                bool(order.get("support_required", False))
+            ))
+        return records
+
+    def _insert(self, record):
+        self._records[record.order_id] = record
+        bisect.insort(self._by_material.setdefault(record.material, []), record.key)
+
+    def _remove(self, order_id):
+        record = self._records.pop(order_id, None)
+        if record is None:
+            return
+        keys = self._by_material.get(record.material, [])
+        i = bisect.bisect_left(keys, record.key)
+        if i < len(keys) and keys[i] == record.key:
+            del keys[i]
+
+    def match(self, materials, printers, limit, after=None):
+        # Üreticinin malzemeleri için created_at sırasıyla birleştirilmiş tarama; (sipariş id'leri, sonraki imleç)
+        capacities = printer_capacities(printers)
+        start = tuple(after) if after else None
+        order_ids, cursor = [], None
+        with self._lock:
+            streams = []
+            for material in set(materials):
+                keys = self._by_material.get(material)
+                if keys:
+                    first = bisect.bisect_right(keys, start) if start else 0
+                    streams.append(itertools.islice(keys, first, None))
+            for key in heapq.merge(*streams):
+                if len(order_ids) == limit:
+                    return order_ids, list(cursor)
+                cursor = key
+                record = self._records[key[1]]
+                if fits_capacities(record.extents, record.support_required, capacities):
+                    order_ids.append(record.order_id)
+        return order_ids, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._records),
+                "materials": len(self._by_material),
+                "mode": self.mode,
+                "ready": self.ready,
+                "resyncs": self.resyncs,
+                "updates": self.updates,
+                "product_reads": self.product_reads
+            }
+
+
+# ---------- PRODUCER CAPABILITY INDEX ----------
+class ProducerRecord:
+    __slots__ = ("producer_id", "materials", "entries")
+
+    def __init__(self, producer_id, materials, entries):
+        self.producer_id = producer_id
+        self.materials = materials
+        self.entries = entries
+
+
+class ProducerCapabilityIndex:
+    # role == "producer" kullanıcılarının süreç içi eşleştirme indeksi (on_snapshot ile artımlı; yoksa yoklama).
+    # Malzeme -> yazıcı tanımlamamış üreticiler kümesi + yazıcı kayıtları (-x, -y, -z, support_capable, id);
+    # sıralı tabla boyutları azalan en küçük kenara göre sıralı: parçanın en küçük kenarından küçük tablalar
+    # bisect ile elenir, kalanlar için diğer iki kenar (baskınlık) ve destek kontrol edilir.
+    def __init__(self, db, poll_interval=60.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.mode = "stopped"
+        self.ready = False
+        self._producers = {}
+        self._open = {}
+        self._printers = {}
+        self._lock = threading.Lock()
+        self._watch = None
+        self._stop = threading.Event()
+        self._poller = None
+        self.resyncs = 0
+        self.updates = 0
+
+    def _query(self):
+        return self.db.collection("users").where("role", "==", "producer")
+
+    def start(self):
+        try:
+            self._watch = self._query().on_snapshot(self._on_snapshot)
+            self.mode = "listener"
+        except Exception as e:
+            logger.warning(f"Producer index listener unavailable, polling every {self.poll_interval}s: {e}")
+            self.reload()
+            self.mode = "polling"
+            self._poller = threading.Thread(target=self._poll_loop, name="producer-index-poller", daemon=True)
+            self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+            self._watch = None
+        self.mode = "stopped"
+        self.ready = False
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.warning(f"Producer index reload failed: {e}")
+
+    def reload(self):
+        self._resync(list(self._query().stream()))
+
+    def _on_snapshot(self, docs, changes, read_time):
+        if not changes:
+            self._resync(docs)
+            return
+        with self._lock:
+            for change in changes:
+                self._remove(change.document.id)
+                if change.type.name != "REMOVED":
+                    self._insert(change.document.id, change.document.to_dict() or {})
+            self.updates += len(changes)
+            self.ready = True
+
+    def _resync(self, docs):
+        with self._lock:
+            self._producers, self._open, self._printers = {}, {}, {}
+            for doc in docs:
+                self._insert(doc.id, doc.to_dict() or {})
+            self.resyncs += 1
+            self.ready = True
+
+    def _insert(self, producer_id, producer):
+        materials = frozenset(producer.get("materials_supported", []))
+        entries = [
+            (-max_xyz[0], -max_xyz[1], -max_xyz[2], support_capable, producer_id)
+            for max_xyz, support_capable in printer_capacities(producer.get("printers", []))
+        ]
+        self._producers[producer_id] = ProducerRecord(producer_id, materials, entries)
+        for material in materials:
+            if not entries:
+                self._open.setdefault(material, set()).add(producer_id)
+            for entry in entries:
+                bisect.insort(self._printers.setdefault(material, []), entry)
+
+    def _remove(self, producer_id):
+        record = self._producers.pop(producer_id, None)
+        if record is None:
+            return
+        for material in record.materials:
+            self._open.get(material, set()).discard(producer_id)
+            entries = self._printers.get(material, [])
+            for entry in record.entries:
+                i = bisect.bisect_left(entries, entry)
+                if i < len(entries) and entries[i] == entry:
+                    del entries[i]
+
+    def match(self, material, extents, needs_support):
+        a, b, c = sorted(extents)
+        with self._lock:
+            producer_ids = set(self._open.get(material, ()))
+            entries = self._printers.get(material, [])
+            for neg_x, neg_y, neg_z, support_capable, producer_id in itertools.islice(
+                    entries, bisect.bisect_right(entries, (-a, float("inf")))):
+                if producer_id in producer_ids or (needs_support and not support_capable):
+                    continue
+                if -neg_y >= b and -neg_z >= c:
+                    producer_ids.add(producer_id)
+        return producer_ids
+
+    def stats(self):
+        with self._lock:
+            return {
+                "producers": len(self._producers),
+                "printer_entries": sum(len(entries) for entries in self._printers.values()),
+                "mode": self.mode,
+                "ready": self.ready,
+                "resyncs": self.resyncs,
+                "updates": self.updates
+            }
+
+
+class BoundedFanout:
+    # Sınırlı kuyruklu ThreadPoolExecutor: çalışan + bekleyen iş sayısı max_workers + max_queue'yu aşmaz.
+    # Kuyruk doluysa submit False döner; çağıran işi kendisi (senkron) yürütür, böylece yük geri basınç olur.
+    def __init__(self, max_workers=2, max_queue=200):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="order-fanout")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.overflowed = 0
+
+    def _on_done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.overflowed += 1
+            return False
+        with self._lock:
+            self.in_flight += 1
+        try:
+            self._executor.submit(fn, *args).add_done_callback(self._on_done)
+        except RuntimeError:
+            # Kapanış sırasında: iş çağırana geri verilir
+            self._on_done(None)
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def shutdown(self):
+        # Kuyruk sınırlı olduğundan kalan işler beklenir (sessizce atılmaz)
+        with self._lock:
+            pending = self.in_flight
+        if pending:
+            logger.info(f"Waiting for {pending} queued order fan-out jobs")
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            running = min(self.in_flight, self.max_workers)
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": running,
+                "queue_depth": self.in_flight - running,
+                "submitted": self.submitted,
+                "overflowed": self.overflowed
+            }
+
+
+# ---------- ORDER ANALYTICS ----------
+class AnalyticsSnapshot:
+    # Siparişlerin sütunsal kopyası: kategorik alanlar (sıralı etiketler + int32 kod), float64 tutarlar,
+    # int64 epoch saniye zamanlar (yoksa MISSING). Kurulduktan sonra değişmez; yenileme referansı değiştirir.
+    MISSING = np.iinfo(np.int64).min
+    __slots__ = ("size", "labels", "codes", "price", "commission", "paid", "outcome", "times", "refreshed_at", "nbytes")
+
+    def __init__(self, size, labels, codes, price, commission, paid, outcome, times, refreshed_at):
+        self.size = size
+        self.labels = labels
+        self.codes = codes
+        self.price = price
+        self.commission = commission
+        self.paid = paid
+        self.outcome = outcome
+        self.times = times
+        self.refreshed_at = refreshed_at
+        self.nbytes = (sum(a.nbytes for a in codes.values()) + sum(a.nbytes for a in times.values())
+                       + price.nbytes + commission.nbytes + paid.nbytes + outcome.nbytes)
+
+
+class OrderAnalytics:
+    # Admin analizleri için refresh_interval'de bir yeniden kurulan sütunsal anlık görüntü (tek sayfalı tarama,
+    # yalnızca gereken alanlar). Sorgular NumPy üzerinde vektörel: maske -> (grup, zaman kovası) anahtarı -> bincount.
+    # Bellek: sipariş başına 50 B (4 kod + 2 tutar + 2 zaman + bayraklar); 1M siparişte ~50 MB ve sorgu başına ~5-50 ms.
+    DIMENSIONS = {"material": "material_name", "status": "status", "producer": "producer_id", "customer": "customer_id"}
+    TIME_FIELDS = {"created": "created_at", "paid": "paid_at"}
+    METRICS = ("orders", "revenue", "commission", "avg_price", "success_rate")
+    BUCKETS = ("day", "week", "month")
+    # Üretici başarısı: sonuçlanmış siparişlerde onaylanan / (onaylanan + itiraz + iade)
+    SUCCESS_STATES = ("confirmed",)
+    FAILURE_STATES = ("dispute_open", "refunded", "partial_refund")
+    BATCH_SIZE = 5000
+
+    def __init__(self, db, refresh_interval=300.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.failures = 0
+        self.queries = 0
+        self.last_refresh_ms = None
+
+    def start(self):
+        # İlk analiz isteğinde çağrılır; panel açılmayan süreçler siparişleri hiç taramaz
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name="analytics-refresh", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Analytics snapshot refresh failed: {e}")
+            if self._stop.wait(self.refresh_interval):
+                return
+
+    def _scan(self):
+        fields = list(self.DIMENSIONS.values()) + list(self.TIME_FIELDS.values()) + [
+            "final_price", "commission_amount", "payment_status"]
+        query = self.db.collection("orders").select(fields).order_by("__name__")
+        last = None
+        while True:
+            page = query.limit(self.BATCH_SIZE)
+            if last is not None:
+                page = page.start_after(last)
+            docs = list(page.stream())
+            for doc in docs:
+                yield doc.to_dict() or {}
+            if len(docs) < self.BATCH_SIZE:
+                return
+            last = docs[-1]
+
+    @staticmethod
+    def _epoch_seconds(values):
+        # ISO string'ler saniyeye kırpılıp tek seferde datetime64'e çevrilir; boş/bozuk olanlar MISSING
+        texts = [value[:19] if isinstance(value, str) and len(value) >= 10 else "NaT" for value in values]
+        try:
+            stamps = np.array(texts, dtype="datetime64[s]")
+        except ValueError:
+            stamps = np.array([OrderAnalytics._parse_one(text) for text in texts], dtype="datetime64[s]")
+        seconds = stamps.astype(np.int64)
+        seconds[np.isnat(stamps)] = AnalyticsSnapshot.MISSING
+        return seconds
+
+    @staticmethod
+    def _parse_one(text):
+        try:
+            return np.datetime64(text, "s")
+        except ValueError:
+            return np.datetime64("NaT")
+
+    def refresh(self):
+        # Aynı anda tek yenileme; eşzamanlı çağıran ikinci bir tarama başlatmaz, mevcut anlık görüntüyle döner
+        if not self._refresh_lock.acquire(blocking=False):
+            return self._snapshot
+        try:
+            t0 = time.perf_counter()
+            columns = {field: [] for field in list(self.DIMENSIONS.values()) + list(self.TIME_FIELDS.values())}
+            price, commission, paid = [], [], []
+            for order in self._scan():
+                for field, values in columns.items():
+                    values.append(order.get(field))
+                price.append(order.get("final_price"))
+                commission.append(order.get("commission_amount"))
+                paid.append(order.get("payment_status") == "paid")
+            labels, codes = {}, {}
+            for name, field in self.DIMENSIONS.items():
+                values = np.array(["" if value is None else str(value) for value in columns[field]], dtype=object)
+                labels[name], inverse = np.unique(values, return_inverse=True)
+                codes[name] = inverse.astype(np.int32)
+            status = labels["status"][codes["status"]]
+            outcome = np.zeros(len(status), dtype=np.int8)
+            outcome[np.isin(status, self.SUCCESS_STATES)] = 1
+            outcome[np.isin(status, self.FAILURE_STATES)] = -1
+            snapshot = AnalyticsSnapshot(
+                size=len(paid),
+                labels=labels,
+                codes=codes,
+                price=np.array([float(x or 0.0) for x in price], dtype=np.float64),
+                commission=np.array([float(x or 0.0) for x in commission], dtype=np.float64),
+                paid=np.array(paid, dtype=bool),
+                outcome=outcome,
+                times={name: self._epoch_seconds(columns[field]) for name, field in self.TIME_FIELDS.items()},
+                refreshed_at=time.time()
+            )
+            self._snapshot = snapshot
+            self.refreshes += 1
+            self.last_refresh_ms = round((time.perf_counter() - t0) * 1000, 1)
+            return snapshot
+        finally:
+            self._refresh_lock.release()
+
+    @staticmethod
+    def _bucket_ids(seconds, bucket):
+        days = seconds // 86400
+        if bucket == "day":
+            return days
+        if bucket == "week":
+            return (days + 3) // 7  # 1970-01-01 perşembe; haftalar pazartesi başlar
+        return seconds.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+
+    @staticmethod
+    def _bucket_label(bucket_id, bucket):
+        if bucket == "day":
+            return str(np.datetime64(int(bucket_id), "D"))
+        if bucket == "week":
+            return str(np.datetime64(int(bucket_id) * 7 - 3, "D"))
+        return str(np.datetime64(int(bucket_id), "M"))
+
+    def query(self, metric="orders", group_by=None, bucket=None, time_field="created", since=None, until=None,
+              filters=None, top=20):
+        # since/until: epoch saniye (dahil/hariç); filters: {boyut: etiket}
+        snap = self._snapshot
+        if snap is None:
+            raise RuntimeError("Analytics snapshot is not ready")
+        self.queries += 1
+        mask = np.ones(snap.size, dtype=bool)
+        seconds = snap.times[time_field]
+        if bucket or since is not None or until is not None:
+            mask &= seconds != AnalyticsSnapshot.MISSING
+        if since is not None:
+            mask &= seconds >= since
+        if until is not None:
+            mask &= seconds < until
+        if metric in ("revenue", "commission"):
+            mask &= snap.paid
+        elif metric == "success_rate":
+            mask &= snap.outcome != 0
+        for name, label in (filters or {}).items():
+            labels = snap.labels[name]
+            position = int(np.searchsorted(labels, label))
+            if position == len(labels) or labels[position] != label:
+                mask[:] = False
+            else:
+                mask &= snap.codes[name] == position
+
+        matched = int(np.count_nonzero(mask))
+        idx = slice(None) if matched == snap.size else np.flatnonzero(mask)  # maske boşsa kopyasız görünümler
+        if metric in ("revenue", "avg_price"):
+            weights = snap.price[idx]
+        elif metric == "commission":
+            weights = snap.commission[idx]
+        elif metric == "success_rate":
+            weights = (snap.outcome[idx] == 1).astype(np.float64)
+        else:
+            weights = None
+
+        # Önce grup toplamlarıyla top-k, sonra yalnızca seçilen gruplar zaman kovalarına bölünür (hücre sayısı sınırlı)
+        if group_by:
+            group_codes = snap.codes[group_by][idx]
+            group_count = len(snap.labels[group_by])
+        else:
+            group_codes = np.zeros(matched, dtype=np.int32)
+            group_count = 1
+        counts = np.bincount(group_codes, minlength=group_count)
+        sums = counts.astype(np.float64) if weights is None else np.bincount(group_codes, weights=weights, minlength=group_count)
+        values = self._metric_values(metric, sums, counts)
+        present = np.flatnonzero(counts)
+        if top and len(present) > top:
+            present = present[np.argpartition(-values[present], top - 1)[:top]]
+        selected = present[np.lexsort((present, -values[present]))]
+
+        rows = [{
+            "group": (snap.labels[group_by][code] or None) if group_by else None,
+            "value": self._json_number(values[code]),
+            "orders": int(counts[code])
+        } for code in selected]
+
+        if bucket and len(selected):
+            lookup = np.full(group_count, -1, dtype=np.int64)
+            lookup[selected] = np.arange(len(selected))
+            rank = lookup[group_codes]
+            keep = rank >= 0
+            bucket_ids = self._bucket_ids(seconds[idx][keep], bucket)
+            first = int(bucket_ids.min())
+            span = int(bucket_ids.max()) - first + 1
+            cells = rank[keep] * span + (bucket_ids - first)
+            cell_counts = np.bincount(cells, minlength=len(selected) * span).reshape(len(selected), span)
+            cell_sums = (cell_counts.astype(np.float64) if weights is None else
+                         np.bincount(cells, weights=weights[keep], minlength=len(selected) * span).reshape(len(selected), span))
+            cell_values = self._metric_values(metric, cell_sums, cell_counts)
+            for row, row_counts, row_values in zip(rows, cell_counts, cell_values):
+                row["series"] = [{
+                    "bucket": self._bucket_label(first + offset, bucket),
+                    "value": self._json_number(row_values[offset]),
+                    "orders": int(row_counts[offset])
+                } for offset in np.flatnonzero(row_counts)]
+
+        return {
+            "metric": metric,
+            "group_by": group_by,
+            "bucket": bucket,
+            "time_field": time_field,
+            "matched_orders": matched,
+            "rows": rows
+        }
+
+    @staticmethod
+    def _metric_values(metric, sums, counts):
+        if metric in ("avg_price", "success_rate"):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        return sums
+
+    @staticmethod
+    def _json_number(value):
+        return None if np.isnan(value) else round(float(value), 4)
+
+    def stats(self):
+        snap = self._snapshot
+        return {
+            "orders": snap.size if snap else 0,
+            "memory_bytes": snap.nbytes if snap else 0,
+            "age_seconds": round(time.time() - snap.refreshed_at, 1) if snap else None,
+            "last_refresh_ms": self.last_refresh_ms,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "queries": self.queries
+        }
+
+
+# ---------- ID TOKEN VERIFICATION ----------
+class SigningKeysUnavailable(Exception):
+    pass
+
+
+class FirebaseTokenVerifier:
+    # Firebase ID token'larını (RS256) yerelde doğrular; imza sertifikaları bellekte tutulur,
+    # Cache-Control max-age bitmeden arka planda yenilenir ve hızlı açılış için diske yazılır
+    ISSUER_PREFIX = "https://securetoken.google.com/"
+    MIN_FORCED_REFRESH_INTERVAL = 30.0  # bilinmeyen kid ile sertifika ucunu dövmemek için
+    CLOCK_SKEW_SECONDS = 10
+
+    def __init__(self, project_id, certs_url, snapshot_path=None, refresh_ahead=600.0, fetch=None):
+        if not project_id:
+            raise ValueError("FIREBASE_PROJECT_ID is required for local token verification")
+        self.project_id = project_id
+        self.issuer = self.ISSUER_PREFIX + project_id
+        self.certs_url = certs_url
+        self.snapshot_path = snapshot_path
+        self.refresh_ahead = refresh_ahead
+        self._fetch = fetch or self._fetch_certs
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._certs = {}
+        self._expires_at = 0.0
+        self._last_attempt = 0.0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.verified = 0
+        self.rejected = 0
+        self._load_snapshot()
+
+    def _fetch_certs(self):
+        resp = requests.get(self.certs_url, timeout=10)
+        resp.raise_for_status()
+        match = re.search(r"max-age=(\d+)", resp.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else 3600
+        return resp.json(), max_age
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            certs = snapshot.get("certs") or {}
+            if certs:
+                self._certs = certs
+                self._expires_at = float(snapshot.get("expires_at", 0))
+        except Exception as e:
+            logger.warning(f"Firebase cert snapshot unreadable: {e}")
+
+    def _save_snapshot(self, certs, expires_at):
+        if not self.snapshot_path:
+            return
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"certs": certs, "expires_at": expires_at, "fetched_at": now_iso()}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"Firebase cert snapshot write failed: {e}")
+
+    def refresh(self):
+        # Aynı anda tek yenileme; eşzamanlı çağıranlar mevcut sertifikalarla devam eder
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._last_attempt = time.time()
+            try:
+                certs, max_age = self._fetch()
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.warning(f"Firebase cert refresh failed, keeping {len(self._certs)} cached certs: {e}")
+                return False
+            expires_at = time.time() + max_age
+            with self._lock:
+                self._certs = dict(certs)
+                self._expires_at = expires_at
+                self.refreshes += 1
+            self._save_snapshot(certs, expires_at)
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def warm_up(self):
+        # Snapshot yoksa ya da süresi dolmuşsa açılışı bekletmeden arka planda çek
+        if time.time() >= self._expires_at - self.refresh_ahead:
+            threading.Thread(target=self.refresh, name="firebase-certs", daemon=True).start()
+
+    def _cert_for(self, kid):
+        now = time.time()
+        with self._lock:
+            cert = self._certs.get(kid)
+            expires_at = self._expires_at
+        if cert is None:
+            # Google anahtarı döndürmüş olabilir: hız sınırlı zorunlu yenileme. Hiç sertifika yoksa da aynı sınır
+            # geçerli; aradaki istekler ucu beklemeden SigningKeysUnavailable alır (503)
+            if now - self._last_attempt >= self.MIN_FORCED_REFRESH_INTERVAL:
+                self.refresh()
+            with self._lock:
+                cert = self._certs.get(kid)
+                if cert is None and not self._certs:
+                    raise SigningKeysUnavailable("Firebase signing certificates are not available")
+        elif now >= expires_at - self.refresh_ahead and now - self._last_attempt >= self.MIN_FORCED_REFRESH_INTERVAL:
+            # Süresi dolmuş olsa da sertifika kullanılır; yenileme arka planda ve hız sınırlı, ağ hatası girişleri durdurmasın
+            self._last_attempt = now
+            threading.Thread(target=self.refresh, name="firebase-certs", daemon=True).start()
+        return cert
+
+    def verify(self, id_token):
+        try:
+            header = google_jwt.decode_header(id_token)
+            if header.get("alg") != "RS256":
+                raise ValueError(f"Unexpected token algorithm: {header.get('alg')}")
+            kid = header.get("kid")
+            cert = self._cert_for(kid) if kid else None
+            if cert is None:
+                raise ValueError(f"Unknown signing key: {kid}")
+            claims = google_jwt.decode(
+                id_token,
+                certs={kid: cert},
+                audience=self.project_id,
+                clock_skew_in_seconds=self.CLOCK_SKEW_SECONDS
+            )
+            if claims.get("iss") != self.issuer:
+                raise ValueError(f"Unexpected token issuer: {claims.get('iss')}")
+            sub = claims.get("sub")
+            if not isinstance(sub, str) or not sub or len(sub) > 128:
+                raise ValueError("Invalid token subject")
+            if float(claims.get("auth_time", 0)) > time.time() + self.CLOCK_SKEW_SECONDS:
+                raise ValueError("Token auth_time is in the future")
+        except SigningKeysUnavailable:
+            raise
+        except Exception:
+            self.rejected += 1
+            raise
+        self.verified += 1
+        claims["uid"] = sub
+        return claims
+
+    def stats(self):
+        with self._lock:
+            return {
+                "certs": len(self._certs),
+                "expires_in": round(self._expires_at - time.time(), 1),
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "verified": self.verified,
+                "rejected": self.rejected
+            }
+
+
 # ---------- APP FACTORY ----------
 def create_app(config_object=Config):
     app = Flask(__name__)
+    app.request_class = STLUploadRequest
     app.config.from_object(config_object)
     app.config['MAX_CONTENT_LENGTH'] = max(config_object.MAX_STL_SIZE, config_object.MAX_PHOTO_SIZE)
     app.config["JSON_AS_ASCII"] = False  # TR karakterler düzgün dönsün
@@ -381,7 +3638,7 @@ def create_app(config_object=Config):
 
     # Firebase initialize
     try:
-        if not firebase_admin._apps:
+        if config_object.STORAGE_BACKEND == "firestore" and not firebase_admin._apps:
             cred_path = os.path.abspath(config_object.FIREBASE_CRED_PATH)
             if not os.path.exists(cred_path):
                 raise FileNotFoundError(f"Firebase credentials not found: {cred_path}")
@@ -394,36 +3651,110 @@ def create_app(config_object=Config):
         logger.error(f"Firebase init error: {e}")
         raise
 
-    db = firestore.client()
-    bucket = storage.bucket()
+    db, bucket = create_storage_backend(config_object)
     socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
+    stl_cache = STLAnalysisCache(db, config_object.STL_CACHE_COLLECTION, config_object.STL_CACHE_SIZE)
+    analysis_service = STLAnalysisService(
+        max_workers=config_object.STL_ANALYSIS_WORKERS,
+        max_queue=config_object.STL_ANALYSIS_MAX_QUEUE,
+        timeout=config_object.STL_ANALYSIS_TIMEOUT,
+        start_method=config_object.STL_ANALYSIS_START_METHOD
+    )
+    atexit.register(analysis_service.shutdown)
+    preview_cache = LRUCache(config_object.PREVIEW_CACHE_SIZE)
+    quote_cache = QuoteCache(config_object.QUOTE_CACHE_SIZE, config_object.QUOTE_CACHE_TTL)
+    product_cache = TTLCache(config_object.PRODUCT_CACHE_SIZE, config_object.PRODUCT_CACHE_TTL)
+    materials_registry = MaterialsRegistry(db, "materials", config_object.MATERIALS_POLL_INTERVAL)
+    pool_index = PendingPoolIndex(db, config_object.POOL_INDEX_POLL_INTERVAL) if config_object.POOL_INDEX_ENABLED else None
+    producer_index = (ProducerCapabilityIndex(db, config_object.PRODUCER_INDEX_POLL_INTERVAL)
+                      if config_object.PRODUCER_INDEX_ENABLED else None)
+    order_analytics = (OrderAnalytics(db, config_object.ANALYTICS_REFRESH_INTERVAL)
+                       if config_object.ANALYTICS_ENABLED else None)
+    order_fanout = BoundedFanout(config_object.ORDER_FANOUT_WORKERS, config_object.ORDER_FANOUT_MAX_QUEUE)
+    atexit.register(order_fanout.shutdown)
+    token_cache = TTLCache(config_object.TOKEN_CACHE_SIZE, 0)
+    user_cache = TTLCache(config_object.USER_CACHE_SIZE, config_object.USER_CACHE_TTL)
+    loaders = {name: DocumentLoader(db, name) for name in ("users", "products", "orders")}
+    token_verifier = None
+    if config_object.TOKEN_VERIFIER == "local":
+        token_verifier = FirebaseTokenVerifier(
+            config_object.FIREBASE_PROJECT_ID,
+            config_object.FIREBASE_CERTS_URL,
+            snapshot_path=config_object.FIREBASE_CERTS_SNAPSHOT,
+            refresh_ahead=config_object.FIREBASE_CERTS_REFRESH_AHEAD
+        )
+        token_verifier.warm_up()
+
     app.db = db
     app.bucket = bucket
     app.socketio = socketio
+    app.stl_cache = stl_cache
+    app.analysis_service = analysis_service
+    app.token_verifier = token_verifier
 
     # Socket.IO session management
     socket_sessions = {}
 
     # ---------- DECORATORS ----------
+    # Doğrulanmış token'lar exp'e kadar token özetiyle (ham token saklanmaz) tutulur
+    def verify_id_token_cached(id_token):
+        key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+        decoded = token_cache.get(key)
+        if decoded is None:
+            if token_verifier is not None:
+                decoded = token_verifier.verify(id_token)
+            else:
+                decoded = fb_auth.verify_id_token(id_token)
+            ttl = float(decoded.get("exp", 0)) - time.time()
+            if ttl > 0:
+                token_cache.set(key, decoded, ttl=ttl)
+        return decoded
+
+    # Kullanıcı profili kısa TTL ile cache'lenir; uygulama içi her users yazımında invalidate_user çağrılır
+    def invalidate_user(uid):
+        if uid:
+            user_cache.pop(uid)
+            docs = request_documents()
+            if docs is not None:
+                docs.forget("users", uid)
+
+    def request_documents():
+        if not has_request_context():
+            return None
+        docs = getattr(g, "_documents", None)
+        if docs is None:
+            docs = g._documents = DocumentIdentityMap()
+        return docs
+
+    # Debug: istek başına identity map'in kurtardığı okuma sayısı
+    @app.after_request
+    def report_reads_saved(response):
+        docs = getattr(g, "_documents", None)
+        if app.config.get("DEBUG") and docs is not None:
+            response.headers["X-Firestore-Reads-Saved"] = str(docs.reads_saved)
+        return response
+
     def require_auth(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
             auth_header = request.headers.get("Authorization", "")
             uid = None
-            user_doc = None
+            user = None
 
             # Prod: Bearer Firebase ID token
             if auth_header.startswith("Bearer "):
                 id_token = auth_header.split(" ", 1)[1]
                 try:
-                    decoded = fb_auth.verify_id_token(id_token)
+                    decoded = verify_id_token_cached(id_token)
+                except SigningKeysUnavailable:
+                    return jsonify({"error": "Token verification temporarily unavailable, please retry"}), 503
                 except Exception:
                     return jsonify({"error": "Invalid token"}), 401
                 uid = decoded.get("uid")
-                user_doc = app.db.collection("users").document(uid).get()
+                user = get_user(uid)
 
-                if not user_doc.exists:
+                if user is None:
                     # Auto-provision minimal doc
                     app.db.collection("users").document(uid).set({
                         "email": decoded.get("email"),
@@ -433,18 +3764,19 @@ def create_app(config_object=Config):
                         "last_login": now_iso(),
                         "kvkk_consent": False
                     })
-                    user_doc = app.db.collection("users").document(uid).get()
+                    invalidate_user(uid)
+                    user = get_user(uid) or {"id": uid}
 
             # Dev fallback: "Token <uid>"
             elif app.config.get("DEBUG") and auth_header.startswith("Token "):
                 uid = auth_header.split(" ", 1)[1]
-                user_doc = app.db.collection("users").document(uid).get()
-                if not user_doc.exists:
+                user = get_user(uid)
+                if user is None:
                     return jsonify({"error": "User not found"}), 401
             else:
                 return jsonify({"error": "Missing Authorization header"}), 401
 
-            g.user = {"id": uid, **(user_doc.to_dict() or {})}
+            g.user = user
             return fn(*args, **kwargs)
         return wrapper
 
@@ -459,29 +3791,129 @@ def create_app(config_object=Config):
         return decorator
 
     # ---------- HELPERS ----------
+    # get_users/get_products/get_orders: liste uçları için tek round trip'te toplu okuma ({id: dict|None})
+    def get_users(user_ids):
+        users, missing = {}, []
+        for user_id in dict.fromkeys(uid for uid in user_ids if uid):
+            data = user_cache.get(user_id)
+            if data is None:
+                missing.append(user_id)
+            users[user_id] = data
+        for user_id, data in loaders["users"].load_many(missing, request_documents()).items():
+            if data is not None:
+                user_cache.set(user_id, data)
+            users[user_id] = data
+        return {user_id: copy.deepcopy(data) for user_id, data in users.items()}
+
+    def get_products(product_ids):
+        return loaders["products"].load_many(product_ids, request_documents())
+
+    def get_orders(order_ids):
+        return loaders["orders"].load_many(order_ids, request_documents())
+
     def get_user(user_id):
-        doc = app.db.collection("users").document(user_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            return data
-        return None
+        return get_users([user_id]).get(user_id) if user_id else None
 
     def get_order(order_id):
-        doc = app.db.collection("orders").document(order_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            return data
-        return None
+        return loaders["orders"].load(order_id, request_documents()) if order_id else None
 
     def get_product(product_id):
-        doc = app.db.collection("products").document(product_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            return data
-        return None
+        return loaders["products"].load(product_id, request_documents()) if product_id else None
+
+    def page_params():
+        limit = request.args.get("limit", type=int) or app.config["PAGE_SIZE_DEFAULT"]
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        after = request.args.get("after")
+        return min(limit, app.config["PAGE_SIZE_MAX"]), decode_page_cursor(after) if after else None
+
+    # order_field + belge id ile sıralı, start_after imleçli sayfa; (öğeler, sonraki imleç ya da None) döner.
+    # Eşitlik filtresi + order_field sıralaması Firestore'da bileşik indeks ister: firestore.indexes.json
+    # select verilirse her parti için eşleşen öğeleri döndürür (havuz filtresi); tarama max_scan ile sınırlanır
+    def paginate(query, order_field, limit, after=None, select=None, max_scan=None):
+        query = query.order_by(order_field).order_by("__name__")
+        batch_size = limit + 1 if select is None else max(limit * 2, 20)
+        items, cursor, scanned = [], after, 0
+        while True:
+            page = query.limit(batch_size)
+            if cursor is not None:
+                page = page.start_after(cursor)
+            batch = [{**doc.to_dict(), "id": doc.id} for doc in page.stream()]
+            matched = None if select is None else {id(item) for item in select(batch)}
+            for item in batch:
+                if len(items) == limit:
+                    return items, cursor
+                scanned += 1
+                cursor = [item.get(order_field), item["id"]]
+                if matched is None or id(item) in matched:
+                    items.append(item)
+            if len(batch) < batch_size:
+                return items, None
+            if max_scan and scanned >= max_scan:
+                return items, cursor
+
+    # Yazımlar istek içi haritaya da işlenir; sonraki get_* çağrıları güncel kopyayı okur
+    def update_document(collection, doc_id, fields):
+        app.db.collection(collection).document(doc_id).update(fields)
+        docs = request_documents()
+        if docs is not None:
+            docs.apply_update(collection, doc_id, fields)
+
+    def transition_order(order_id, new_state, actor_id, reason=None):
+        order, update_data = OrderStateMachine.transition_with_update(app.db, order_id, new_state, actor_id, reason)
+        docs = request_documents()
+        if docs is not None:
+            docs.remember("orders", order_id, {**order, **update_data, "id": order_id})
+        return order
+
+    # Fiyatlama girdileri: ürünler uygulama içinde değişmez (analiz yükleme anında sabitlenir)
+    def get_pricing_product(product_id):
+        product = product_cache.get(product_id)
+        if product is None:
+            product = get_product(product_id)
+            if product is None:
+                return None
+            product_cache.set(product_id, product)
+        return product
+
+    def get_pricing_material(material_id):
+        return materials_registry.get(material_id)
+
+    def on_material_change(material_id, old, new):
+        # Fiyat değiştiyse (ya da malzeme silindiyse) bu malzemeye ait teklifler düşürülür
+        if old is None:
+            return
+        if new is None or QuoteCache.material_version(old) != QuoteCache.material_version(new):
+            dropped = quote_cache.invalidate_material(material_id)
+            logger.info(f"Material {material_id} price changed, {dropped} cached quotes invalidated")
+
+    materials_registry.on_change(on_material_change)
+    materials_registry.start()
+    atexit.register(materials_registry.stop)
+    app.materials_registry = materials_registry
+
+    if pool_index is not None:
+        pool_index.start()
+        atexit.register(pool_index.stop)
+    app.pool_index = pool_index
+
+    if producer_index is not None:
+        producer_index.start()
+        atexit.register(producer_index.stop)
+    app.producer_index = producer_index
+    app.order_fanout = order_fanout
+
+    if order_analytics is not None:
+        atexit.register(order_analytics.stop)
+    app.order_analytics = order_analytics
+
+    def cached_quote(product, material_id, material, params):
+        key = quote_cache.key(QuoteCache.analysis_fingerprint(product), material_id, material, params)
+        pricing = quote_cache.get(key)
+        if pricing is None:
+            pricing = PricingEngine.calculate_price(product.get("analysis", {}), params)
+            quote_cache.set(key, pricing)
+        return copy.deepcopy(pricing)
 
     def create_notification(user_id, type, title, order_id=None, body=None):
         notification_data = {
@@ -508,86 +3940,65 @@ def create_app(config_object=Config):
         url = generate_signed_url(blob)
         return url, storage_path
 
-    # ---------- STL ANALYZER ----------
-    class STLAnalyzer:
-        @staticmethod
-        def _is_ascii_stl(file_path: str) -> bool:
-            with open(file_path, 'rb') as f:
-                start = f.read(512)
+    # ---------- MESH POSTPROCESS (preview vb.) ----------
+    def preview_mesh_storage_path(content_hash):
+        return f"previews/{content_hash}.stlp"
+
+    def run_mesh_postprocess(temp_path, geometry):
+        # Hata upload'u düşürmez; türetilmiş çıktılar sonradan yeniden üretilebilir
+        options = {
+            "preview_triangles": min(app.config['PREVIEW_MESH_TRIANGLES'], app.config['PREVIEW_MESH_MAX_TRIANGLES']),
+            "thumbnail_size": app.config['THUMBNAIL_SIZE'],
+            "mesh_health_max_triangles": app.config['MESH_HEALTH_MAX_TRIANGLES'],
+            "layer_profile_bins": app.config['LAYER_PROFILE_BINS']
+        }
+        try:
+            return analysis_service.postprocess(temp_path, geometry, options)
+        except Exception as e:
+            logger.warning(f"Mesh postprocess failed: {e!r}")
+            return {}
+
+    def store_preview_mesh(content_hash, data):
+        blob = app.bucket.blob(preview_mesh_storage_path(content_hash))
+        blob.cache_control = "private, max-age=31536000, immutable"
+        blob.upload_from_string(data, content_type="application/octet-stream")
+        preview_cache.set(content_hash, data)
+
+    def thumbnail_storage_path(content_hash):
+        return f"thumbnails/{content_hash}.png"
+
+    def store_thumbnail(content_hash, data):
+        blob = app.bucket.blob(thumbnail_storage_path(content_hash))
+        blob.cache_control = "private, max-age=31536000, immutable"
+        blob.upload_from_string(data, content_type="image/png")
+        return thumbnail_storage_path(content_hash)
+
+    def mesh_health_warnings(health):
+        if not health or not health.get('checked'):
+            return []
+        warnings = []
+        if health.get('boundary_edges'):
+            warnings.append(f"Mesh is not watertight: {health['boundary_edges']} open edges")
+        if health.get('non_manifold_edges'):
+            warnings.append(f"Mesh has {health['non_manifold_edges']} non-manifold edges")
+        if health.get('inconsistent_winding_edges'):
+            warnings.append(f"Inconsistent face winding on {health['inconsistent_winding_edges']} edges")
+        if health.get('flipped_normals'):
+            warnings.append(f"{health['flipped_normals']} facets have flipped normals")
+        if health.get('inverted'):
+            warnings.append("Mesh is inside-out (negative signed volume)")
+        if not health.get('volume_reliable', True):
+            warnings.append("Volume and weight estimates may be unreliable")
+        return warnings
+
+    def attach_thumbnail_url(product):
+        # Liste görünümleri mesh yerine tek küçük resim çeker
+        if product and product.get("thumbnail_storage_path"):
             try:
-                start_txt = start.decode('utf-8', errors='ignore').lstrip()
+                product["thumbnail_url"] = generate_signed_url(app.bucket.blob(product["thumbnail_storage_path"]))
             except Exception:
-                return False
-            return start_txt.startswith("solid")
-
-        @staticmethod
-        def analyze_stl_binary_streaming(file_path, preview_limit=100, triangle_limit=2_000_000):
-            with open(file_path, "rb") as f:
-                header = f.read(80)
-                count_bytes = f.read(4)
-                if len(count_bytes) < 4:
-                    raise ValueError("Invalid STL file")
-                count = struct.unpack("<I", count_bytes)[0]
-
-                preview = []
-                count_read = 0
-                min_c = np.array([np.inf, np.inf, np.inf], dtype=np.float64)
-                max_c = -min_c
-                volume = 0.0
-                surface_area = 0.0
-
-                to_read = min(count, triangle_limit)
-                for i in range(to_read):
-                    rec = f.read(50)
-                    if len(rec) < 50:
-                        break
-                    data = struct.unpack("<12fH", rec)
-                    v1 = np.array(data[3:6], dtype=np.float64)
-                    v2 = np.array(data[6:9], dtype=np.float64)
-                    v3 = np.array(data[9:12], dtype=np.float64)
-
-                    if len(preview) < preview_limit:
-                        preview.append([v1.tolist(), v2.tolist(), v3.tolist()])
-
-                    min_c = np.minimum(min_c, np.minimum(v1, np.minimum(v2, v3)))
-                    max_c = np.maximum(max_c, np.maximum(v1, np.maximum(v2, v3)))
-                    volume += np.dot(v1, np.cross(v2, v3)) / 6.0
-                    surface_area += 0.5 * np.linalg.norm(np.cross(v2 - v1, v3 - v1))
-                    count_read += 1
-
-                dims = (max_c - min_c)
-                return {
-                    'triangle_count': int(count_read),
-                    'dimensions_mm': dims.tolist() if np.all(np.isfinite(dims)) else [0, 0, 0],
-                    'volume_mm3': float(abs(volume)),
-                    'surface_area_mm2': float(surface_area),
-                    'bounding_box_volume_mm3': float(np.prod(dims)) if np.all(np.isfinite(dims)) else 0.0,
-                    'preview': preview
-                }
-
-        @staticmethod
-        def analyze_model_geometry(file_path):
-            if STLAnalyzer._is_ascii_stl(file_path):
-                raise ValueError("ASCII STL şimdilik desteklenmiyor. Lütfen binary STL yükleyin.")
-            return STLAnalyzer.analyze_stl_binary_streaming(file_path)
-
-        @staticmethod
-        def estimate_print_properties(analysis, material_density=1.24):
-            if not analysis:
-                return {}
-            volume_cm3 = analysis.get('volume_mm3', 0) / 1000.0
-            weight = volume_cm3 * material_density
-            triangle_count = analysis.get('triangle_count', 0)
-            complexity = min(triangle_count / 1000.0, 3.0)
-            base_time = volume_cm3 * 2.0
-            est_time = base_time + (base_time * 0.5 * complexity)
-            difficulty = "Kolay" if complexity < 1 else "Orta" if complexity < 2 else "Zor"
-            return {
-                'estimated_weight_g': float(weight),
-                'estimated_print_time_minutes': float(est_time),
-                'print_difficulty': difficulty,
-                'complexity_score': float(complexity)
-            }
+                pass
+        return product
 
     def pin_file_to_pinata(file_path, filename):
         try:
@@ -688,7 +4099,7 @@ def create_app(config_object=Config):
             return jsonify({"error": "Product not found"}), 404
         data = prod.to_dict()
         data["id"] = prod.id
-        return jsonify(data)
+        return jsonify(attach_thumbnail_url(data))
 
     # Pricing quote
     @app.route("/api/pricing/quote", methods=["POST"])
@@ -700,20 +4111,22 @@ def create_app(config_object=Config):
         if not product_id or not material_id:
             return jsonify({"error": "product_id and material_id required"}), 400
 
-        prod_doc = app.db.collection("products").document(product_id).get()
-        if not prod_doc.exists:
+        product = get_pricing_product(product_id)
+        if not product:
             return jsonify({"error": "Product not found"}), 404
-        product = prod_doc.to_dict()
 
-        mat_doc = app.db.collection("materials").document(material_id).get()
-        if not mat_doc.exists:
+        material = get_pricing_material(material_id)
+        if not material:
             return jsonify({"error": "Material not found"}), 404
-        material = mat_doc.to_dict()
 
+        if not isinstance(data.get("support_required"), (bool, type(None))):
+            return jsonify({"error": "support_required must be a boolean"}), 400
+        # Yanıttaki params fiyatta gerçekten kullanılan destek seçimini gösterir
         params = {
             "material_price_per_g": material["price_per_gram"],
             "infill_density": float(data.get("infill_density", 0.2)),
-            "support_required": bool(data.get("support_required", False)),
+            "layer_height_mm": float(data.get("layer_height_mm", 0.2)),
+            "support_required": PricingEngine.support_required(product.get("analysis", {}), data.get("support_required")),
             "hourly_rate": float(data.get("hourly_rate", 5.0)),
             "fixed_cost": float(data.get("fixed_cost", 1.0)),
             "margin_percent": float(data.get("margin_percent", 0.20)),
@@ -721,9 +4134,81 @@ def create_app(config_object=Config):
             "provider_fee_rate": float(data.get("provider_fee_rate", 0.025)),
             "min_order_amount": float(data.get("min_order_amount", 10.0)),
         }
-        pricing = PricingEngine.calculate_price(product.get("analysis", {}), params)
+        pricing = cached_quote(product, material_id, material, params)
         return jsonify({"pricing": pricing, "params": params})
 
+    # Toplu fiyat tablosu: bir ürün için aktif malzemeler x dolgu x destek x marj, tek istekte
+    @app.route("/api/pricing/quote/batch", methods=["POST"])
+    @require_auth
+    def pricing_quote_batch():
+        data = request.get_json() or {}
+        product_id = data.get("product_id")
+        if not product_id:
+            return jsonify({"error": "product_id required"}), 400
+        try:
+            infills = [float(v) for v in data.get("infill_densities", [0.2])]
+            margins = [float(v) for v in data.get("margin_percents", [0.20])]
+        except (TypeError, ValueError):
+            return jsonify({"error": "infill_densities and margin_percents must be lists of numbers"}), 400
+        # bool("false") True olur: destek seçenekleri yalnızca JSON boolean olabilir
+        supports = data.get("support_options")
+        if supports is not None and (not isinstance(supports, list) or
+                                     not all(isinstance(v, bool) for v in supports)):
+            return jsonify({"error": "support_options must be a list of booleans"}), 400
+        if not infills or supports == [] or not margins:
+            return jsonify({"error": "Option lists must not be empty"}), 400
+
+        product = get_pricing_product(product_id)
+        if not product:
+            return jsonify({"error": "Product not found"}), 404
+        if supports is None:
+            # Seçenek verilmediyse tek eksen değeri: analizin destek bayrağı (tekil teklifteki varsayılanla aynı)
+            supports = [PricingEngine.support_required(product.get("analysis", {}))]
+        material_ids = data.get("material_ids")
+        materials = []
+        for mat in materials_registry.list():
+            if not mat.get("active", True) or (material_ids and mat["id"] not in material_ids):
+                continue
+            materials.append({"id": mat["id"], "name": mat.get("name"), "price_per_gram": float(mat["price_per_gram"])})
+        if not materials:
+            return jsonify({"error": "No active materials"}), 404
+
+        cells = len(materials) * len(infills) * len(supports) * len(margins)
+        if cells > app.config['QUOTE_GRID_MAX_CELLS']:
+            return jsonify({"error": f"Quote grid too large ({cells} cells)"}), 400
+
+        common = {
+            "hourly_rate": float(data.get("hourly_rate", 5.0)),
+            "fixed_cost": float(data.get("fixed_cost", 1.0)),
+            "commission_rate": float(data.get("commission_rate", Config.DEFAULT_COMMISSION_RATE)),
+            "provider_fee_rate": float(data.get("provider_fee_rate", 0.025)),
+            "min_order_amount": float(data.get("min_order_amount", 10.0)),
+            "layer_height_mm": float(data.get("layer_height_mm", 0.2)),
+        }
+        # Eksenler: [malzeme, dolgu, destek, marj]
+        grid = PricingEngine.calculate_price_grid(product.get("analysis", {}), {
+            **common,
+            "material_price_per_g": np.array([m["price_per_gram"] for m in materials])[:, None, None, None],
+            "infill_density": np.array(infills)[None, :, None, None],
+            "support_required": np.array(supports)[None, None, :, None],
+            "margin_percent": np.array(margins)[None, None, None, :],
+        })
+        return jsonify({
+            "product_id": product_id,
+            "axes": {
+                "materials": materials,
+                "infill_density": infills,
+                "support_required": supports,
+                "margin_percent": margins
+            },
+            "customer_price": PricingEngine.round_grid(grid["customer_price"]),
+            "producer_earnings": PricingEngine.round_grid(grid["producer_earnings"]),
+            "platform_commission": PricingEngine.round_grid(grid["platform_commission"]),
+            "payment_fee": PricingEngine.round_grid(grid["payment_fee"]),
+            "print_time_minutes": PricingEngine.round_grid(grid["print_time_minutes"][0, :, 0, 0], 1),
+            "params": common
+        })
+
     # ---------- LOGIN (API) ----------
     @app.route("/api/login", methods=["POST", "OPTIONS"])
     def api_login():
@@ -741,7 +4226,10 @@ def create_app(config_object=Config):
 
         if id_token:
             try:
-                decoded = fb_auth.verify_id_token(id_token)
+                decoded = verify_id_token_cached(id_token)
+            except SigningKeysUnavailable as e:
+                logger.warning(f"verify_id_token unavailable: {e}")
+                return jsonify({"success": False, "error": "Token verification temporarily unavailable, please retry"}), 503
             except Exception as e:
                 logger.warning(f"verify_id_token failed: {e}")
                 return jsonify({"success": False, "error": "Invalid id_token"}), 401
@@ -775,6 +4263,7 @@ def create_app(config_object=Config):
                         "kvkk_consent_date": now_iso()
                     })
                 user_ref.update(updates)
+            invalidate_user(uid)
 
             user = user_ref.get().to_dict()
             return jsonify({
@@ -805,6 +4294,7 @@ def create_app(config_object=Config):
                     uid = existing[0].id
                     user_data = existing[0].to_dict() or {}
                     app.db.collection("users").document(uid).update({"last_login": now_iso()})
+                    invalidate_user(uid)
                 else:
                     uid = str(uuid.uuid4())
                     user_data = {
@@ -841,6 +4331,7 @@ def create_app(config_object=Config):
                         "kvkk_consent": True,
                         "kvkk_consent_date": now_iso()
                     })
+                invalidate_user(uid)
                 return jsonify({
                     "success": True,
                     "token": f"Token {uid}",
@@ -888,41 +4379,113 @@ def create_app(config_object=Config):
         if not Path(file.filename).suffix.lower() in app.config['ALLOWED_STL']:
             return jsonify({"error": "Invalid file type, only STL allowed"}), 400
 
-        file.stream.seek(0, 2)
-        size = file.stream.tell()
-        file.stream.seek(0)
+        ingest = file.stream if isinstance(file.stream, STLIngestFile) else None
+        if ingest:
+            size = ingest.size
+        else:
+            file.stream.seek(0, 2)
+            size = file.stream.tell()
+            file.stream.seek(0)
         if size > app.config['MAX_STL_SIZE'] or size == 0:
             return jsonify({"error": "File too large or empty"}), 400
 
         temp_path = None
         try:
-            temp_filename = f"temp_{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-            temp_path = get_temp_path(temp_filename)
-            with open(temp_path, 'wb') as temp_file:
-                temp_file.write(file.stream.read())
-
-            # STL analizi (streaming) + ASCII reddi
-            try:
-                geometry = STLAnalyzer.analyze_model_geometry(temp_path)
-            except ValueError as ve:
-                return jsonify({"error": str(ve)}), 400
-            except Exception as e:
-                logger.error(f"STL parse error: {e}")
-                return jsonify({"error": "Invalid STL file"}), 400
-
-            print_props = STLAnalyzer.estimate_print_properties(geometry)
-
-            # Pinata
-            ipfs_hash, pinata_resp = pin_file_to_pinata(temp_path, secure_filename(file.filename))
-            if not ipfs_hash:
-                return jsonify({"error": "File upload to IPFS failed"}), 502
-
-            analysis_result = {
-                **{k: v for k, v in geometry.items() if k != 'preview'},
-                **print_props,
-                'file_size': size,
-                'analysis_timestamp': now_iso()
-            }
+            if ingest:
+                # Multipart parse sırasında diske yazıldı; hash de aynı geçişte hesaplandı
+                temp_path = ingest.path
+                content_hash = ingest.hexdigest()
+            else:
+                temp_filename = f"temp_{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+                temp_path = get_temp_path(temp_filename)
+                # Temp'e blok blok yazarken SHA-256 hesapla
+                sha = hashlib.sha256()
+                with open(temp_path, 'wb') as temp_file:
+                    while True:
+                        chunk = file.stream.read(app.config['UPLOAD_CHUNK_BYTES'])
+                        if not chunk:
+                            break
+                        sha.update(chunk)
+                        temp_file.write(chunk)
+                content_hash = sha.hexdigest()
+
+            # Aynı içerik daha önce işlendiyse analiz + Pinata atlanır
+            cached = stl_cache.get(content_hash)
+            if cached:
+                analysis_result = cached["analysis"]
+                preview = cached.get("preview", [])
+                ipfs_hash = cached["ipfs_hash"]
+                pinata_resp = cached.get("pinata_response")
+                has_preview_mesh = bool(cached.get("has_preview_mesh"))
+                thumbnail_path = cached.get("thumbnail_storage_path")
+            else:
+                # STL analizi (binary/ASCII, blok blok) ayrı process'te
+                try:
+                    geometry, print_props = analysis_service.analyze(temp_path)
+                except AnalysisQueueFull:
+                    return jsonify({"error": "Analysis queue is full, please retry"}), 503
+                except FuturesTimeoutError:
+                    logger.error(f"STL analysis timed out: {temp_path}")
+                    return jsonify({"error": "STL analysis timed out"}), 504
+                except BrokenProcessPool:
+                    # Analiz worker'ı düştü (dosyanın geçersizliğiyle ilgisi yok); istemci tekrar deneyebilir
+                    logger.error(f"STL analysis worker died: {temp_path}")
+                    return jsonify({"error": "STL analysis was interrupted, please retry"}), 503
+                except ValueError as ve:
+                    return jsonify({"error": str(ve)}), 400
+                except Exception as e:
+                    logger.error(f"STL parse error: {e}")
+                    return jsonify({"error": "Invalid STL file"}), 400
+
+            if not cached:
+                integrity = geometry.get('file_integrity') or {}
+                if integrity.get('header_mismatch') or integrity.get('trailing_bytes'):
+                    logger.warning(f"STL header/size mismatch for {file.filename}: {integrity}")
+
+                # Pinata
+                ipfs_hash, pinata_resp = pin_file_to_pinata(temp_path, secure_filename(file.filename))
+                if not ipfs_hash:
+                    return jsonify({"error": "File upload to IPFS failed"}), 502
+
+                extras = run_mesh_postprocess(temp_path, geometry)
+                has_preview_mesh = False
+                if extras.get("preview_mesh"):
+                    try:
+                        store_preview_mesh(content_hash, extras["preview_mesh"])
+                        has_preview_mesh = True
+                    except Exception as e:
+                        logger.warning(f"Preview mesh upload failed: {e}")
+                thumbnail_path = None
+                if extras.get("thumbnail_png"):
+                    try:
+                        thumbnail_path = store_thumbnail(content_hash, extras["thumbnail_png"])
+                    except Exception as e:
+                        logger.warning(f"Thumbnail upload failed: {e}")
+
+                analysis_result = {
+                    **{k: v for k, v in geometry.items() if k not in ('preview', 'orientation_candidates')},
+                    **print_props,
+                    'mesh_health': extras.get('mesh_health'),
+                    'file_size': size,
+                    'analysis_timestamp': now_iso()
+                }
+                # Sıralı OBB boyutları: yazıcı eşleştirmesi yönden bağımsız karşılaştırma yapar
+                analysis_result.update(extras.get('oriented_bounds') or {})
+                if extras.get('layer_profile'):
+                    # Katman profili hazırsa süre tahmini ondan yeniden hesaplanır
+                    analysis_result['layer_profile'] = extras['layer_profile']
+                    analysis_result.update(STLAnalyzer.estimate_print_properties(analysis_result))
+                if analysis_result['mesh_health'] and analysis_result['mesh_health'].get('watertight') is False:
+                    logger.warning(f"Non-watertight STL uploaded: {file.filename} {analysis_result['mesh_health']}")
+                preview = geometry.get('preview', [])
+                stl_cache.put(content_hash, {
+                    "analysis": analysis_result,
+                    "preview": preview,
+                    "ipfs_hash": ipfs_hash,
+                    "pinata_response": pinata_resp,
+                    "has_preview_mesh": has_preview_mesh,
+                    "thumbnail_storage_path": thumbnail_path
+                })
 
             meta = request.form.to_dict() if request.form else (request.get_json(silent=True) or {})
 
@@ -931,12 +4494,15 @@ def create_app(config_object=Config):
                 "title": meta.get("title", file.filename),
                 "description": meta.get("description", ""),
                 "file_ipfs_hash": ipfs_hash,
+                "file_sha256": content_hash,
+                "has_preview_mesh": has_preview_mesh,
+                "thumbnail_storage_path": thumbnail_path,
                 "original_filename": file.filename,
                 "analysis": analysis_result,
                 "created_at": now_iso(),
                 "status": "active"
             }
-            product_ref, _ = app.db.collection("products").add(product_data)
+            _, product_ref = app.db.collection("products").add(product_data)
             product_id = product_ref.id
 
             tr_log(
@@ -952,9 +4518,14 @@ def create_app(config_object=Config):
                 "filename": file.filename,
                 "size": size,
                 "analysis": analysis_result,
-                "triangles_preview": geometry.get('preview', []),
+                "triangles_preview": preview,
                 "ipfs_hash": ipfs_hash,
-                "pinata_response": pinata_resp
+                "pinata_response": pinata_resp,
+                "file_sha256": content_hash,
+                "preview_mesh_url": url_for('get_preview_mesh', content_hash=content_hash) if has_preview_mesh else None,
+                "thumbnail_url": attach_thumbnail_url(dict(product_data)).get("thumbnail_url"),
+                "cached": bool(cached),
+                "warnings": mesh_health_warnings(analysis_result.get('mesh_health'))
             }
 
             logger.info(f"STL uploaded and analyzed by user {g.user['id']}")
@@ -971,15 +4542,34 @@ def create_app(config_object=Config):
                 except Exception as ex:
                     logger.warning(f"Failed to delete temp file {temp_path}: {ex}")
 
+    # Decimate edilmiş önizleme mesh'i (içerik hash'i ile adreslenir, değişmez)
+    @app.route("/api/previews/<content_hash>", methods=["GET"])
+    @require_auth
+    def get_preview_mesh(content_hash):
+        if not re.fullmatch(r"[0-9a-f]{64}", content_hash):
+            return jsonify({"error": "Preview not found"}), 404
+        etag = f"{content_hash}-v{PREVIEW_MESH_VERSION}"
+        if request.if_none_match.contains(etag):
+            resp = app.response_class(status=304)
+        else:
+            data = preview_cache.get(content_hash)
+            if data is None:
+                blob = app.bucket.blob(preview_mesh_storage_path(content_hash))
+                if not blob.exists():
+                    return jsonify({"error": "Preview not found"}), 404
+                data = blob.download_as_bytes()
+                preview_cache.set(content_hash, data)
+            resp = app.response_class(data, mimetype="application/octet-stream")
+        resp.set_etag(etag)
+        resp.cache_control.private = True
+        resp.cache_control.max_age = 31536000
+        resp.cache_control.immutable = True
+        return resp
+
     @app.route("/api/materials", methods=["GET"])
     def get_materials():
         try:
-            docs = list(app.db.collection("materials").stream())
-            materials = []
-            for doc in docs:
-                data = doc.to_dict()
-                data["id"] = doc.id
-                materials.append(data)
+            materials = materials_registry.list()
 
             if not materials:
                 default_materials = [
@@ -992,9 +4582,18 @@ def create_app(config_object=Config):
                 for mat in default_materials:
                     doc_ref = app.db.collection("materials").document()
                     doc_ref.set({**mat, "active": True, "created_at": now_iso()})
-                    mat["id"] = doc_ref.id
-                    materials.append(mat)
-            return jsonify({"materials": materials, "count": len(materials)})
+                materials_registry.reload()
+                materials = materials_registry.list()
+
+            etag = materials_registry.etag
+            if etag and request.if_none_match.contains(etag):
+                resp = app.response_class(status=304)
+            else:
+                resp = jsonify({"materials": materials, "count": len(materials)})
+            if etag:
+                resp.set_etag(etag)
+            resp.cache_control.no_cache = True
+            return resp
 
         except Exception as e:
             logger.error(f"Material list error: {e}")
@@ -1010,19 +4609,23 @@ def create_app(config_object=Config):
                 if field not in data:
                     return jsonify({"error": f"{field} is required"}), 400
 
-            product = get_product(data["product_id"])
+            product = get_pricing_product(data["product_id"])
             if not product:
                 return jsonify({"error": "Product not found"}), 404
 
-            material_doc = app.db.collection("materials").document(data["material_id"]).get()
-            if not material_doc.exists:
+            material = get_pricing_material(data["material_id"])
+            if not material:
                 return jsonify({"error": "Material not found"}), 404
-            material = material_doc.to_dict()
 
+            if not isinstance(data.get("support_required"), (bool, type(None))):
+                return jsonify({"error": "support_required must be a boolean"}), 400
+            # Fiyat, sipariş kaydı ve üretici eşleştirmesi aynı destek seçimini kullanır
+            support_required = PricingEngine.support_required(product.get("analysis", {}), data.get("support_required"))
             pricing_params = {
                 "material_price_per_g": material["price_per_gram"],
                 "infill_density": data["infill_density"],
-                "support_required": data.get("support_required", False),
+                "layer_height_mm": data["layer_height_mm"],
+                "support_required": support_required,
                 "hourly_rate": float(data.get("hourly_rate", 5.0)),
                 "fixed_cost": float(data.get("fixed_cost", 1.0)),
                 "margin_percent": float(data.get("margin_percent", 0.20)),
@@ -1030,7 +4633,7 @@ def create_app(config_object=Config):
                 "provider_fee_rate": float(data.get("provider_fee_rate", 0.025)),
                 "min_order_amount": float(data.get("min_order_amount", 10.0))
             }
-            pricing = PricingEngine.calculate_price(product.get("analysis", {}), pricing_params)
+            pricing = cached_quote(product, data["material_id"], material, pricing_params)
 
             order_data = {
                 "product_id": data["product_id"],
@@ -1041,7 +4644,8 @@ def create_app(config_object=Config):
                 "material_name": material["name"],
                 "infill_density": data["infill_density"],
                 "layer_height_mm": data["layer_height_mm"],
-                "support_required": data.get("support_required", False),
+                "support_required": support_required,
+                "extents_mm": part_extents(product.get("analysis", {})),  # havuz indeksi ürün okumadan eşleştirir
                 "color": data.get("color", "default"),
                 "notes": data.get("notes", ""),
                 "auto_price": pricing["customer_price"],
@@ -1051,12 +4655,21 @@ def create_app(config_object=Config):
                 "payment_provider": "papara",
                 "payment_fee": pricing["payment_fee"],
                 "pricing_breakdown": pricing["breakdown"],
+                "estimated_print_time_minutes": pricing["print_time_minutes"],
                 "payment_status": "unpaid",
                 "created_at": now_iso(),
                 "updated_at": now_iso()
             }
 
-            order_ref, _ = app.db.collection("orders").add(order_data)
+            order_ref = app.db.collection("orders").document()
+
+            @transactional
+            def create_order_transaction(transaction):
+                stats_state = OrderStats.read_state(transaction, app.db)
+                order_data.update(OrderStats.record_change(transaction, app.db, stats_state, None, order_data))
+                transaction.set(order_ref, order_data)
+
+            create_order_transaction(app.db.transaction())
             order_id = order_ref.id
 
             tr_log(
@@ -1067,11 +4680,10 @@ def create_app(config_object=Config):
                 extra={"event":"order_created", "order_id": order_id, "product_id": data["product_id"]}
             )
 
-            producers = app.db.collection("users").where("role", "==", "producer").stream()
-            for producer_doc in producers:
-                producer = producer_doc.to_dict()
-                if can_producer_handle_order(producer, product, order_data):
-                    create_notification(producer_doc.id, "new_order_in_pool", "Yeni sipariş havuzda", order_id)
+            # Üretici eşleştirme ve bildirimler yanıtı bekletmez
+            if not order_fanout.submit(notify_matching_producers, order_id, product, order_data):
+                logger.warning(f"Order fan-out queue full, notifying producers inline for {order_id}")
+                notify_matching_producers(order_id, product, order_data)
 
             return jsonify({
                 "order_id": order_id,
@@ -1083,20 +4695,25 @@ def create_app(config_object=Config):
             logger.error(f"Order creation error: {e}")
             return jsonify({"error": "Failed to create order"}), 500
 
+    def notify_matching_producers(order_id, product, order):
+        try:
+            if producer_index is not None and producer_index.ready:
+                producer_ids = producer_index.match(order["material_name"], order["extents_mm"], order["support_required"])
+            else:
+                producers = app.db.collection("users").where("role", "==", "producer").stream()
+                producer_ids = {doc.id for doc in producers if can_producer_handle_order(doc.to_dict(), product, order)}
+            for producer_id in sorted(producer_ids):
+                create_notification(producer_id, "new_order_in_pool", "Yeni sipariş havuzda", order_id)
+        except Exception as e:
+            logger.error(f"New order fan-out error for {order_id}: {e}")
+
     def can_producer_handle_order(producer, product, order):
         if order["material_name"] not in producer.get("materials_supported", []):
             return False
 
-        printers = producer.get("printers", [])
-        if not printers:
-            return True  # printer belirtilmemişse varsayılan kabul
-
-        dimensions = product.get("analysis", {}).get("dimensions_mm", [0, 0, 0])
-        for printer in printers:
-            max_xyz = printer.get("max_xyz", [200, 200, 200])  # default hacim
-            if all(d <= m for d, m in zip(dimensions, max_xyz)):
-                return True
-        return False
+        analysis = product.get("analysis", {})
+        needs_support = PricingEngine.support_required(analysis, order.get("support_required"))
+        return fits_capacities(part_extents(analysis), needs_support, printer_capacities(producer.get("printers", [])))
 
     # Adres set etme (müşteri)
     @app.route("/api/orders/<order_id>/shipping/info", methods=["POST"])
@@ -1108,7 +4725,7 @@ def create_app(config_object=Config):
         if order['customer_id'] != g.user['id'] and g.user.get('role') != 'admin':
             return jsonify({"error": "Unauthorized"}), 403
         data = request.get_json() or {}
-        app.db.collection("orders").document(order_id).update({
+        update_document("orders", order_id, {
             "shipping_address": data.get("address", {}),
             "shipping_method": data.get("method", "MANUAL"),
             "shipping_fee_try": float(data.get("fee_try", 0.0)),
@@ -1128,7 +4745,7 @@ def create_app(config_object=Config):
         if order.get('producer_id') != g.user['id'] and g.user.get('role') != 'admin':
             return jsonify({"error": "Unauthorized"}), 403
         data = request.get_json() or {}
-        app.db.collection("orders").document(order_id).update({
+        update_document("orders", order_id, {
             "tracking_number": data.get("tracking_number"),
             "carrier": data.get("carrier", "MANUAL"),
             "shipping_status": "shipped",
@@ -1142,21 +4759,44 @@ def create_app(config_object=Config):
     @require_auth
     @require_role("producer")
     def get_producer_pool():
+        try:
+            limit, after = page_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if after is not None and not isinstance(after[0], str):
+            # Havuz created_at (ISO string) + id ile sıralı; başka tipte imleç indekste karşılaştırılamaz
+            return jsonify({"error": "Invalid cursor"}), 400
         try:
             producer = g.user
-            query = app.db.collection("orders").where("status", "==", "pending")
-            orders = []
-            for doc in query.stream():
-                order = doc.to_dict()
-                order['id'] = doc.id
-                product = get_product(order['product_id'])
-                if product and can_producer_handle_order(producer, product, order):
-                    order['product'] = product
-                    orders.append(order)
+
+            def handleable(pending):
+                products = get_products(order.get('product_id') for order in pending)
+                matched = []
+                for order in pending:
+                    product = products.get(order.get('product_id'))
+                    if product and can_producer_handle_order(producer, product, order):
+                        order['product'] = attach_thumbnail_url(dict(product))
+                        matched.append(order)
+                return matched
+
+            if pool_index is not None and pool_index.ready:
+                # İndeks yalnızca bu üreticinin basabileceği id'leri döndürür; sayfa toplu okunup yeniden doğrulanır
+                order_ids, next_cursor = pool_index.match(
+                    producer.get("materials_supported", []), producer.get("printers", []), limit, after
+                )
+                found = get_orders(order_ids)
+                orders = handleable([found[order_id] for order_id in order_ids
+                                     if found.get(order_id) and found[order_id].get("status") == "pending"])
+            else:
+                query = app.db.collection("orders").where("status", "==", "pending")
+                orders, next_cursor = paginate(query, "created_at", limit, after, select=handleable,
+                                               max_scan=app.config["POOL_SCAN_MAX"])
 
             return jsonify({
                 "orders": orders,
                 "count": len(orders),
+                "has_more": next_cursor is not None,
+                "next_cursor": encode_page_cursor(next_cursor) if next_cursor else None,
                 "producer_stats": {
                     "success_rate": producer.get("success_rate", 0),
                     "total_orders": producer.get("total_orders", 0)
@@ -1174,10 +4814,10 @@ def create_app(config_object=Config):
             data = request.get_json() or {}
 
             # 1) Önce state'i kabul et (yarış koşulunu engeller)
-            order_before = OrderStateMachine.transition(app.db, order_id, "accepted", g.user['id'], data.get('notes'))
+            order_before = transition_order(order_id, "accepted", g.user['id'], data.get('notes'))
 
             # 2) Producer bağla
-            app.db.collection("orders").document(order_id).update({
+            update_document("orders", order_id, {
                 "producer_id": g.user['id'],
                 "delivery_eta_days": data.get('delivery_eta_days', 3),
                 "producer_notes": data.get('notes', ''),
@@ -1190,7 +4830,7 @@ def create_app(config_object=Config):
             if not payment_url:
                 raise Exception("Payment link creation failed")
 
-            app.db.collection("orders").document(order_id).update({
+            update_document("orders", order_id, {
                 "payment_link": payment_url,
                 "payment_expires_at": (datetime.utcnow() + timedelta(hours=24)).isoformat()
             })
@@ -1219,7 +4859,7 @@ def create_app(config_object=Config):
         try:
             data = request.get_json() or {}
             reason = data.get('reason', 'Üretici tarafından reddedildi')
-            OrderStateMachine.transition(app.db, order_id, "rejected", g.user['id'], reason)
+            transition_order(order_id, "rejected", g.user['id'], reason)
             order = get_order(order_id)
             create_notification(order['customer_id'], "order_rejected", "Siparişiniz reddedildi", order_id, reason)
             return jsonify({"success": True})
@@ -1243,10 +4883,11 @@ def create_app(config_object=Config):
             if not (is_customer or is_producer or is_admin):
                 return jsonify({"error": "Unauthorized"}), 403
 
-            order['product'] = get_product(order['product_id'])
-            order['customer'] = get_user(order['customer_id'])
+            users = get_users([order.get('customer_id'), order.get('producer_id')])
+            order['product'] = attach_thumbnail_url(get_product(order['product_id']))
+            order['customer'] = users.get(order.get('customer_id'))
             if order.get('producer_id'):
-                order['producer'] = get_user(order['producer_id'])
+                order['producer'] = users.get(order['producer_id'])
 
             photos = []
             photo_docs = app.db.collection("photos").where("order_id", "==", order_id).stream()
@@ -1349,10 +4990,10 @@ def create_app(config_object=Config):
                 "archived": False
             }
 
-            photo_ref, _ = app.db.collection("photos").add(photo_data)
+            _, photo_ref = app.db.collection("photos").add(photo_data)
 
             if photo_type == 'before' and order['status'] == 'paid':
-                OrderStateMachine.transition(app.db, order_id, 'in_production', g.user['id'])
+                transition_order(order_id, 'in_production', g.user['id'])
 
             notify_user_id = order['customer_id'] if g.user['id'] == order.get('producer_id') else order.get('producer_id')
             if notify_user_id:
@@ -1392,7 +5033,7 @@ def create_app(config_object=Config):
             if not list(after_photos):
                 return jsonify({"error": "After photo required"}), 400
 
-            OrderStateMachine.transition(app.db, order_id, "completed_by_producer", g.user['id'])
+            transition_order(order_id, "completed_by_producer", g.user['id'])
             create_notification(order['customer_id'], "production_completed", "Siparişiniz tamamlandı", order_id, "Lütfen teslimi onaylayın")
             return jsonify({"success": True})
         except Exception as e:
@@ -1406,13 +5047,14 @@ def create_app(config_object=Config):
             data = request.get_json() or {}
             user_id = g.user['id']
 
-            @firestore.transactional
+            @transactional
             def confirm_delivery_transaction(transaction):
                 order_ref = app.db.collection("orders").document(order_id)
-                order_snap = transaction.get(order_ref)
+                order_snap = order_ref.get(transaction=transaction)
                 if not order_snap.exists:
                     raise ValueError("Order not found")
                 order = order_snap.to_dict()
+                stats_state = OrderStats.read_state(transaction, app.db)
 
                 if order['customer_id'] != user_id:
                     raise ValueError("Unauthorized")
@@ -1429,6 +5071,7 @@ def create_app(config_object=Config):
                         "review_text": data.get('review_text', ''),
                         "reviewed_at": now_iso()
                     })
+                updates.update(OrderStats.record_change(transaction, app.db, stats_state, order, {**order, **updates}))
                 transaction.update(order_ref, updates)
 
                 # Payout hesapla (refund düş)
@@ -1458,7 +5101,7 @@ def create_app(config_object=Config):
                 # Producer stats
                 if order.get('producer_id'):
                     prod_ref = app.db.collection("users").document(order['producer_id'])
-                    prod_snap = transaction.get(prod_ref)
+                    prod_snap = prod_ref.get(transaction=transaction)
                     if prod_snap.exists:
                         prod = prod_snap.to_dict() or {}
                         transaction.update(prod_ref, {
@@ -1469,6 +5112,8 @@ def create_app(config_object=Config):
                 return order
 
             order = confirm_delivery_transaction(app.db.transaction())
+            request_documents().forget("orders", order_id)
+            invalidate_user(order.get('producer_id'))
 
             if 'producer_id' in order and order['producer_id']:
                 create_notification(order['producer_id'], "order_confirmed", "Sipariş onaylandı", order_id, "Ödemeniz planlandı")
@@ -1503,8 +5148,8 @@ def create_app(config_object=Config):
                 if (datetime.utcnow() - dt.replace(tzinfo=None)).days > 7:
                     return jsonify({"error": "Dispute period expired"}), 400
 
-            OrderStateMachine.transition(app.db, order_id, "dispute_open", g.user['id'], data['reason'])
-            app.db.collection("orders").document(order_id).update({
+            transition_order(order_id, "dispute_open", g.user['id'], data['reason'])
+            update_document("orders", order_id, {
                 "dispute_reason": data['reason'],
                 "dispute_details": data.get('details', ''),
                 "dispute_opened_at": now_iso()
@@ -1575,8 +5220,8 @@ def create_app(config_object=Config):
             """
         else:
             try:
-                OrderStateMachine.transition(app.db, order_id, "paid", "system")
-                app.db.collection("orders").document(order_id).update({
+                transition_order(order_id, "paid", "system")
+                update_document("orders", order_id, {
                     "payment_status": "paid",
                     "paid_at": now_iso()
                 })
@@ -1607,8 +5252,8 @@ def create_app(config_object=Config):
         status = data.get("status")
         if status == "success" and order_id:
             try:
-                OrderStateMachine.transition(app.db, order_id, "paid", "system")
-                app.db.collection("orders").document(order_id).update({
+                transition_order(order_id, "paid", "system")
+                update_document("orders", order_id, {
                     "payment_status": "paid",
                     "paid_at": now_iso()
                 })
@@ -1657,12 +5302,13 @@ def create_app(config_object=Config):
                     ratings.append(order['rating'])
         success_rate = (completed / total * 100) if total > 0 else 0
         avg_rating = sum(ratings) / len(ratings) if ratings else 0
-        app.db.collection("users").document(producer_id).update({
+        update_document("users", producer_id, {
             "total_orders": total,
             "completed_orders": completed,
             "success_rate": success_rate,
             "average_rating": avg_rating
         })
+        invalidate_user(producer_id)
 
     # ---------- MESSAGES ----------
     @app.route("/api/orders/<order_id>/messages", methods=["GET"])
@@ -1674,13 +5320,16 @@ def create_app(config_object=Config):
         if g.user['id'] not in [order['customer_id'], order.get('producer_id')] and g.user.get('role') != 'admin':
             return jsonify({"error": "Unauthorized"}), 403
 
-        messages = []
-        message_docs = app.db.collection("messages").where("order_id", "==", order_id).order_by("created_at").stream()
-        for doc in message_docs:
-            msg = doc.to_dict()
-            msg['id'] = doc.id
-            msg['sender'] = get_user(msg['sender_id'])
-            messages.append(msg)
+        try:
+            limit, after = page_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        query = app.db.collection("messages").where("order_id", "==", order_id)
+        messages, next_cursor = paginate(query, "created_at", limit, after)
+        senders = get_users(msg.get('sender_id') for msg in messages)
+        for msg in messages:
+            msg['sender'] = copy.deepcopy(senders.get(msg.get('sender_id')))
 
         for msg in messages:
             if g.user['id'] not in msg.get('read_by', []):
@@ -1688,7 +5337,12 @@ def create_app(config_object=Config):
                     "read_by": firestore.ArrayUnion([g.user['id']])
                 })
 
-        return jsonify({"messages": messages, "count": len(messages)})
+        return jsonify({
+            "messages": messages,
+            "count": len(messages),
+            "has_more": next_cursor is not None,
+            "next_cursor": encode_page_cursor(next_cursor) if next_cursor else None
+        })
 
     @app.route("/api/orders/<order_id>/messages", methods=["POST"])
     @require_auth
@@ -1711,7 +5365,7 @@ def create_app(config_object=Config):
             "created_at": now_iso(),
             "read_by": [g.user['id']]
         }
-        msg_ref, _ = app.db.collection("messages").add(message_data)
+        _, msg_ref = app.db.collection("messages").add(message_data)
         message_data['id'] = msg_ref.id
         message_data['sender'] = g.user
 
@@ -1734,23 +5388,18 @@ def create_app(config_object=Config):
             days = int(request.args.get('days', 30))
             start_date = datetime.utcnow() - timedelta(days=days)
 
-            all_orders_docs = list(app.db.collection("orders").stream())
-            recent_orders = [
-                o for o in all_orders_docs
-                if o.to_dict().get('created_at', '') > start_date.isoformat()
-            ]
-
-            status_dist = {}
-            total_revenue = 0.0
-            total_commission = 0.0
-
-            for order_doc in all_orders_docs:
-                order = order_doc.to_dict()
-                status = order.get('status', 'unknown')
-                status_dist[status] = status_dist.get(status, 0) + 1
-                if order.get('payment_status') == 'paid':
-                    total_revenue += order.get('final_price', 0.0)
-                    total_commission += order.get('commission_amount', 0.0)
+            # Sayaç shard'ları + tek rollup okuması; kurulum işareti yoksa (ilk kurulum) bir kez tam taramayla kurulur
+            generation = OrderStats.current_generation(app.db)
+            if not generation:
+                try:
+                    generation = OrderStats.rebuild(app.db)["generation"]
+                except StatsRebuildInProgress:
+                    return jsonify({"error": "Statistics are being initialized, please retry"}), 503
+            totals = OrderStats.totals(app.db, generation)
+            # Gün çözünürlüğü: başlangıç günü dahil
+            before_start = (start_date - timedelta(days=1)).strftime("%Y-%m-%d")
+            recent_orders = totals["orders"] - OrderStats.cumulative(app.db, generation, before_start)["orders"]
+            status_dist = totals["status"]
 
             producers = []
             producer_docs = app.db.collection("users").where("role", "==", "producer").stream()
@@ -1765,21 +5414,15 @@ def create_app(config_object=Config):
                     "average_rating": prod.get('average_rating', 0)
                 })
 
-            material_usage = {}
-            for order_doc in all_orders_docs:
-                order = order_doc.to_dict()
-                material = order.get('material_name', 'Unknown')
-                material_usage[material] = material_usage.get(material, 0) + 1
-
             return jsonify({
                 "period_days": days,
-                "total_orders": len(all_orders_docs),
-                "recent_orders": len(recent_orders),
+                "total_orders": totals["orders"],
+                "recent_orders": recent_orders,
                 "status_distribution": status_dist,
-                "total_revenue": total_revenue,
-                "total_commission": total_commission,
+                "total_revenue": totals["revenue"],
+                "total_commission": totals["commission"],
                 "top_producers": sorted(producers, key=lambda x: x['total_orders'], reverse=True)[:10],
-                "material_usage": material_usage,
+                "material_usage": totals["material"],
                 "disputes_open": status_dist.get('dispute_open', 0)
             })
 
@@ -1787,19 +5430,89 @@ def create_app(config_object=Config):
             logger.error(f"Admin stats error: {e}")
             return jsonify({"error": "Failed to get stats"}), 500
 
+    @app.route("/api/admin/stats/rebuild", methods=["POST"])
+    @require_auth
+    @require_role("admin")
+    def rebuild_admin_stats():
+        # Sayaçları siparişlerden yeniden kurar (ilk kurulum, elle düzeltilen siparişler sonrası)
+        try:
+            totals = OrderStats.rebuild(app.db)
+            return jsonify({"success": True, "generation": totals["generation"], "total_orders": totals["orders"]})
+        except StatsRebuildInProgress as e:
+            return jsonify({"error": str(e)}), 409
+        except Exception as e:
+            logger.error(f"Admin stats rebuild error: {e}")
+            return jsonify({"error": "Failed to rebuild stats"}), 500
+
+    @app.route("/api/admin/analytics", methods=["GET"])
+    @require_auth
+    @require_role("admin")
+    def get_admin_analytics():
+        # Örn. ?metric=revenue&group_by=material&bucket=week&time=paid&since=2026-01-01&top=10&producer=<id>
+        if order_analytics is None:
+            return jsonify({"error": "Analytics is disabled"}), 404
+        args = request.args
+        metric = args.get("metric", "orders")
+        group_by = args.get("group_by") or None
+        bucket = args.get("bucket") or None
+        time_field = args.get("time", "created")
+        if metric not in OrderAnalytics.METRICS:
+            return jsonify({"error": f"metric must be one of {', '.join(OrderAnalytics.METRICS)}"}), 400
+        if group_by is not None and group_by not in OrderAnalytics.DIMENSIONS:
+            return jsonify({"error": f"group_by must be one of {', '.join(OrderAnalytics.DIMENSIONS)}"}), 400
+        if bucket is not None and bucket not in OrderAnalytics.BUCKETS:
+            return jsonify({"error": f"bucket must be one of {', '.join(OrderAnalytics.BUCKETS)}"}), 400
+        if time_field not in OrderAnalytics.TIME_FIELDS:
+            return jsonify({"error": f"time must be one of {', '.join(OrderAnalytics.TIME_FIELDS)}"}), 400
+        top = args.get("top", 20, type=int)
+        if top is None or not 1 <= top <= app.config["ANALYTICS_TOP_MAX"]:
+            return jsonify({"error": f"top must be between 1 and {app.config['ANALYTICS_TOP_MAX']}"}), 400
+        bounds = {}
+        for name in ("since", "until"):
+            if args.get(name):
+                try:
+                    moment = datetime.fromisoformat(args[name].rstrip("Z"))
+                except ValueError:
+                    return jsonify({"error": f"{name} must be an ISO date"}), 400
+                bounds[name] = int(moment.replace(tzinfo=moment.tzinfo or timezone.utc).timestamp())
+        filters = {name: args[name] for name in OrderAnalytics.DIMENSIONS if args.get(name)}
+
+        order_analytics.start()
+        if not order_analytics.ready:
+            response = jsonify({"error": "Analytics snapshot is warming up, please retry", "snapshot": order_analytics.stats()})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+
+        try:
+            t0 = time.perf_counter()
+            result = order_analytics.query(metric, group_by, bucket, time_field, filters=filters, top=top, **bounds)
+            result["query_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            result["snapshot"] = order_analytics.stats()
+            return jsonify(result)
+        except Exception as e:
+            logger.error(f"Admin analytics error: {e}")
+            return jsonify({"error": "Failed to run analytics query"}), 500
+
     @app.route("/api/admin/disputes", methods=["GET"])
     @require_auth
     @require_role("admin")
     def get_disputes():
-        disputes = []
-        dispute_orders = app.db.collection("orders").where("status", "==", "dispute_open").stream()
-        for doc in dispute_orders:
-            order = doc.to_dict()
-            order['id'] = doc.id
-            order['customer'] = get_user(order['customer_id'])
-            order['producer'] = get_user(order['producer_id'])
-            disputes.append(order)
-        return jsonify({"disputes": disputes, "count": len(disputes)})
+        try:
+            limit, after = page_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query = app.db.collection("orders").where("status", "==", "dispute_open")
+        disputes, next_cursor = paginate(query, "created_at", limit, after)
+        users = get_users(uid for order in disputes for uid in (order.get('customer_id'), order.get('producer_id')))
+        for order in disputes:
+            order['customer'] = copy.deepcopy(users.get(order.get('customer_id')))
+            order['producer'] = copy.deepcopy(users.get(order.get('producer_id')))
+        return jsonify({
+            "disputes": disputes,
+            "count": len(disputes),
+            "has_more": next_cursor is not None,
+            "next_cursor": encode_page_cursor(next_cursor) if next_cursor else None
+        })
 
     @app.route("/api/admin/disputes/<order_id>/resolve", methods=["POST"])
     @require_auth
@@ -1810,8 +5523,8 @@ def create_app(config_object=Config):
         if resolution not in ['confirmed', 'refunded', 'partial_refund']:
             return jsonify({"error": "Invalid resolution"}), 400
         try:
-            OrderStateMachine.transition(app.db, order_id, resolution, g.user['id'], data.get('reason', ''))
-            app.db.collection("orders").document(order_id).update({
+            transition_order(order_id, resolution, g.user['id'], data.get('reason', ''))
+            update_document("orders", order_id, {
                 "dispute_resolution": resolution,
                 "dispute_resolved_at": now_iso(),
                 "dispute_resolved_by": g.user['id'],
@@ -1838,6 +5551,40 @@ def create_app(config_object=Config):
             logger.error(f"Dispute resolution error: {e}")
             return jsonify({"error": str(e)}), 400
 
+    @app.route("/api/admin/metrics", methods=["GET"])
+    @require_auth
+    @require_role("admin")
+    def get_runtime_metrics():
+        return jsonify({
+            "caches": {
+                "stl_analysis": stl_cache.stats(),
+                "preview_mesh": preview_cache.stats(),
+                "quotes": quote_cache.stats(),
+                "pricing_products": product_cache.stats(),
+                "materials": materials_registry.stats(),
+                "pending_pool": pool_index.stats() if pool_index is not None else None,
+                "producers": producer_index.stats() if producer_index is not None else None,
+                "order_analytics": order_analytics.stats() if order_analytics is not None else None,
+                "id_tokens": token_cache.stats(),
+                "user_profiles": user_cache.stats()
+            },
+            "document_loaders": {name: loader.stats() for name, loader in loaders.items()},
+            "token_verifier": token_verifier.stats() if token_verifier is not None else {"mode": "firebase_admin"},
+            "stl_analysis_pool": analysis_service.stats(),
+            "order_fanout": order_fanout.stats()
+        })
+
+    if isinstance(app.bucket, LocalBucket):
+        # Yerel backend'in signed URL'leri (Firebase Storage signed URL karşılığı)
+        @app.route(LocalBucket.URL_PREFIX + "<path:blob_name>", methods=["GET"])
+        def local_storage_download(blob_name):
+            if not app.bucket.verify(blob_name, request.args.get("expires"), request.args.get("signature")):
+                return jsonify({"error": "Invalid or expired signature"}), 403
+            blob = app.bucket.blob(blob_name)
+            if not blob.exists():
+                return jsonify({"error": "Resource not found"}), 404
+            return send_file(blob._path(), mimetype=mimetypes.guess_type(blob_name)[0] or "application/octet-stream")
+
     # ---------- SOCKET.IO EVENTS ----------
     @socketio.on('connect')
     def handle_connect():
@@ -1859,7 +5606,7 @@ def create_app(config_object=Config):
         if token_raw.startswith("Bearer "):
             id_token = token_raw.split(" ", 1)[1]
             try:
-                decoded = fb_auth.verify_id_token(id_token)
+                decoded = verify_id_token_cached(id_token)
                 uid = decoded.get("uid")
             except Exception:
                 emit('authenticated', {'success': False})
@@ -1870,8 +5617,7 @@ def create_app(config_object=Config):
             emit('authenticated', {'success': False})
             return
 
-        user_doc = app.db.collection("users").document(uid).get()
-        if user_doc.exists:
+        if get_user(uid) is not None:
             socket_sessions[uid] = request.sid
             join_room(f"user_{uid}")
             emit('authenticated', {'success': True})
@@ -1892,7 +5638,7 @@ def create_app(config_object=Config):
         if token_raw.startswith("Bearer "):
             id_token = token_raw.split(" ", 1)[1]
             try:
-                decoded = fb_auth.verify_id_token(id_token)
+                decoded = verify_id_token_cached(id_token)
                 uid = decoded.get("uid")
             except Exception:
                 emit('error', {'message': 'Unauthorized'})
@@ -1960,12 +5706,12 @@ def create_app(config_object=Config):
         for order_doc in old_orders:
             order = order_doc.to_dict()
             if order.get('status') in ['pending', 'accepted']:
-                app.db.collection("orders").document(order_doc.id).update({
-                    "status": "cancelled",
-                    "cancelled_reason": "Payment timeout",
-                    "cancelled_at": now_iso()
-                })
-                count += 1
+                # Geçiş üzerinden: istatistik sayaçları ve durum geçmişi aynı transaction'da güncellenir
+                try:
+                    OrderStateMachine.transition(app.db, order_doc.id, "cancelled", "system", "Payment timeout")
+                    count += 1
+                except ValueError as e:
+                    logger.warning(f"Cleanup skipped order {order_doc.id}: {e}")
         logger.info(f"Cleaned up {count} old unpaid orders")
 
     def archive_old_photos():
@@ -1986,6 +5732,7 @@ def create_app(config_object=Config):
             try:
                 cleanup_old_orders()
                 archive_old_photos()
+                OrderStats.rollup(app.db, (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d"))
             except Exception as e:
                 logger.error(f"Scheduled task error: {e}")
 
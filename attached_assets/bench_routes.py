@@ -0,0 +1,107 @@
+# Route throughput benchmark'ı: yerel (SQLite + dosya sistemi) depolama backend'i üzerinde, Firebase'siz
+# Kullanım: python bench_routes.py [order_count] [requests_per_route]
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_app_module():
+    spec = importlib.util.spec_from_file_location("marketplace_app", os.path.join(HERE, "app_1756894532796.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_app(data_dir):
+    class BenchConfig(APP.Config):
+        DEBUG = True  # "Token <uid>" geliştirici kimlik doğrulaması
+        REQUIRE_HTTPS = False
+        STORAGE_BACKEND = "local"
+        LOCAL_DB_PATH = os.path.join(data_dir, "firestore.sqlite3")
+        LOCAL_BLOB_DIR = os.path.join(data_dir, "blobs")
+        TOKEN_VERIFIER = "firebase_admin"  # sertifika ucuna gitmesin
+    app, _ = APP.create_app(BenchConfig)
+    return app
+
+
+def seed(db, order_count, seed=42):
+    rng = np.random.default_rng(seed)
+    statuses = ["pending", "accepted", "paid", "in_production", "confirmed", "dispute_open"]
+    materials = ["PLA", "ABS", "PETG", "TPU"]
+    customer_count = max(order_count // 10, 1)
+    db.collection("users").document("admin").set({"name": "Admin", "role": "admin"})
+    db.collection("users").document("producer").set({
+        "name": "Producer", "role": "producer", "materials_supported": materials,
+        "printers": [{"max_xyz": [220, 220, 250]}]
+    })
+    for i in range(customer_count):
+        db.collection("users").document(f"c{i}").set({"name": f"Customer {i}", "role": "customer"})
+    for i in range(order_count):
+        dims = [float(x) for x in rng.uniform(10, 300, size=3)]
+        db.collection("products").document(f"p{i}").set({
+            "analysis": {"dimensions_mm": dims, "estimated_weight_g": float(rng.uniform(5, 500))}
+        })
+        db.collection("orders").document(f"o{i}").set({
+            "status": statuses[int(rng.integers(len(statuses)))],
+            "product_id": f"p{i}",
+            "customer_id": f"c{i % customer_count}",
+            "producer_id": "producer",
+            "material_name": materials[int(rng.integers(len(materials)))],
+            "final_price": float(rng.uniform(20, 2000)),
+            "commission_amount": float(rng.uniform(2, 200)),
+            "created_at": APP.now_iso()
+        })
+    for i in range(200):
+        db.collection("messages").document(f"m{i}").set({
+            "order_id": "o0", "sender_id": "c0" if i % 2 else "producer", "body": f"message {i}",
+            "created_at": f"{i:06d}", "read_by": ["c0", "producer", "admin"]
+        })
+
+
+def bench(client, path, uid, repeat):
+    headers = {"Authorization": f"Token {uid}"}
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, (path, response.status_code)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        client.get(path, headers=headers)
+    elapsed = time.perf_counter() - t0
+    return elapsed / repeat, len(response.data)
+
+
+def main():
+    order_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    data_dir = tempfile.mkdtemp(prefix="bench_routes_")
+    try:
+        app = make_app(data_dir)
+        t0 = time.perf_counter()
+        seed(app.db, order_count)
+        print(f"orders:     {order_count:,} (seeded in {time.perf_counter() - t0:.1f} s)")
+        client = app.test_client()
+        routes = [
+            ("/api/producer/pool", "producer"),
+            ("/api/admin/disputes", "admin"),
+            ("/api/admin/stats", "admin"),
+            ("/api/orders/o0/messages", "admin"),
+            ("/api/orders/o0", "admin"),
+        ]
+        for path, uid in routes:
+            latency, size = bench(client, path, uid, repeat)
+            print(f"{path:28s} {latency * 1000:9.2f} ms  {1 / latency:8.1f} req/s  {size / 1024:8.1f} KiB")
+        app.analysis_service.shutdown()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+APP = load_app_module()
+
+if __name__ == "__main__":
+    main()
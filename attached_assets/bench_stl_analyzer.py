@@ -0,0 +1,63 @@
+# STL analiz benchmark'ı: eski üçgen-başına yol vs. vektörel blok yolu
+# Kullanım: python bench_stl_analyzer.py [triangle_count]
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_app_module():
+    spec = importlib.util.spec_from_file_location("marketplace_app", os.path.join(HERE, "app_1756894532796.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_random_binary_stl(path, triangle_count, seed=42):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(triangle_count, dtype=APP.STL_RECORD_DTYPE)
+    records['vertices'] = rng.uniform(-50.0, 50.0, size=(triangle_count, 3, 3)).astype(np.float32)
+    with open(path, "wb") as f:
+        f.write(b"\0" * 80)
+        f.write(np.uint32(triangle_count).tobytes())
+        f.write(records.tobytes())
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    triangle_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    fd, path = tempfile.mkstemp(suffix=".stl")
+    os.close(fd)
+    try:
+        write_random_binary_stl(path, triangle_count)
+        legacy, t_legacy = timed(APP.STLAnalyzer.analyze_stl_binary_streaming, path)
+        fast, t_fast = timed(APP.STLAnalyzer.analyze_stl_binary_vectorized, path)
+
+        assert legacy['triangle_count'] == fast['triangle_count']
+        assert np.allclose(legacy['dimensions_mm'], fast['dimensions_mm'])
+        for key in ('volume_mm3', 'surface_area_mm2', 'bounding_box_volume_mm3'):
+            assert np.isclose(legacy[key], fast[key], rtol=1e-9), key
+        assert legacy['preview'] == fast['preview']
+
+        print(f"triangles:  {triangle_count:,}")
+        print(f"legacy:     {t_legacy:8.3f} s")
+        print(f"vectorized: {t_fast:8.3f} s")
+        print(f"speedup:    {t_legacy / max(t_fast, 1e-9):8.1f}x")
+    finally:
+        os.remove(path)
+
+
+APP = load_app_module()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "attached_assets", "app_1756894532796.py")
+
+
+def _load_app_module():
+    spec = importlib.util.spec_from_file_location("marketplace_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+APP_MODULE = _load_app_module()
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    return APP_MODULE
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    # Yerel depolama (SQLite :memory: + geçici blob dizini) ile uygulama; DEBUG'da "Token <uid>" ile kimlik doğrulanır
+    apps = []
+
+    def factory(**overrides):
+        settings = {
+            "DEBUG": True,
+            "REQUIRE_HTTPS": False,
+            "STORAGE_BACKEND": "local",
+            "LOCAL_DB_PATH": ":memory:",
+            "LOCAL_BLOB_DIR": str(tmp_path / "blobs"),
+            "TOKEN_VERIFIER": "firebase_admin",
+            "STL_ANALYSIS_START_METHOD": "fork",
+        }
+        settings.update(overrides)
+        config = type("TestConfig", (APP_MODULE.Config,), settings)
+        app, _ = APP_MODULE.create_app(config)
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        for name in ("pool_index", "producer_index", "materials_registry", "order_analytics"):
+            component = getattr(app, name, None)
+            if component is not None:
+                component.stop()
+        app.analysis_service.shutdown()
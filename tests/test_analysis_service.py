@@ -0,0 +1,66 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+
+def sleep_and_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def crash_worker():
+    os._exit(1)
+
+
+@pytest.fixture
+def service(app_module):
+    service = app_module.STLAnalysisService(max_workers=1, max_queue=2, timeout=1.0, start_method="fork")
+    yield service
+    service.shutdown()
+
+
+def test_timeout_does_not_fail_other_jobs(service):
+    # Bir işin timeout'u pool'u sonlandırır; arkasında bekleyen iş yeni pool'da yeniden denenir
+    errors = []
+
+    def slow():
+        try:
+            service.run(sleep_and_return, 5.0, "slow")
+        except FuturesTimeoutError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=slow)
+    thread.start()
+    time.sleep(0.2)
+    assert service.run(sleep_and_return, 0.1, "ok") == "ok"
+    thread.join()
+    assert len(errors) == 1
+    stats = service.stats()
+    assert stats["timed_out"] == 1 and stats["retried"] == 1
+    assert service.run(sleep_and_return, 0, "after") == "after"
+
+
+def test_crashing_job_is_not_retried(service):
+    with pytest.raises(BrokenProcessPool):
+        service.run(crash_worker)
+    assert service.stats()["retried"] == 0
+    assert service.run(sleep_and_return, 0, "after") == "after"
+
+
+def test_upload_returns_503_when_worker_dies(make_app, monkeypatch):
+    app = make_app(POOL_INDEX_ENABLED=False, PRODUCER_INDEX_ENABLED=False, ANALYTICS_ENABLED=False)
+    app.db.collection("users").document("u1").set({"name": "U", "role": "customer"})
+
+    def broken(file_path):
+        raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(app.analysis_service, "analyze", broken)
+    response = app.test_client().post("/api/upload/stl", headers={"Authorization": "Token u1"},
+                                      data={"file": (io.BytesIO(b"\0" * 84), "part.stl")},
+                                      content_type="multipart/form-data")
+    assert response.status_code == 503
@@ -0,0 +1,76 @@
+import inspect
+
+import pytest
+
+
+@pytest.fixture
+def store(app_module):
+    db = app_module.LocalDocumentStore(":memory:")
+    db.collection("orders").document("o1").set({"status": "pending"})
+    return db
+
+
+def test_transaction_get_matches_firestore_contract(app_module, store):
+    # google.cloud.firestore Transaction.get: belge referansı için de üreteç (tek snapshot) döner
+    ref = store.collection("orders").document("o1")
+    seen = {}
+
+    @app_module.transactional
+    def read(transaction):
+        result = transaction.get(ref)
+        seen["generator"] = inspect.isgenerator(result)
+        seen["snapshots"] = [snap.to_dict() for snap in result]
+        seen["direct"] = ref.get(transaction=transaction).to_dict()
+        seen["query"] = [doc.id for doc in transaction.get(store.collection("orders").where("status", "==", "pending"))]
+
+    read(store.transaction())
+    assert seen == {"generator": True, "snapshots": [{"status": "pending"}],
+                    "direct": {"status": "pending"}, "query": ["o1"]}
+
+
+def test_transaction_get_missing_document(app_module, store):
+    ref = store.collection("orders").document("missing")
+
+    @app_module.transactional
+    def read(transaction):
+        return [snap.exists for snap in transaction.get(ref)], ref.get(transaction=transaction).exists
+
+    assert read(store.transaction()) == ([False], False)
+
+
+def test_listener_receives_only_written_documents(app_module, store):
+    events = []
+    store.collection("orders").where("status", "==", "pending").on_snapshot(
+        lambda docs, changes, read_time: events.append(
+            (sorted(doc.id for doc in docs), [(change.type.name, change.document.id) for change in changes])))
+    orders = store.collection("orders")
+    orders.document("o2").set({"status": "pending"})
+    orders.document("o3").set({"status": "draft"})
+    orders.document("o1").update({"note": "x"})
+    orders.document("o2").update({"status": "accepted"})
+    orders.document("o3").update({"status": "pending"})
+    orders.document("o1").delete()
+    assert events == [
+        (["o1"], [("ADDED", "o1")]),
+        (["o1", "o2"], [("ADDED", "o2")]),
+        (["o1", "o2"], [("MODIFIED", "o1")]),
+        (["o1"], [("REMOVED", "o2")]),
+        (["o1", "o3"], [("ADDED", "o3")]),
+        (["o3"], [("REMOVED", "o1")]),
+    ]
+
+
+def test_listener_batch_matches_full_query(app_module, store):
+    latest = {}
+    query = store.collection("orders").where("status", "in", ["pending", "accepted"])
+    query.on_snapshot(lambda docs, changes, read_time: latest.update(docs={doc.id: doc.to_dict() for doc in docs}))
+
+    @app_module.transactional
+    def write_many(transaction):
+        for i in range(1200):
+            ref = store.collection("orders").document(f"b{i:04d}")
+            transaction.set(ref, {"status": ("pending", "accepted", "draft")[i % 3], "n": i})
+
+    write_many(store.transaction())
+    assert latest["docs"] == {doc.id: doc.to_dict() for doc in query.stream()}
+    assert len(latest["docs"]) == 801
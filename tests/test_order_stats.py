@@ -0,0 +1,97 @@
+import pytest
+
+ADMIN = {"Authorization": "Token adm"}
+
+
+@pytest.fixture
+def stats_app(make_app):
+    # Yerel transaction.get(ref) Firestore'daki gibi üreteç döndürür; sipariş transaction'ları buna dayanmamalı
+    app = make_app(POOL_INDEX_ENABLED=False, PRODUCER_INDEX_ENABLED=False, ANALYTICS_ENABLED=False)
+    app.db.collection("users").document("adm").set({"name": "A", "role": "admin"})
+    return app
+
+
+def add_order(app_module, db, order_id, **fields):
+    order = {"status": "pending", "payment_status": "unpaid", "material_name": "PLA", "final_price": 50.0,
+             "commission_amount": 5.0, "created_at": app_module.now_iso(), "customer_id": "c1", **fields}
+    stats = app_module.OrderStats
+    ref = db.collection("orders").document(order_id)
+
+    @app_module.transactional
+    def create(transaction):
+        data = dict(order)
+        data.update(stats.record_change(transaction, db, stats.read_state(transaction, db), None, data))
+        transaction.set(ref, data)
+
+    create(db.transaction())
+
+
+def brute_force(app_module, db):
+    stats = app_module.OrderStats
+    totals = {}
+    for doc in db.collection("orders").stream():
+        stats._accumulate(totals, stats._contribution(doc.to_dict())[0])
+    return totals
+
+
+def assert_matches_scan(app_module, app):
+    response = app.test_client().get("/api/admin/stats", headers=ADMIN)
+    assert response.status_code == 200
+    body, expected = response.get_json(), brute_force(app_module, app.db)
+    assert body["total_orders"] == expected.get("orders", 0)
+    assert body["status_distribution"] == {k: v for k, v in expected.get("status", {}).items() if v}
+    assert body["material_usage"] == {k: v for k, v in expected.get("material", {}).items() if v}
+    assert body["total_revenue"] == pytest.approx(expected.get("revenue", 0.0))
+
+
+def pay(app_module, db, order_id):
+    machine = app_module.OrderStateMachine
+    machine.transition(db, order_id, "accepted", "p1")
+    machine.transition(db, order_id, "paid", "system")
+
+
+def test_bootstrap_then_incremental(app_module, stats_app):
+    db = stats_app.db
+    for i in range(4):
+        add_order(app_module, db, f"old{i}", material_name="ABS", final_price=10.0 + i)
+    app_module.OrderStateMachine.transition(db, "old0", "cancelled", "c1")
+    assert app_module.OrderStats.current_generation(db) is None
+    assert_matches_scan(app_module, stats_app)
+
+    pay(app_module, db, "old1")
+    add_order(app_module, db, "new0")
+    assert_matches_scan(app_module, stats_app)
+    assert len({doc.to_dict()["generation"] for doc in db.collection("stats_shards").stream()}) == 1
+
+
+def test_writes_during_rebuild_are_counted_once(app_module, stats_app, monkeypatch):
+    db, stats = stats_app.db, app_module.OrderStats
+    for i in range(5):
+        add_order(app_module, db, f"o{i}")
+    assert_matches_scan(app_module, stats_app)
+
+    contribution, calls = stats._contribution, []
+
+    def contribution_with_writes(order):
+        # Tarama ortasında: taranmış ve taranmamış siparişlere yazım + yeni sipariş
+        calls.append(1)
+        if len(calls) == 3:
+            pay(app_module, db, "o0")
+            pay(app_module, db, "o4")
+            add_order(app_module, db, "late")
+        return contribution(order)
+
+    monkeypatch.setattr(stats, "_contribution", staticmethod(contribution_with_writes))
+    response = stats_app.test_client().post("/api/admin/stats/rebuild", headers=ADMIN)
+    monkeypatch.setattr(stats, "_contribution", staticmethod(contribution))
+    assert response.status_code == 200
+    assert_matches_scan(app_module, stats_app)
+
+
+def test_rebuild_in_progress_conflict(app_module, stats_app):
+    db = stats_app.db
+    db.collection("stats_meta").document("state").set(
+        {"pending_generation": "other", "pending_started_at": app_module.time.time()}, merge=True)
+    client = stats_app.test_client()
+    assert client.post("/api/admin/stats/rebuild", headers=ADMIN).status_code == 409
+    assert client.get("/api/admin/stats", headers=ADMIN).status_code == 503
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def store(app_module):
+    db = app_module.LocalDocumentStore(":memory:")
+    db.collection("orders").document("o1").set({"status": "pending", "customer_id": "c1",
+                                                "created_at": "2025-01-01T00:00:00"})
+    return db
+
+
+def history(db, order_id):
+    return sorted((doc.to_dict() for doc in db.collection("order_state_history")
+                   .where("order_id", "==", order_id).stream()), key=lambda entry: entry["created_at"])
+
+
+def test_transition_updates_order_and_history(app_module, store):
+    machine = app_module.OrderStateMachine
+    before, written = machine.transition_with_update(store, "o1", "accepted", "p1", "ok")
+    assert before["status"] == "pending"
+    assert written["status"] == "accepted" and written["accepted_by"] == "p1"
+    order = store.collection("orders").document("o1").get().to_dict()
+    assert order["status"] == "accepted" and order["accepted_reason"] == "ok"
+    assert [(h["from_state"], h["to_state"], h["actor_id"]) for h in history(store, "o1")] == [
+        ("pending", "accepted", "p1")]
+
+
+def test_invalid_transition_writes_nothing(app_module, store):
+    with pytest.raises(ValueError, match="Cannot transition"):
+        app_module.OrderStateMachine.transition(store, "o1", "confirmed", "c1")
+    assert store.collection("orders").document("o1").get().to_dict()["status"] == "pending"
+    assert history(store, "o1") == []
+
+
+def test_missing_order(app_module, store):
+    with pytest.raises(ValueError, match="Order not found"):
+        app_module.OrderStateMachine.transition(store, "missing", "accepted", "p1")
+
+
+def test_concurrent_transitions_have_one_winner(app_module, store):
+    # accepted ve rejected birbirine geçemez: aynı anda denenen iki geçişten yalnızca biri uygulanmalı
+    machine = app_module.OrderStateMachine
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def attempt(state):
+        barrier.wait()
+        try:
+            machine.transition(store, "o1", state, "p1")
+            results[state] = True
+        except ValueError:
+            results[state] = False
+
+    threads = [threading.Thread(target=attempt, args=(state,)) for state in ("accepted", "rejected")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results.values()) == [False, True]
+    winner = next(state for state, ok in results.items() if ok)
+    assert store.collection("orders").document("o1").get().to_dict()["status"] == winner
+    assert [h["to_state"] for h in history(store, "o1")] == [winner]
+
+
+def test_reject_route(make_app):
+    app = make_app(POOL_INDEX_ENABLED=False, PRODUCER_INDEX_ENABLED=False, ANALYTICS_ENABLED=False)
+    app.db.collection("users").document("p1").set({"name": "P", "role": "producer"})
+    app.db.collection("orders").document("o1").set({"status": "pending", "customer_id": "c1"})
+    client = app.test_client()
+    headers = {"Authorization": "Token p1"}
+    assert client.post("/api/orders/o1/reject", json={"reason": "busy"}, headers=headers).status_code == 200
+    assert app.db.collection("orders").document("o1").get().to_dict()["status"] == "rejected"
+    response = client.post("/api/orders/o1/reject", json={}, headers=headers)
+    assert response.status_code == 400
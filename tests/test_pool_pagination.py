@@ -0,0 +1,72 @@
+import pytest
+
+HEADERS = {"Authorization": "Token p1"}
+
+
+@pytest.fixture
+def pool_app(make_app):
+    app = make_app(PRODUCER_INDEX_ENABLED=False, ANALYTICS_ENABLED=False)
+    db = app.db
+    db.collection("users").document("p1").set({"name": "P", "role": "producer", "materials_supported": ["PLA"],
+                                                "printers": [{"max_xyz": [200, 200, 200]}]})
+    for i in range(60):
+        db.collection("products").document(f"p{i}").set(
+            {"analysis": {"dimensions_mm": [10, 10, 500] if i % 5 == 0 else [10, 10, 10]}})
+        db.collection("orders").document(f"o{i}").set({
+            "status": "pending" if i % 3 else "dispute_open",
+            "product_id": f"p{i}",
+            "material_name": "PLA" if i % 2 else "ABS",
+            "customer_id": "c1",
+            "created_at": f"2025-01-{1 + i % 28:02d}T00:00:00"
+        })
+    return app
+
+
+def expected_ids():
+    # bekleyen + PLA + yazıcıya sığan
+    return {f"o{i}" for i in range(60) if i % 3 and i % 2 and i % 5}
+
+
+def walk(client, limit):
+    seen, after = [], None
+    while True:
+        url = f"/api/producer/pool?limit={limit}" + (f"&after={after}" if after else "")
+        response = client.get(url, headers=HEADERS)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page["orders"]) <= limit
+        seen += [order["id"] for order in page["orders"]]
+        if not page["has_more"]:
+            return seen
+        after = page["next_cursor"]
+
+
+@pytest.mark.parametrize("limit", [1, 4, 50])
+def test_pages_cover_pool_once(pool_app, limit):
+    seen = walk(pool_app.test_client(), limit)
+    assert len(seen) == len(set(seen))
+    assert set(seen) == expected_ids()
+
+
+def test_index_tracks_transitions(pool_app):
+    first = min(expected_ids())
+    pool_app.db.collection("orders").document(first).update({"status": "accepted"})
+    assert set(walk(pool_app.test_client(), 5)) == expected_ids() - {first}
+
+
+def test_fallback_scan_matches_index(pool_app):
+    client = pool_app.test_client()
+    indexed = walk(client, 4)
+    pool_app.pool_index.ready = False
+    assert walk(client, 4) == indexed
+
+
+@pytest.mark.parametrize("values", [[123, "o1"], [None, "o1"], [["2025"], "o1"], ["2025-01-01", 5], ["x"], {}])
+def test_malformed_cursor_is_rejected(pool_app, app_module, values):
+    cursor = app_module.encode_page_cursor(values)
+    response = pool_app.test_client().get(f"/api/producer/pool?after={cursor}", headers=HEADERS)
+    assert response.status_code == 400
+
+
+def test_garbage_cursor_is_rejected(pool_app):
+    assert pool_app.test_client().get("/api/producer/pool?after=%%%", headers=HEADERS).status_code == 400
@@ -0,0 +1,74 @@
+import pytest
+
+ANALYSIS = {"estimated_weight_g": 40.0, "estimated_support_weight_g": 6.0, "estimated_print_time_minutes": 120.0,
+            "triangle_count": 1000, "support_required": True}
+HEADERS = {"Authorization": "Token c1"}
+
+
+@pytest.mark.parametrize("requested, used", [(None, True), (True, True), (False, False)])
+def test_client_choice_wins_over_analysis(app_module, requested, used):
+    engine = app_module.PricingEngine
+    price = engine.calculate_price(ANALYSIS, {"material_price_per_g": 0.05, "support_required": requested})
+    assert (price["breakdown"]["support_cost"] > 0) is used
+    expected = engine.calculate_price(dict(ANALYSIS, support_required=used), {"material_price_per_g": 0.05})
+    assert price == expected
+
+
+def test_grid_support_axis_follows_client(app_module):
+    engine = app_module.PricingEngine
+    np = app_module.np
+    grid = engine.calculate_price_grid(ANALYSIS, {"material_price_per_g": 0.05,
+                                                  "support_required": np.array([False, True])})
+    for i, support in enumerate((False, True)):
+        scalar = engine.calculate_price(ANALYSIS, {"material_price_per_g": 0.05, "support_required": support})
+        assert engine.round_grid(grid["customer_price"][i]) == scalar["customer_price"]
+    assert grid["customer_price"][0] < grid["customer_price"][1]
+
+
+@pytest.fixture
+def client(make_app):
+    app = make_app(POOL_INDEX_ENABLED=False, PRODUCER_INDEX_ENABLED=False, ANALYTICS_ENABLED=False)
+    app.db.collection("users").document("c1").set({"name": "C", "role": "customer"})
+    app.db.collection("products").document("prod1").set({"analysis": ANALYSIS})
+    app.db.collection("materials").document("pla").set({"name": "PLA", "price_per_gram": 0.05, "active": True})
+    app.materials_registry.reload()
+    return app.test_client()
+
+
+def quote(client, **fields):
+    return client.post("/api/pricing/quote", headers=HEADERS,
+                       json={"product_id": "prod1", "material_id": "pla", **fields})
+
+
+def test_quote_echoes_support_actually_used(client):
+    without = quote(client, support_required=False).get_json()
+    default = quote(client).get_json()
+    assert without["params"]["support_required"] is False
+    assert default["params"]["support_required"] is True
+    assert without["pricing"]["customer_price"] < default["pricing"]["customer_price"]
+
+
+def test_quote_rejects_non_boolean_support(client):
+    assert quote(client, support_required="false").status_code == 400
+
+
+def batch(client, **fields):
+    return client.post("/api/pricing/quote/batch", headers=HEADERS, json={"product_id": "prod1", **fields})
+
+
+def test_batch_support_axis_varies(client):
+    body = batch(client, support_options=[False, True]).get_json()
+    assert body["axes"]["support_required"] == [False, True]
+    without, with_support = body["customer_price"][0][0]
+    assert without[0] < with_support[0]
+    single = quote(client, support_required=False).get_json()["pricing"]["customer_price"]
+    assert without[0] == single
+
+
+def test_batch_defaults_to_analysis_support(client):
+    assert batch(client).get_json()["axes"]["support_required"] == [True]
+
+
+@pytest.mark.parametrize("options", [["false"], [0], "true", [True, None], []])
+def test_batch_rejects_non_boolean_support_options(client, options):
+    assert batch(client, support_options=options).status_code == 400
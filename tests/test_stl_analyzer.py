@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+CUBE_FACES = [
+    ((0, 0, 0), (0, 1, 0), (1, 1, 0)), ((0, 0, 0), (1, 1, 0), (1, 0, 0)),
+    ((0, 0, 1), (1, 0, 1), (1, 1, 1)), ((0, 0, 1), (1, 1, 1), (0, 1, 1)),
+    ((0, 0, 0), (1, 0, 0), (1, 0, 1)), ((0, 0, 0), (1, 0, 1), (0, 0, 1)),
+    ((0, 1, 0), (0, 1, 1), (1, 1, 1)), ((0, 1, 0), (1, 1, 1), (1, 1, 0)),
+    ((0, 0, 0), (0, 0, 1), (0, 1, 1)), ((0, 0, 0), (0, 1, 1), (0, 1, 0)),
+    ((1, 0, 0), (1, 1, 0), (1, 1, 1)), ((1, 0, 0), (1, 1, 1), (1, 0, 1)),
+]
+
+
+def write_binary_stl(app_module, path, vertices):
+    records = np.zeros(len(vertices), dtype=app_module.STL_RECORD_DTYPE)
+    records['vertices'] = np.asarray(vertices, dtype=np.float32)
+    with open(path, "wb") as f:
+        f.write(b"\0" * 80)
+        f.write(np.uint32(len(vertices)).tobytes())
+        f.write(records.tobytes())
+
+
+def write_ascii_stl(path, vertices):
+    lines = ["solid cube"]
+    for triangle in vertices:
+        lines += ["facet normal 0 0 0", "outer loop"]
+        lines += [f"vertex {x} {y} {z}" for x, y, z in triangle]
+        lines += ["endloop", "endfacet"]
+    lines.append("endsolid cube")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def cube(size):
+    return np.asarray(CUBE_FACES, dtype=np.float64) * size
+
+
+def assert_same_geometry(expected, actual):
+    assert expected['triangle_count'] == actual['triangle_count']
+    assert np.allclose(expected['dimensions_mm'], actual['dimensions_mm'])
+    for key in ('volume_mm3', 'surface_area_mm2', 'bounding_box_volume_mm3'):
+        assert np.isclose(expected[key], actual[key], rtol=1e-9), key
+
+
+@pytest.mark.parametrize("chunk_triangles", [64, 1 << 16])
+def test_vectorized_matches_legacy(app_module, tmp_path, chunk_triangles):
+    rng = np.random.default_rng(7)
+    path = str(tmp_path / "random.stl")
+    write_binary_stl(app_module, path, rng.uniform(-50.0, 50.0, size=(5000, 3, 3)))
+    analyzer = app_module.STLAnalyzer
+    legacy = analyzer.analyze_stl_binary_streaming(path)
+    fast = analyzer.analyze_stl_binary_vectorized(path, chunk_triangles=chunk_triangles)
+    assert_same_geometry(legacy, fast)
+    assert legacy['preview'] == fast['preview']
+    assert not fast['file_integrity']['header_mismatch']
+
+
+def test_cube_geometry(app_module, tmp_path):
+    path = str(tmp_path / "cube.stl")
+    write_binary_stl(app_module, path, cube(10.0))
+    result = app_module.STLAnalyzer.analyze_model_geometry(path)
+    assert result['triangle_count'] == 12
+    assert np.allclose(result['dimensions_mm'], [10.0, 10.0, 10.0])
+    assert result['volume_mm3'] == pytest.approx(1000.0)
+    assert result['surface_area_mm2'] == pytest.approx(600.0)
+
+
+def test_ascii_matches_binary(app_module, tmp_path):
+    binary_path, ascii_path = str(tmp_path / "cube.stl"), str(tmp_path / "cube_ascii.stl")
+    write_binary_stl(app_module, binary_path, cube(25.0))
+    write_ascii_stl(ascii_path, cube(25.0))
+    analyzer = app_module.STLAnalyzer
+    assert_same_geometry(analyzer.analyze_model_geometry(binary_path),
+                         analyzer.analyze_stl_ascii_streaming(ascii_path, block_bytes=97))
+
+
+def nested_arrays(value, path="analysis"):
+    if isinstance(value, dict):
+        return [hit for key, item in value.items() for hit in nested_arrays(item, f"{path}.{key}")]
+    if isinstance(value, (list, tuple)):
+        return [path] if any(isinstance(item, (list, tuple)) for item in value) else []
+    return []
+
+
+def test_stored_analysis_has_no_nested_arrays(app_module, tmp_path):
+    # Ürün/önbellek belgelerine yazılan analiz, upload route'undaki gibi kurulur; Firestore iç içe diziyi reddeder
+    path = str(tmp_path / "cube.stl")
+    angle = np.radians(30.0)
+    turn = np.array([[np.cos(angle), -np.sin(angle), 0.0], [np.sin(angle), np.cos(angle), 0.0], [0.0, 0.0, 1.0]])
+    write_binary_stl(app_module, path, cube(10.0) @ turn)
+    geometry, print_props = app_module._analyze_stl_job(path)
+    bbox_min = np.asarray(geometry['bounding_box_min_mm'])
+    extras = app_module._mesh_postprocess_job(path, bbox_min.tolist(), (bbox_min + geometry['dimensions_mm']).tolist(),
+                                              {"orientation_candidates": geometry['orientation_candidates']})
+    analysis = {k: v for k, v in geometry.items() if k not in ('preview', 'orientation_candidates')}
+    analysis.update(print_props, mesh_health=extras['mesh_health'], layer_profile=extras['layer_profile'],
+                    **extras['oriented_bounds'])
+    assert nested_arrays(analysis) == []
+    assert np.allclose(analysis['oriented_extents_mm'], [10.0, 10.0, 10.0], atol=1e-2)
+    rotation = np.reshape(analysis['oriented_rotation'], (3, 3))
+    assert np.allclose(rotation @ rotation.T, np.eye(3))
@@ -0,0 +1,145 @@
+import datetime
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+
+PROJECT = "test-project"
+
+
+def key_pair():
+    # Firebase'in yayınladığı biçimde: kid -> self-signed X.509 PEM
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(datetime.datetime(2020, 1, 1))
+            .not_valid_after(datetime.datetime(2040, 1, 1)).sign(key, hashes.SHA256()))
+    private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption()).decode()
+    return private_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return {"k1": key_pair(), "k2": key_pair()}
+
+
+def token(keys, kid, **claims):
+    now = int(time.time())
+    payload = {"iss": f"https://securetoken.google.com/{PROJECT}", "aud": PROJECT, "sub": "u1",
+               "iat": now, "exp": now + 3600, "auth_time": now, **claims}
+    return jwt.encode(crypt.RSASigner.from_string(keys[kid][0], key_id=kid), payload).decode()
+
+
+class CertEndpoint:
+    def __init__(self, certs=None):
+        self.certs = certs or {}
+        self.calls = 0
+        self.down = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("certs endpoint unreachable")
+        return dict(self.certs), 3600
+
+
+@pytest.fixture
+def endpoint(keys):
+    return CertEndpoint({"k1": keys["k1"][1]})
+
+
+@pytest.fixture
+def verifier(app_module, endpoint, tmp_path):
+    return app_module.FirebaseTokenVerifier(PROJECT, "unused", snapshot_path=str(tmp_path / "certs.json"),
+                                            fetch=endpoint)
+
+
+def test_valid_token(verifier, keys, endpoint):
+    assert verifier.verify(token(keys, "k1"))["uid"] == "u1"
+    assert verifier.verify(token(keys, "k1", sub="u2"))["uid"] == "u2"
+    assert endpoint.calls == 1
+
+
+@pytest.mark.parametrize("claims", [
+    {"exp": int(time.time()) - 600, "iat": int(time.time()) - 4200},
+    {"aud": "other-project"},
+    {"iss": "https://securetoken.google.com/other-project"},
+    {"sub": ""},
+])
+def test_rejected_claims(verifier, keys, claims):
+    with pytest.raises(ValueError):
+        verifier.verify(token(keys, "k1", **claims))
+    assert verifier.stats()["rejected"] == 1
+
+
+def test_wrong_signing_key(verifier, keys):
+    forged = jwt.encode(crypt.RSASigner.from_string(keys["k2"][0], key_id="k1"),
+                        {"iss": f"https://securetoken.google.com/{PROJECT}", "aud": PROJECT, "sub": "u1",
+                         "iat": int(time.time()), "exp": int(time.time()) + 3600}).decode()
+    with pytest.raises(ValueError):
+        verifier.verify(forged)
+
+
+def test_kid_rotation_is_rate_limited(verifier, keys, endpoint, monkeypatch):
+    verifier.verify(token(keys, "k1"))
+    endpoint.certs["k2"] = keys["k2"][1]
+    # Son denemeden bu yana MIN_FORCED_REFRESH_INTERVAL geçmedi: yeni kid için uç tekrar çağrılmaz
+    with pytest.raises(ValueError, match="Unknown signing key"):
+        verifier.verify(token(keys, "k2"))
+    assert endpoint.calls == 1
+    monkeypatch.setattr(verifier, "_last_attempt", time.time() - verifier.MIN_FORCED_REFRESH_INTERVAL)
+    assert verifier.verify(token(keys, "k2"))["uid"] == "u1"
+    assert endpoint.calls == 2
+
+
+def test_expired_certs_refresh_in_background(verifier, keys, endpoint):
+    verifier.verify(token(keys, "k1"))
+    verifier._expires_at = time.time() - 1
+    verifier._last_attempt = 0.0
+    endpoint.down = True
+    assert verifier.verify(token(keys, "k1"))["uid"] == "u1"  # eski sertifika ile devam
+    deadline = time.time() + 5
+    while endpoint.calls < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert endpoint.calls == 2
+
+
+def test_empty_cache_fails_fast_and_rate_limited(app_module, verifier, keys, endpoint):
+    endpoint.down = True
+    for _ in range(5):
+        with pytest.raises(app_module.SigningKeysUnavailable):
+            verifier.verify(token(keys, "k1"))
+    assert endpoint.calls == 1
+    assert verifier.stats()["rejected"] == 0
+
+
+def test_snapshot_survives_restart(app_module, verifier, keys, endpoint, tmp_path):
+    verifier.verify(token(keys, "k1"))
+    endpoint.down = True
+    restarted = app_module.FirebaseTokenVerifier(PROJECT, "unused", snapshot_path=str(tmp_path / "certs.json"),
+                                                 fetch=endpoint)
+    assert restarted.verify(token(keys, "k1"))["uid"] == "u1"
+    assert endpoint.calls == 1
+
+
+def test_auth_returns_503_without_signing_keys(make_app, keys, tmp_path):
+    app = make_app(TOKEN_VERIFIER="local", FIREBASE_PROJECT_ID=PROJECT, FIREBASE_CERTS_URL="http://127.0.0.1:9/certs",
+                   FIREBASE_CERTS_SNAPSHOT=str(tmp_path / "certs.json"),
+                   POOL_INDEX_ENABLED=False, PRODUCER_INDEX_ENABLED=False, ANALYTICS_ENABLED=False)
+    endpoint = CertEndpoint()
+    endpoint.down = True
+    app.token_verifier._fetch = endpoint
+    app.token_verifier._last_attempt = time.time()
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token(keys, 'k1')}"}
+    assert client.get("/api/orders/o1", headers=headers).status_code == 503
+    assert endpoint.calls == 0
+    endpoint.down = False
+    endpoint.certs = {"k1": keys["k1"][1]}
+    app.token_verifier._last_attempt = 0.0
+    assert client.get("/api/orders/o1", headers=headers).status_code == 404